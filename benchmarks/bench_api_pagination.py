@@ -0,0 +1,114 @@
+"""
+Keyset vs. offset paging, and streamed vs. materialized JSON for the search API.
+
+Builds a synthetic catalog where every song matches the query, then:
+
+- fetches a page at increasing depths with OFFSET (what PageNumberPagination
+  does) and with SongCursorPagination's keyset;
+- renders pages of --page-size rows through /api/search/?cursor=... with
+  StreamingJSONRenderer, against serializing the same page as one list and
+  rendering it with JSONRenderer, reporting time to first byte, total time
+  and peak Python allocations (tracemalloc).
+
+    python benchmarks/bench_api_pagination.py --songs 1000000 --page-size 1000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def consume(func):
+    """(ms to the first chunk, total ms) of consuming func()'s chunks"""
+    started = time.perf_counter()
+    first = None
+    for _chunk in func():
+        if first is None:
+            first = time.perf_counter()
+    return (first - started) * 1000, (time.perf_counter() - started) * 1000
+
+
+def measure(func, runs=5):
+    """Best of `runs` timings of consume(func), and its peak Python allocations in KiB"""
+    first_byte, total = min(consume(func) for _ in range(runs))
+    tracemalloc.start()
+    consume(func)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'first_byte_ms': round(first_byte, 2), 'total_ms': round(total, 2), 'peak_kib': round(peak / 1024)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=1000000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--depths', default='0,10000,100000,500000,900000', help='Rows skipped before the page')
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client, RequestFactory
+    from rest_framework.renderers import JSONRenderer
+    from recommender.models import Song
+    from recommender.pagination import SongCursorPagination
+    from recommender.renderers import StreamingJSONRenderer
+    from recommender.serializers import SongSerializer
+
+    settings.ALLOWED_HOSTS = ['*']
+    settings.FREE_USAGE_LIMIT = 10 ** 9
+    query = 'song'
+    matching = Song.objects.filter(title__icontains=query)
+    report = {'songs': args.songs, 'page_size': args.page_size, 'depth': []}
+    with temporary_database():
+        insert_songs(0, args.songs)
+        ids = list(Song.objects.order_by('id').values_list('id', flat=True))
+
+        for depth in (int(d) for d in args.depths.split(',')):
+            if depth >= len(ids):
+                continue
+            after = ids[depth - 1] if depth else 0
+            keyset = matching.filter(id__gt=after).order_by('id')[:20]
+            offset = matching.order_by('id')[depth:depth + 20]
+            report['depth'].append({
+                'depth': depth,
+                'offset': summarize(time_calls(lambda: list(offset.all()), args.iterations)),
+                'keyset': summarize(time_calls(lambda: list(keyset.all()), args.iterations)),
+            })
+
+        factory = RequestFactory()
+        request = factory.get('/api/search/', {'q': query, 'page_size': args.page_size, 'cursor': ''})
+
+        def materialized():
+            # The page read and serialized as a whole, then rendered in one go
+            paginator = SongCursorPagination(request)
+            songs = list(paginator.rows(matching))
+            yield JSONRenderer().render({'query': query, 'results': SongSerializer(songs, many=True).data,
+                                         'next': paginator.get_next_link()})
+
+        def streamed():
+            paginator = SongCursorPagination(request)
+            serializer = SongSerializer()
+            return StreamingJSONRenderer().stream({
+                'query': query,
+                'results': map(serializer.to_representation, paginator.rows(matching)),
+                'next': paginator.get_next_link,
+            })
+
+        report['page'] = {'materialized': measure(materialized), 'streamed': measure(streamed)}
+        assert json.loads(b''.join(streamed())) == json.loads(b''.join(materialized()))
+
+        # And through the view, end to end
+        client = Client()
+        client.force_login(User.objects.create_user(username='bench'))
+        url = f'/api/search/?q={query}&page_size={args.page_size}&cursor='
+        report['page']['view_streamed'] = measure(lambda: client.get(url).streaming_content)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
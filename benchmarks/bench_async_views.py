@@ -0,0 +1,110 @@
+"""
+Requests/sec of the Deezer-backed API views under WSGI vs. ASGI.
+
+Starts a slow local Deezer stand-in, then serves the app first with gunicorn
+(sync workers, song_recommender.wsgi) and then with uvicorn
+(song_recommender.asgi, async views) on the same scratch database, and
+drives /api/recommend/ and /api/search/ at a fixed concurrency.
+
+    python benchmarks/bench_async_views.py --latency-ms 200 --concurrency 64
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from common import (
+    setup_django, prepare_app_database, app_server, free_port, make_session_cookie,
+    drive_load, summarize,
+)
+from fake_deezer import start_fake_deezer, make_track
+
+
+def seed(song_count):
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+    from recommender.models import Song, Subscription
+
+    songs = []
+    for track_id in range(song_count):
+        track = make_track(track_id)
+        songs.append(Song(
+            deezer_id=str(track['id']), title=track['title'], artist=track['artist']['name'],
+            album=track['album']['title'], link=track['link'], preview=track['preview'],
+            cover=track['album']['cover_medium'], sentiment=0.0,
+        ))
+    Song.objects.bulk_create(songs, ignore_conflicts=True)
+
+    user, _ = User.objects.get_or_create(username='bench')
+    Subscription.objects.create(
+        user=user, plan_type='yearly', active=True,
+        start_date=timezone.now(), end_date=timezone.now() + timedelta(days=365),
+    )
+    return make_session_cookie(user)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=200, help='Fake Deezer latency per call')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=15, help='Seconds per server kind')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--songs', type=int, default=500)
+    args = parser.parse_args()
+
+    fake = start_fake_deezer(latency=args.latency_ms / 1000)
+    tmpdir = tempfile.mkdtemp(prefix='songrec-bench-')
+    db_path = Path(tmpdir) / 'bench.sqlite3'
+    env = {
+        'SQLITE_PATH': str(db_path),
+        'DEEZER_API_URL': fake.url,
+        'DEEZER_CACHE_BACKEND': 'none',  # every request must reach the stand-in
+        'DEBUG': 'False',
+    }
+    prepare_app_database(db_path, env)
+    os.environ.update(env)
+    setup_django()
+    session_key = seed(args.songs)
+
+    def make_request(session):
+        session.cookies.set('sessionid', session_key)
+        if random.random() < 0.5:
+            song_id = random.randrange(args.songs)
+            return 'api_recommend', session.get(f'{base_url}/api/recommend/{song_id}/', timeout=60)
+        return 'api_search', session.get(f'{base_url}/api/search/', params={'q': f'query {random.randrange(1000)}'}, timeout=60)
+
+    report = {'deezer_latency_ms': args.latency_ms, 'concurrency': args.concurrency, 'workers': args.workers}
+    try:
+        for kind in ('wsgi', 'asgi'):
+            port = free_port()
+            server_env = {**env, 'ASYNC_VIEWS': 'True' if kind == 'asgi' else 'False'}
+            with app_server(kind, port, server_env, workers=args.workers) as url:
+                base_url = url
+                drive_load(make_request, min(args.concurrency, 8), 2)  # warm up
+                results, elapsed = drive_load(make_request, args.concurrency, args.duration)
+
+            total = sum(len(r['latencies']) for r in results.values())
+            report[kind] = {
+                'rps': round(total / elapsed, 1),
+                'endpoints': {
+                    label: {**summarize(r['latencies']), 'errors': r['errors']}
+                    for label, r in results.items()
+                },
+            }
+            print(json.dumps({kind: report[kind]}))
+    finally:
+        fake.shutdown()
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    if report.get('wsgi', {}).get('rps'):
+        report['asgi_speedup'] = round(report['asgi']['rps'] / report['wsgi']['rps'], 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Mood recommendations from the memory-mapped catalog snapshot vs. the database.
+
+Builds a synthetic catalog, exports it with write_snapshot, and times
+get_mood_based_recommendations with the snapshot off (mood pools plus an
+id__in fetch) and on (no queries). Then maps the snapshot once, forks
+--workers processes the way `gunicorn --preload` does, has each one read the
+whole snapshot, and reports the mapping's resident (RSS) and proportional
+(PSS) size per worker from /proc/<pid>/smaps: with the pages shared, PSS is
+RSS divided by the number of processes mapping it.
+
+    python benchmarks/bench_catalog_snapshot.py --songs 1000000 --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+import zlib
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def mapping_memory(path):
+    """RSS and PSS in KiB of this process's mappings of `path` (Linux only)"""
+    rss = pss = 0
+    inside = False
+    with open('/proc/self/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if '-' in fields[0] and len(fields) >= 5:
+                inside = fields[-1] == path
+            elif inside and fields[0] == 'Rss:':
+                rss += int(fields[1])
+            elif inside and fields[0] == 'Pss:':
+                pss += int(fields[1])
+    return {'rss_kib': rss, 'pss_kib': pss}
+
+
+def touch_and_measure(snapshot, barrier, results):
+    """Worker: read every page of the snapshot, wait for the others, then measure"""
+    started = time.perf_counter()
+    for column in (snapshot.ids, snapshot.sentiment, snapshot.artist_ids, snapshot.by_sentiment,
+                   snapshot.sorted_sentiment, snapshot.string_offsets):
+        column.sum()
+    zlib.crc32(memoryview(snapshot._map)[snapshot._strings_offset:])
+    touched_ms = (time.perf_counter() - started) * 1000
+    barrier.wait()
+    results.put({**mapping_memory(snapshot.path), 'touch_ms': round(touched_ms, 1)})
+    barrier.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from recommender.catalog_snapshot import CatalogSnapshot, catalog_snapshot, write_snapshot
+    from recommender.utils import MOOD_SENTIMENT_MAP, get_mood_based_recommendations, mood_pools
+
+    tmpdir = tempfile.mkdtemp(prefix='songrec-snapshot-')
+    path = os.path.join(tmpdir, 'catalog.snapshot')
+    moods = list(MOOD_SENTIMENT_MAP)
+    report = {'songs': args.songs, 'workers': args.workers}
+    try:
+        with temporary_database():
+            insert_songs(0, args.songs)
+
+            started = time.perf_counter()
+            write_snapshot(path)
+            report['export'] = {
+                'seconds': round(time.perf_counter() - started, 2),
+                'mb': round(os.path.getsize(path) / 2 ** 20, 1),
+            }
+
+            settings.MOOD_POOL_REFRESH_SECONDS = 3600
+            mood_pools.reset()
+            get_mood_based_recommendations('happy')
+            report['mood_recommendations_db'] = summarize(
+                time_calls(lambda: get_mood_based_recommendations(random.choice(moods)), args.iterations)
+            )
+
+            settings.CATALOG_SNAPSHOT = {'ENABLED': True, 'PATH': path, 'CHECK_SECONDS': 30}
+            catalog_snapshot.reset()
+            started = time.perf_counter()
+            catalog_snapshot.get()
+            report['snapshot_open_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            report['mood_recommendations_snapshot'] = summarize(
+                time_calls(lambda: get_mood_based_recommendations(random.choice(moods)), args.iterations)
+            )
+            catalog_snapshot.reset()
+
+        # Mapped before the fork, as with --preload
+        snapshot = CatalogSnapshot(path)
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(args.workers)
+        results = context.Queue()
+        workers = [
+            context.Process(target=touch_and_measure, args=(snapshot, barrier, results))
+            for _ in range(args.workers)
+        ]
+        for worker in workers:
+            worker.start()
+        measured = [results.get() for _ in workers]
+        for worker in workers:
+            worker.join()
+        report['per_worker_mapping'] = measured
+        report['total_rss_mb'] = round(sum(m['rss_kib'] for m in measured) / 1024, 1)
+        report['total_pss_mb'] = round(sum(m['pss_kib'] for m in measured) / 1024, 1)
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Conditional GETs on the song API: full 200 responses vs. 304 Not Modified.
+
+Builds a synthetic catalog with its neighbor table (so recommendations come
+from the database, not Deezer), then times /api/song/<id>/ and
+/api/recommend/<id>/ for random popular songs: first plain, then sending
+back the ETag each returned, as a browser or a revalidating cache would.
+
+    python benchmarks/bench_conditional_get.py --songs 20000
+"""
+import argparse
+import json
+import random
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--popular', type=int, default=100, help='Distinct songs requested')
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from recommender.models import Song
+    from recommender.neighbors import compute_neighbors
+
+    settings.ALLOWED_HOSTS = ['*']
+    client = Client(HTTP_ACCEPT='application/json')
+    report = {'songs': args.songs}
+    with temporary_database():
+        insert_songs(0, args.songs)
+        compute_neighbors(k=10, memory_mb=256, full=True)
+        popular = list(Song.objects.order_by('?').values_list('deezer_id', flat=True)[:args.popular])
+
+        for name, path in (('song_detail', '/api/song/{}/'), ('recommend', '/api/recommend/{}/')):
+            etags = {deezer_id: client.get(path.format(deezer_id))['ETag'] for deezer_id in popular}
+
+            def fetch(conditional, expected):
+                deezer_id = random.choice(popular)
+                headers = {'HTTP_IF_NONE_MATCH': etags[deezer_id]} if conditional else {}
+                response = client.get(path.format(deezer_id), **headers)
+                assert response.status_code == expected, response.status_code
+                return len(response.content)
+
+            report[name] = {
+                'full': summarize(time_calls(lambda: fetch(False, 200), args.iterations)),
+                'not_modified': summarize(time_calls(lambda: fetch(True, 304), args.iterations)),
+                'body_bytes': fetch(False, 200),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
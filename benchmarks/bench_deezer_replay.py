@@ -0,0 +1,123 @@
+"""
+Deezer-backed code paths recorded once, then replayed from the tape.
+
+Records a fixed workload (search_songs, get_song_recommendations and the
+seed_songs command) against the local Deezer stand-in into a scratch tape,
+stops the stand-in, and runs the same workload again in replay mode. Reports
+per-call latency in both modes, the tape's size and load time, and whether
+replay returned exactly what was recorded.
+
+    python benchmarks/bench_deezer_replay.py --latency-ms 100 --queries 200
+
+To replay against real Deezer data, record with the app itself instead:
+
+    DEEZER_TAPE_MODE=record python manage.py seed_songs --q rock --limit 100
+    DEEZER_TAPE_MODE=replay python manage.py seed_songs --q rock --limit 100
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+from common import setup_django, temporary_database, time_calls, summarize
+from fake_deezer import start_fake_deezer
+
+
+def run_workload(queries, song_ids):
+    """Run every call once; returns (results to compare, per-kind latencies in ms)"""
+    from django.core.management import call_command
+    from recommender.models import Song
+    from recommender.utils import DeezerAPI, get_song_recommendations
+
+    results = {'search': [], 'recommendations': []}
+    latencies = {}
+
+    def timed(kind, func):
+        started = time.perf_counter()
+        value = func()
+        latencies.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+        return value
+
+    for query in queries:
+        tracks = timed('search_songs', lambda: DeezerAPI.search_songs(query))
+        results['search'].append([track['id'] for track in tracks])
+    for song_id in song_ids:
+        song = Song.objects.get(deezer_id=song_id)
+        songs = timed('get_song_recommendations', lambda: get_song_recommendations(song))
+        results['recommendations'].append([s.deezer_id for s in songs])
+    for query in queries[:10]:
+        timed('seed_songs', lambda: call_command('seed_songs', q=query, limit=25, stdout=io.StringIO()))
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--latency-ms', type=float, default=100, help='Stand-in latency while recording')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--songs', type=int, default=50, help='Songs to get recommendations for')
+    args = parser.parse_args()
+
+    fake = start_fake_deezer(latency=args.latency_ms / 1000)
+    os.environ['DEEZER_API_URL'] = fake.url
+    setup_django()
+    from django.conf import settings
+    from recommender.deezer_tape import TapeReader, deezer_tape
+    from recommender.utils import DeezerAPI, deezer_cache, ingest_deezer_tracks
+
+    tmpdir = tempfile.mkdtemp(prefix='songrec-tape-')
+    tape_path = os.path.join(tmpdir, 'deezer.tape')
+    # Every call must reach the stand-in (or the tape), not the response cache
+    settings.DEEZER_CACHE = {'BACKEND': 'none'}
+    deezer_cache.reset()
+
+    rng = random.Random(0)
+    queries = [f'query {rng.randrange(10 ** 6)}' for _ in range(args.queries)]
+    report = {'deezer_latency_ms': args.latency_ms, 'queries': args.queries, 'songs': args.songs}
+
+    try:
+        with temporary_database():
+            seed_tracks = DeezerAPI.search_songs('seed', limit=args.songs)
+            song_ids = [song.deezer_id for song in ingest_deezer_tracks(seed_tracks)]
+
+            settings.DEEZER_TAPE = {'MODE': 'record', 'PATH': tape_path}
+            deezer_tape.reset()
+            recorded, record_latencies = run_workload(queries, song_ids)
+            deezer_tape.reset()
+            # Replay must not need the network
+            fake.shutdown()
+            fake.server_close()
+
+            started = time.perf_counter()
+            reader = TapeReader(tape_path)
+            report['tape'] = {
+                'records': len(reader),
+                'bytes': os.path.getsize(tape_path),
+                'open_ms': round((time.perf_counter() - started) * 1000, 2),
+            }
+            reader.close()
+
+            settings.DEEZER_TAPE = {'MODE': 'replay', 'PATH': tape_path}
+            deezer_tape.reset()
+            replayed, replay_latencies = run_workload(queries, song_ids)
+            report['replay_matches_recording'] = recorded == replayed
+            report['replay_search_songs_hot'] = summarize(
+                time_calls(lambda: DeezerAPI.search_songs(rng.choice(queries)), 2000)
+            )
+            deezer_tape.reset()
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    report['calls'] = {
+        kind: {'record': summarize(record_latencies[kind]), 'replay': summarize(replay_latencies[kind])}
+        for kind in record_latencies
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
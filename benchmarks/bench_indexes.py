@@ -0,0 +1,157 @@
+"""
+Hot lookups with and without the indexes added in migration 0011.
+
+Builds a synthetic catalog plus users, profiles, subscriptions and purchases,
+times each hot lookup (subscription status, Stripe webhook lookups, email
+verification, the Song default ordering, the mood pools' watermark scan) with
+the migration's indexes, then drops them and times the same lookups again.
+The query plan is reported for both runs.
+
+    python benchmarks/bench_indexes.py
+    python benchmarks/bench_indexes.py --songs 100000 --users 10000 --iterations 100
+"""
+import argparse
+import importlib
+import json
+import random
+import uuid
+from datetime import timedelta
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+INDEX_MIGRATION = 'recommender.migrations.0011_hot_lookup_indexes'
+
+
+def insert_accounts(users, batch_size=5000):
+    """
+    `users` users with a profile, one subscription each (a third of them
+    active) and one purchase. Returns the order ids, payment intent ids and
+    verification tokens to look up.
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from django.utils import timezone
+    from recommender.models import Purchase, Subscription, UserProfile
+
+    now = timezone.now()
+    rng = random.Random(0)
+    lookups = {'order_ids': [], 'payment_intents': [], 'tokens': []}
+
+    for start in range(0, users, batch_size):
+        numbers = range(start, min(users, start + batch_size))
+        with transaction.atomic():
+            created = User.objects.bulk_create([
+                User(username=f'user{i}', email=f'user{i}@example.com', password='!') for i in numbers
+            ])
+            profiles, subscriptions, purchases = [], [], []
+            for user in created:
+                token = uuid.UUID(int=rng.getrandbits(128))
+                order_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                payment_intent = f'pi_{rng.getrandbits(64):016x}'
+                active = rng.random() < 1 / 3
+                end = now + timedelta(days=rng.randint(-365, 365))
+                profiles.append(UserProfile(user=user, verification_token=token))
+                subscriptions.append(Subscription(
+                    user=user, plan_type='monthly', active=active, start_date=end - timedelta(days=30),
+                    end_date=end, order_id=order_id, stripe_payment_intent_id=payment_intent,
+                ))
+                purchases.append(Purchase(
+                    user=user, plan_type='monthly', amount=20, status='completed' if active else 'pending',
+                    order_id=order_id, stripe_payment_intent_id=payment_intent,
+                ))
+                lookups['order_ids'].append(order_id)
+                lookups['payment_intents'].append(payment_intent)
+                lookups['tokens'].append(token)
+            UserProfile.objects.bulk_create(profiles)
+            Subscription.objects.bulk_create(subscriptions)
+            Purchase.objects.bulk_create(purchases)
+
+    lookups['user_ids'] = list(User.objects.values_list('id', flat=True))
+    return lookups
+
+
+def hot_lookups(lookups):
+    """name -> function building the lookup's queryset with fresh parameters"""
+    from django.db.models import Max
+    from django.utils import timezone
+    from recommender.models import Purchase, Song, Subscription, UserProfile
+
+    after_last_change = timezone.now() + timedelta(seconds=1)
+    return {
+        'premium_until_for': lambda: Subscription.objects.filter(
+            user_id=random.choice(lookups['user_ids']), active=True
+        ).values('user_id').annotate(premium_until=Max('end_date')),
+        'checkout_success': lambda: Subscription.objects.filter(
+            user_id=random.choice(lookups['user_ids']), active=True
+        ).order_by('-created_at')[:1],
+        'webhook_purchase_by_order': lambda: Purchase.objects.filter(order_id=random.choice(lookups['order_ids'])),
+        'webhook_subscription_by_order': lambda: Subscription.objects.filter(
+            order_id=random.choice(lookups['order_ids'])
+        ),
+        'webhook_purchase_by_intent': lambda: Purchase.objects.filter(
+            stripe_payment_intent_id=random.choice(lookups['payment_intents'])
+        ),
+        'verify_email': lambda: UserProfile.objects.filter(verification_token=random.choice(lookups['tokens'])),
+        'song_default_ordering': lambda: Song.objects.all()[:50],
+        'mood_pools_refresh': lambda: Song.objects.filter(
+            updated_at__gte=after_last_change
+        ).order_by('updated_at').values_list('id', 'sentiment', 'updated_at'),
+    }
+
+
+def run(queries, iterations):
+    results = {}
+    for name, make in queries.items():
+        results[name] = {
+            'plan': make().explain(),
+            'latency': summarize(time_calls(lambda: list(make()), iterations)),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Calls per lookup with the indexes (default: 200)')
+    parser.add_argument('--baseline-iterations', type=int, default=20,
+                        help='Calls per lookup without them, where most are full scans (default: 20)')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.apps import apps
+
+    with temporary_database() as connection:
+        insert_songs(0, args.songs)
+        lookups = insert_accounts(args.users)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        queries = hot_lookups(lookups)
+
+        indexed = run(queries, args.iterations)
+
+        migration = importlib.import_module(INDEX_MIGRATION).Migration
+        with connection.schema_editor() as editor:
+            for operation in migration.operations:
+                editor.remove_index(apps.get_model('recommender', operation.model_name), operation.index)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        unindexed = run(queries, args.baseline_iterations)
+
+    report = {'songs': args.songs, 'users': args.users, 'lookups': {}}
+    for name in queries:
+        before, after = unindexed[name], indexed[name]
+        report['lookups'][name] = {
+            'without_indexes': before['latency'],
+            'with_indexes': after['latency'],
+            'p50_speedup': round(before['latency']['p50_ms'] / max(after['latency']['p50_ms'], 1e-6), 1),
+            'plan_without': before['plan'],
+            'plan_with': after['plan'],
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
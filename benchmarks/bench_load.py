@@ -0,0 +1,233 @@
+"""
+End-to-end load test: mixed user traffic against the app under gunicorn.
+
+Starts the local Deezer stand-in (with the given latency and error rate),
+serves the app with gunicorn on a scratch database seeded with songs and
+logged-in subscribers, then starts requests at a fixed rate, whatever the
+response times, mixing logins, mood posts, recommendations, search, song
+pages and the API. Reports p50/p95/p99, requests/sec and error rate per
+endpoint as JSON; --output also writes it to a file, for tracking trends
+across commits.
+
+    python benchmarks/bench_load.py --rate 50 --duration 60
+    python benchmarks/bench_load.py --deezer-latency-ms 150 --deezer-error-rate 0.02 --output load.json
+    python benchmarks/bench_load.py --mix recommendations=5,api_search=1
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from common import (
+    BASE_DIR, setup_django, prepare_app_database, app_server, free_port, make_session_cookie,
+    drive_rate, summarize,
+)
+from fake_deezer import start_fake_deezer, make_track
+
+PASSWORD = 'bench-password'
+# Any 32 character secret works; sent as both the cookie and the form field
+CSRF_TOKEN = 'loadtestloadtestloadtestloadtest'
+MOOD_TEXTS = [
+    'feeling great today', 'so sad and lonely', 'pumped for the gym', 'calm and relaxed',
+    'in love', 'really angry right now', 'missing the old days', 'ready to work hard',
+]
+
+# Share of traffic per endpoint, roughly what a browsing session looks like
+DEFAULT_MIX = {
+    'home': 10,
+    'login': 2,
+    'mood_post': 10,
+    'recommendations': 20,
+    'search': 10,
+    'song_detail': 15,
+    'api_search': 10,
+    'api_recommend': 10,
+    'api_song_detail': 13,
+}
+
+
+def seed(song_count, user_count):
+    """Songs from the stand-in's catalog, and subscribed users with a mood; returns their session keys"""
+    from django.contrib.auth.models import User
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+    from recommender.models import Song, Subscription, UserProfile
+
+    rng = random.Random(0)
+    songs = []
+    for track_id in range(song_count):
+        track = make_track(track_id)
+        songs.append(Song(
+            deezer_id=str(track['id']), title=track['title'], artist=track['artist']['name'],
+            album=track['album']['title'], link=track['link'], preview=track['preview'],
+            cover=track['album']['cover_medium'], sentiment=rng.uniform(-1, 1),
+        ))
+    Song.objects.bulk_create(songs, ignore_conflicts=True)
+
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create([User(username=f'load{i}', password=password) for i in range(user_count)])
+    moods = [mood for mood, _label in UserProfile.MOOD_CHOICES]
+    for user in users:
+        UserProfile.objects.create(user=user, current_mood=rng.choice(moods))
+        Subscription.objects.create(
+            user=user, plan_type='yearly', active=True,
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=365),
+        )
+    return [user.username for user in users], [make_session_cookie(user) for user in users]
+
+
+def make_traffic(base_url, mix, usernames, session_keys, song_count):
+    """make_request for drive_rate, picking an endpoint by weight and a random user"""
+    labels = list(mix)
+    weights = [mix[label] for label in labels]
+
+    def make_request(session):
+        import requests
+
+        label = random.choices(labels, weights)[0]
+        session.cookies.set('sessionid', random.choice(session_keys))
+        session.cookies.set('csrftoken', CSRF_TOKEN)
+        song_id = random.randrange(song_count)
+        query = f'query {random.randrange(1000)}'
+
+        if label == 'home':
+            return label, session.get(f'{base_url}/', timeout=60)
+        if label == 'login':
+            # A fresh session, so the worker's logged-in cookie is left alone
+            with requests.Session() as fresh:
+                fresh.cookies.set('csrftoken', CSRF_TOKEN)
+                return label, fresh.post(f'{base_url}/login/', data={
+                    'username': random.choice(usernames), 'password': PASSWORD,
+                    'csrfmiddlewaretoken': CSRF_TOKEN,
+                }, allow_redirects=False, timeout=60)
+        if label == 'mood_post':
+            return label, session.post(f'{base_url}/', data={
+                'mood_text': random.choice(MOOD_TEXTS), 'csrfmiddlewaretoken': CSRF_TOKEN,
+            }, allow_redirects=False, timeout=60)
+        if label == 'recommendations':
+            return label, session.get(f'{base_url}/recommendations/', allow_redirects=False, timeout=60)
+        if label == 'search':
+            return label, session.get(f'{base_url}/search/', params={'q': query}, allow_redirects=False, timeout=60)
+        if label == 'song_detail':
+            return label, session.get(f'{base_url}/song/{song_id}/', allow_redirects=False, timeout=60)
+        if label == 'api_search':
+            return label, session.get(f'{base_url}/api/search/', params={'q': query}, timeout=60)
+        if label == 'api_recommend':
+            return label, session.get(f'{base_url}/api/recommend/{song_id}/', timeout=60)
+        if label == 'api_song_detail':
+            return label, session.get(f'{base_url}/api/song/{song_id}/', timeout=60)
+        raise ValueError(f'Unknown endpoint: {label}')
+
+    return make_request
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        label, _, weight = item.partition('=')
+        if label not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'Unknown endpoint {label!r}; choose from {", ".join(DEFAULT_MIX)}')
+        mix[label] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rate', type=float, default=50, help='Requests started per second')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=5, help='Seconds of unmeasured load first')
+    parser.add_argument('--concurrency', type=int, default=64, help='Most requests in flight at once')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--songs', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='Endpoint weights, e.g. recommendations=5,api_search=1 (default: a browsing mix)')
+    parser.add_argument('--deezer-latency-ms', type=float, default=100)
+    parser.add_argument('--deezer-jitter-ms', type=float, default=50)
+    parser.add_argument('--deezer-error-rate', type=float, default=0.0)
+    parser.add_argument('--deezer-cache', default='locmem', help="DEEZER_CACHE_BACKEND for the app ('none' to disable)")
+    parser.add_argument('--output', help='Also write the report to this file')
+    args = parser.parse_args()
+
+    fake = start_fake_deezer(
+        latency=args.deezer_latency_ms / 1000, jitter=args.deezer_jitter_ms / 1000, error_rate=args.deezer_error_rate,
+    )
+    tmpdir = tempfile.mkdtemp(prefix='songrec-load-')
+    db_path = Path(tmpdir) / 'load.sqlite3'
+    env = {
+        'SQLITE_PATH': str(db_path),
+        'DEEZER_API_URL': fake.url,
+        'DEEZER_CACHE_BACKEND': args.deezer_cache,
+        'DEBUG': 'False',
+    }
+    prepare_app_database(db_path, env)
+    os.environ.update(env)
+    setup_django()
+    usernames, session_keys = seed(args.songs, args.users)
+
+    report = {
+        'started_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {
+            key: getattr(args, key) for key in (
+                'rate', 'duration', 'concurrency', 'workers', 'threads', 'songs', 'users', 'mix',
+                'deezer_latency_ms', 'deezer_jitter_ms', 'deezer_error_rate', 'deezer_cache',
+            )
+        },
+    }
+    try:
+        with app_server('wsgi', free_port(), env, workers=args.workers, threads=args.threads) as base_url:
+            make_request = make_traffic(base_url, args.mix, usernames, session_keys, args.songs)
+            if args.warmup:
+                drive_rate(make_request, args.rate, args.warmup, args.concurrency)
+            deezer_calls = fake.request_count
+            results, elapsed, late = drive_rate(make_request, args.rate, args.duration, args.concurrency)
+            deezer_calls = fake.request_count - deezer_calls
+    finally:
+        fake.shutdown()
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    total = sum(len(r['latencies']) for r in results.values())
+    errors = sum(r['errors'] for r in results.values())
+    report['totals'] = {
+        'requests': total,
+        'rps': round(total / elapsed, 1),
+        'error_rate': round(errors / total, 4) if total else 0.0,
+        'started_late': late,
+        'deezer_calls': deezer_calls,
+        **summarize([latency for r in results.values() for latency in r['latencies']]),
+    }
+    report['endpoints'] = {
+        label: {
+            **summarize(r['latencies']),
+            'rps': round(len(r['latencies']) / elapsed, 1),
+            'errors': r['errors'],
+            'error_rate': round(r['errors'] / len(r['latencies']), 4),
+        }
+        for label, r in sorted(results.items())
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Mood sampling latency vs. catalog size.
+
+Compares the old ORDER BY RANDOM() query with sample_songs_by_sentiment()
+for every mood range, growing the catalog through the requested sizes.
+The sampler's p99 should stay roughly flat while ORDER BY RANDOM() grows
+linearly with the number of matching rows.
+
+    python benchmarks/bench_mood_sampling.py
+    python benchmarks/bench_mood_sampling.py --sizes 10000,100000 --iterations 200
+"""
+import argparse
+import json
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000,5000000',
+                        help='Comma-separated catalog sizes (default: 10k..5M)')
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='Samples per mood per size (default: 200)')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--skip-baseline-above', type=int, default=1000000,
+                        help='Skip ORDER BY RANDOM() above this size, it gets very slow')
+    args = parser.parse_args()
+
+    setup_django()
+    from recommender.models import Song
+    from recommender.utils import MOOD_SENTIMENT_MAP, sample_songs_by_sentiment
+
+    sizes = sorted(int(s) for s in args.sizes.split(','))
+    report = []
+
+    with temporary_database():
+        current = 0
+        for size in sizes:
+            insert_songs(current, size - current)
+            current = size
+
+            for mood, (lo, hi) in MOOD_SENTIMENT_MAP.items():
+                row = {'size': size, 'mood': mood}
+                row['sampler'] = summarize(time_calls(
+                    lambda: sample_songs_by_sentiment(lo, hi, limit=args.limit),
+                    args.iterations,
+                ))
+                if size <= args.skip_baseline_above:
+                    row['order_by_random'] = summarize(time_calls(
+                        lambda: list(Song.objects.filter(
+                            sentiment__gte=lo, sentiment__lte=hi
+                        ).order_by('?')[:args.limit]),
+                        max(5, args.iterations // 20),
+                    ))
+                report.append(row)
+                print(json.dumps(row))
+
+    worst = {}
+    for row in report:
+        worst[row['size']] = max(worst.get(row['size'], 0), row['sampler']['p99_ms'])
+    print(json.dumps({'sampler_worst_p99_ms_by_size': worst}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
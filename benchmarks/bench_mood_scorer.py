@@ -0,0 +1,86 @@
+"""
+Soft mood matching (MoodScorer) vs. the SQL range sampler and the mood pools.
+
+For each catalog size, times a pick over the in-memory sentiment array on its
+own, then get_mood_based_recommendations end to end with MOOD_MATCHING='soft'
+(from the database, and from the catalog snapshot), against the range
+matching paths: sample_songs_by_sentiment's SQL walk and the mood pools.
+
+    python benchmarks/bench_mood_scorer.py
+    python benchmarks/bench_mood_scorer.py --sizes 100000,1000000 --limit 20
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000', help='Comma-separated catalog sizes')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from recommender.catalog_snapshot import catalog_snapshot, write_snapshot
+    from recommender.utils import (
+        MOOD_SENTIMENT_MAP, get_mood_based_recommendations, mood_pools, mood_scorer, sample_songs_by_sentiment,
+    )
+
+    moods = list(MOOD_SENTIMENT_MAP)
+    settings.MOOD_POOL_REFRESH_SECONDS = 3600
+    tmpdir = tempfile.mkdtemp(prefix='songrec-scorer-')
+    path = os.path.join(tmpdir, 'catalog.snapshot')
+    report = []
+
+    def run(func):
+        return summarize(time_calls(lambda: func(random.choice(moods)), args.iterations))
+
+    try:
+        with temporary_database():
+            current = 0
+            for size in sorted(int(s) for s in args.sizes.split(',')):
+                insert_songs(current, size - current)
+                current = size
+                row = {'size': size, 'limit': args.limit}
+
+                mood_scorer.reset()
+                mood_scorer.refresh()
+                row['soft_pick_only'] = run(lambda mood: mood_scorer.pick(mood_scorer._sentiment, mood, args.limit))
+
+                settings.MOOD_MATCHING = 'soft'
+                row['soft_db'] = run(lambda mood: get_mood_based_recommendations(mood, args.limit))
+                write_snapshot(path)
+                settings.CATALOG_SNAPSHOT = {'ENABLED': True, 'PATH': path}
+                catalog_snapshot.reset()
+                row['soft_snapshot'] = run(lambda mood: get_mood_based_recommendations(mood, args.limit))
+                settings.CATALOG_SNAPSHOT = {'ENABLED': False}
+                catalog_snapshot.reset()
+
+                settings.MOOD_MATCHING = 'range'
+                row['range_sql_sampler'] = run(lambda mood: sample_songs_by_sentiment(
+                    *MOOD_SENTIMENT_MAP[mood], limit=args.limit
+                ))
+                mood_pools.reset()
+                get_mood_based_recommendations('happy', args.limit)
+                row['range_pools'] = run(lambda mood: get_mood_based_recommendations(mood, args.limit))
+
+                report.append(row)
+                print(json.dumps(row))
+    finally:
+        for name in os.listdir(tmpdir):
+            os.remove(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    print(json.dumps({
+        row['size']: {key: row[key]['p50_ms'] for key in row if isinstance(row[key], dict)} for row in report
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
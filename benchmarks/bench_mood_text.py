@@ -0,0 +1,120 @@
+"""
+Cost of analyze_mood_text on realistic mood descriptions.
+
+Compares the keyword stage alone (the original nested substring scan vs.
+the single-pass word matcher), then the whole call cold (memo cleared before
+every call) and warm, and lists the texts where whole-word matching changes
+the detected mood. The cold numbers include the sentiment fallback, which
+more texts reach once "down" no longer matches inside "download".
+
+    python benchmarks/bench_mood_text.py --iterations 2000
+"""
+import argparse
+import json
+import time
+
+from common import setup_django
+
+MOOD_TEXTS = [
+    "I'm feeling really happy today, the sun is out",
+    'Just got dumped, feeling heartbroken and lonely',
+    'Need something to get me pumped up for the gym',
+    'Long day at work, I just want to relax and chill',
+    'Date night with my partner, feeling romantic',
+    'So annoyed with my roommate right now',
+    'Thinking about high school and the old times',
+    "Big exam tomorrow, I'm focused and determined",
+    'Kind of a grey, meh sort of afternoon',
+    'Driving through the desert at night with the windows down',
+    'I already downloaded everything, now what',
+    'Celebrating a promotion with friends tonight',
+    "Rainy Sunday morning, coffee and a good book",
+    'My dog passed away last week and I miss him',
+    'Getting ready for a run along the beach',
+    'Feeling nothing in particular, just background music please',
+    'Stuck in traffic and honestly furious',
+    'Missing my grandma, remembering her kitchen',
+    'Quiet evening, candles, a glass of wine',
+    'Road trip with the whole crew, windows open, volume up',
+]
+
+
+def legacy_match_mood_keywords(text):
+    text_lower = text.lower()
+    mood_keywords = {
+        'happy': ['happy', 'joyful', 'excited', 'great', 'wonderful', 'amazing', 'fantastic', 'cheerful', 'delighted', 'glad'],
+        'sad': ['sad', 'depressed', 'down', 'unhappy', 'miserable', 'heartbroken', 'lonely', 'blue', 'melancholy', 'upset'],
+        'energetic': ['energetic', 'pumped', 'hyped', 'active', 'energized', 'powerful', 'dynamic', 'vigorous'],
+        'calm': ['calm', 'peaceful', 'relaxed', 'chill', 'tranquil', 'serene', 'mellow', 'zen', 'quiet'],
+        'romantic': ['romantic', 'love', 'loving', 'affectionate', 'tender', 'passionate', 'in love', 'smitten'],
+        'angry': ['angry', 'mad', 'furious', 'annoyed', 'irritated', 'frustrated', 'rage', 'pissed'],
+        'nostalgic': ['nostalgic', 'reminiscing', 'memories', 'remember', 'past', 'old times', 'throwback'],
+        'motivated': ['motivated', 'determined', 'focused', 'driven', 'ambitious', 'inspired', 'ready', 'pumped up'],
+    }
+    for mood, keywords in mood_keywords.items():
+        for keyword in keywords:
+            if keyword in text_lower:
+                return mood
+    return None
+
+
+def legacy_analyze_mood_text(text, analyze_text):
+    mood = legacy_match_mood_keywords(text)
+    if mood is not None:
+        return mood
+    sentiment = analyze_text(text)
+    if sentiment > 0.5:
+        return 'happy'
+    elif sentiment > 0.3:
+        return 'calm'
+    elif sentiment > 0:
+        return 'romantic'
+    elif sentiment > -0.3:
+        return 'nostalgic'
+    elif sentiment > -0.5:
+        return 'sad'
+    else:
+        return 'angry'
+
+
+def per_call_us(func, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for text in MOOD_TEXTS:
+            func(text)
+    return round((time.perf_counter() - started) / (iterations * len(MOOD_TEXTS)) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_django()
+    from recommender.utils import SentimentAnalyzer, _detect_mood, _match_mood_keywords, analyze_mood_text
+
+    analyze_text = SentimentAnalyzer.analyze_text
+    analyze_text('warm up')
+
+    def cold(text):
+        _detect_mood.cache_clear()
+        return analyze_mood_text(text)
+
+    report = {
+        'texts': len(MOOD_TEXTS),
+        'legacy_keywords_us_per_call': per_call_us(legacy_match_mood_keywords, args.iterations),
+        'compiled_keywords_us_per_call': per_call_us(lambda text: _match_mood_keywords(text.lower()), args.iterations),
+        'legacy_us_per_call': per_call_us(lambda text: legacy_analyze_mood_text(text, analyze_text), args.iterations),
+        'compiled_cold_us_per_call': per_call_us(cold, args.iterations),
+        'compiled_warm_us_per_call': per_call_us(analyze_mood_text, args.iterations),
+        'changed_by_word_boundaries': {
+            text: [legacy_analyze_mood_text(text, analyze_text), analyze_mood_text(text)]
+            for text in MOOD_TEXTS
+            if legacy_analyze_mood_text(text, analyze_text) != analyze_mood_text(text)
+        },
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+compute_song_neighbors: full and incremental runs, memory, and reads.
+
+Builds a synthetic catalog, computes every song's neighbors from scratch
+within --memory-mb (tracing NumPy's peak allocations against it), changes
+--changed songs and runs again incrementally, then times
+get_song_recommendations served from the neighbor table. Each song is only
+scored against a bounded set of candidates, so the full run's time grows
+linearly and is also extrapolated to 1M songs.
+
+    python benchmarks/bench_neighbors.py --songs 50000
+    python benchmarks/bench_neighbors.py --songs 1000000 --memory-mb 512 --changed 500
+"""
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def timed_run(**kwargs):
+    from recommender.neighbors import compute_neighbors
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    stats = compute_neighbors(**kwargs)
+    seconds = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {**stats, 'seconds': round(seconds, 2), 'peak_mb': round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=50000)
+    parser.add_argument('--neighbors', type=int, default=10)
+    parser.add_argument('--memory-mb', type=int, default=512)
+    parser.add_argument('--changed', type=int, default=100, help='Songs to edit before the incremental run')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db.models import F
+    from django.utils import timezone
+    from recommender.models import Song
+    from recommender.utils import get_song_recommendations
+
+    report = {'songs': args.songs, 'neighbors': args.neighbors, 'memory_mb': args.memory_mb}
+    with temporary_database():
+        insert_songs(0, args.songs)
+
+        full = report['full_run'] = timed_run(k=args.neighbors, memory_mb=args.memory_mb, full=True)
+        report['full_run']['estimated_seconds_at_1m_songs'] = round(full['seconds'] * 10 ** 6 / args.songs)
+
+        rng = random.Random(0)
+        ids = rng.sample(list(Song.objects.values_list('id', flat=True)), args.changed)
+        # QuerySet.update() leaves auto_now alone, so set updated_at too
+        Song.objects.filter(id__in=ids).update(sentiment=-F('sentiment'), updated_at=timezone.now())
+        report['incremental_run'] = timed_run(k=args.neighbors, memory_mb=args.memory_mb)
+
+        songs = list(Song.objects.order_by('?')[:200])
+        report['get_song_recommendations'] = summarize(
+            time_calls(lambda: get_song_recommendations(rng.choice(songs)), 2000)
+        )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
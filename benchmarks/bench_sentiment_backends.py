@@ -0,0 +1,79 @@
+"""
+Agreement and throughput of the 'lexicon' sentiment backend vs. TextBlob.
+
+Scores every "title artist" text of the catalog with both backends and
+reports how often they agree, per-text cost, and the cold-start cost of each
+(TextBlob's import plus first call vs. loading the compiled lexicon). Uses
+the songs in the configured database (e.g. after `manage.py seed_songs`)
+with --from-db, or a synthetic catalog otherwise.
+
+    python benchmarks/bench_sentiment_backends.py --from-db
+    python benchmarks/bench_sentiment_backends.py --songs 20000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+from bench_sentiment_batch import make_catalog
+from common import BASE_DIR, setup_django
+
+TEXTBLOB_COLD_START = (
+    'import time; started = time.perf_counter(); '
+    'from textblob import TextBlob; TextBlob("warm up").sentiment; '
+    'print(time.perf_counter() - started)'
+)
+
+
+def score_all(backend, texts):
+    started = time.perf_counter()
+    scores = [backend.polarity(text) for text in texts]
+    return scores, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=20000, help='Synthetic catalog size')
+    parser.add_argument('--from-db', action='store_true', help='Use the songs in the configured database')
+    args = parser.parse_args()
+
+    setup_django()
+    from recommender.models import Song
+    from recommender.utils import LexiconSentimentBackend, TextBlobSentimentBackend
+
+    if args.from_db:
+        catalog = list(Song.objects.values_list('title', 'artist'))
+        if not catalog:
+            sys.exit('No songs in the database; run manage.py seed_songs first or drop --from-db')
+    else:
+        catalog = make_catalog(args.songs)
+    texts = [f'{title} {artist}' for title, artist in catalog]
+    report = {'texts': len(texts), 'source': 'database' if args.from_db else 'synthetic'}
+
+    textblob_cold = subprocess.run(
+        [sys.executable, '-c', TEXTBLOB_COLD_START], cwd=BASE_DIR, capture_output=True, text=True, check=True,
+    )
+    report['textblob_cold_start_ms'] = round(float(textblob_cold.stdout) * 1000, 1)
+    started = time.perf_counter()
+    lexicon = LexiconSentimentBackend()
+    report['lexicon_load_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    textblob = TextBlobSentimentBackend()
+    textblob.polarity('warm up')
+    expected, textblob_s = score_all(textblob, texts)
+    actual, lexicon_s = score_all(lexicon, texts)
+
+    report['textblob_us_per_text'] = round(textblob_s / len(texts) * 1e6, 2)
+    report['lexicon_us_per_text'] = round(lexicon_s / len(texts) * 1e6, 2)
+    report['speedup'] = round(textblob_s / lexicon_s, 1)
+    report['identical_scores'] = sum(a == b for a, b in zip(expected, actual))
+    report['max_abs_difference'] = max(abs(a - b) for a, b in zip(expected, actual))
+    mismatches = [text for text, a, b in zip(texts, expected, actual) if a != b]
+    if mismatches:
+        report['first_mismatches'] = mismatches[:10]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
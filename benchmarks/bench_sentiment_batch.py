@@ -0,0 +1,65 @@
+"""
+Throughput of SentimentAnalyzer.analyze_batch vs. scoring songs one by one.
+
+Builds a synthetic catalog of title/artist pairs (with the kind of repetition
+a real catalog has: shared artists, common titles) and scores it with the
+old per-song loop, with analyze_batch in-process, and with analyze_batch on
+a process pool.
+
+    python benchmarks/bench_sentiment_batch.py --songs 50000
+"""
+import argparse
+import json
+import random
+import time
+
+from common import setup_django
+
+WORDS = (
+    'love heart night dance happy sad lonely fire rain summer dream broken '
+    'wild beautiful cold golden dark light forever tears smile crazy sweet '
+    'blue young free lost home road baby girl boy world star sky'
+).split()
+
+
+def make_catalog(count, seed=7):
+    rng = random.Random(seed)
+    artists = [f'{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}' for _ in range(max(1, count // 20))]
+    titles = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title() for _ in range(max(1, count // 3))]
+    return [(rng.choice(titles), rng.choice(artists)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=0, help='Pool size (default: CPU count)')
+    args = parser.parse_args()
+
+    setup_django()
+    from recommender.utils import SentimentAnalyzer, polarity_memo
+
+    catalog = make_catalog(args.songs)
+    report = {'songs': args.songs, 'unique_texts': len({f'{t} {a}' for t, a in catalog})}
+
+    started = time.perf_counter()
+    baseline = [SentimentAnalyzer.analyze_text(f'{title} {artist}') for title, artist in catalog]
+    report['per_song_loop_s'] = round(time.perf_counter() - started, 3)
+
+    polarity_memo.clear()
+    started = time.perf_counter()
+    in_process = SentimentAnalyzer.analyze_batch(catalog, processes=1)
+    report['batch_in_process_s'] = round(time.perf_counter() - started, 3)
+
+    polarity_memo.clear()
+    started = time.perf_counter()
+    pooled = SentimentAnalyzer.analyze_batch(catalog, processes=args.processes or None)
+    report['batch_process_pool_s'] = round(time.perf_counter() - started, 3)
+
+    report['identical_scores'] = baseline == in_process == pooled
+    report['speedup_in_process'] = round(report['per_song_loop_s'] / report['batch_in_process_s'], 1)
+    report['speedup_process_pool'] = round(report['per_song_loop_s'] / report['batch_process_pool_s'], 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
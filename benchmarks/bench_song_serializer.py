@@ -0,0 +1,65 @@
+"""
+SongSerializer list responses: the fast path vs. DRF's field-by-field serializer.
+
+Serializes --songs songs and renders them to JSON with JSONRenderer, with
+DRF's field-by-field ListSerializer (what SongSerializer(many=True) was
+before SongListSerializer) and with SongListSerializer: over Song instances
+already in memory, and over an unevaluated queryset, where the time includes
+the query (values_list() rows for the fast path). Checks that every case
+renders the same bytes.
+
+    python benchmarks/bench_song_serializer.py --songs 10000
+"""
+import argparse
+import json
+
+from common import setup_django, temporary_database, insert_songs, time_calls, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=10000)
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework import serializers
+    from rest_framework.renderers import JSONRenderer
+    from recommender.models import Song
+    from recommender.serializers import SongSerializer
+
+    renderer = JSONRenderer()
+    report = {'songs': args.songs}
+    with temporary_database():
+        insert_songs(0, args.songs)
+        # Leave some unscored, to cover the "Unknown" label
+        Song.objects.filter(id__in=Song.objects.order_by('id').values_list('id', flat=True)[::10]).update(sentiment=None)
+        songs = list(Song.objects.order_by('id'))
+
+        def field_by_field(data):
+            return renderer.render(serializers.ListSerializer(child=SongSerializer(), instance=data).data)
+
+        def fast(data):
+            return renderer.render(SongSerializer(data, many=True).data)
+
+        cases = {
+            'instances_field_by_field': lambda: field_by_field(songs),
+            'instances_fast': lambda: fast(songs),
+            'queryset_field_by_field': lambda: field_by_field(Song.objects.order_by('id')),
+            'queryset_fast': lambda: fast(Song.objects.order_by('id')),
+        }
+        rendered = {name: case() for name, case in cases.items()}
+        assert len(set(rendered.values())) == 1, 'fast path output differs'
+        report['bytes'] = len(rendered['instances_fast'])
+
+        for name, case in cases.items():
+            report[name] = summarize(time_calls(case, args.iterations))
+        report['speedup'] = {
+            source: round(report[f'{source}_field_by_field']['p50_ms'] / report[f'{source}_fast']['p50_ms'], 1)
+            for source in ('instances', 'queryset')
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Benchmarks run against a throwaway copy of the database (never db.sqlite3),
+so they are safe to run on a development checkout:
+
+    python benchmarks/bench_mood_sampling.py --sizes 10000,100000
+"""
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Make the project importable and configure Django"""
+    if str(BASE_DIR) not in sys.path:
+        sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'song_recommender.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def temporary_database(on_disk=True):
+    """
+    Create and migrate a scratch database for the duration of the block.
+    On-disk by default, since multi-million row catalogs don't fit comfortably
+    in an in-memory SQLite database.
+    """
+    from django.db import connection
+
+    tmpdir = None
+    if on_disk and connection.vendor == 'sqlite':
+        tmpdir = tempfile.mkdtemp(prefix='songrec-bench-')
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmpdir:
+            for name in os.listdir(tmpdir):
+                os.remove(os.path.join(tmpdir, name))
+            os.rmdir(tmpdir)
+
+
+def insert_songs(start, count, batch_size=50000):
+    """
+    Insert `count` synthetic songs with uniformly distributed sentiment,
+    bypassing the ORM so large catalogs can be built in reasonable time.
+    Song ids start at `start` so the catalog can be grown in steps.
+    """
+    from django.db import connection, transaction
+    from django.utils import timezone
+    from recommender.models import Song
+
+    table = Song._meta.db_table
+    now = timezone.now()
+    sql = (
+        f'INSERT INTO {table} (deezer_id, title, artist, album, link, preview, cover, '
+        f'deezer_artist_id, deezer_album_id, sentiment, random_rank, created_at, updated_at) '
+        f'VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)'
+    )
+
+    rng = random.Random(start)
+    done = 0
+    while done < count:
+        n = min(batch_size, count - done)
+        rows = []
+        for i in range(start + done, start + done + n):
+            rows.append((
+                str(i), f'Song {i}', f'Artist {i % 5000}', f'Album {i % 20000}',
+                f'https://www.deezer.com/track/{i}', '', '', i % 5000, i % 20000,
+                rng.uniform(-1.0, 1.0), rng.random(), now, now,
+            ))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+        done += n
+
+
+def time_calls(func, iterations):
+    """Call `func` repeatedly, returning per-call latencies in milliseconds"""
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(samples):
+    """p50/p95/p99/mean of a list of latencies, rounded for printing"""
+    return {
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3) if samples else 0.0,
+        'n': len(samples),
+    }
+
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Nothing listening on port {port} after {timeout}s')
+
+
+def prepare_app_database(path, env):
+    """Create and migrate a SQLite database at `path` for app server runs"""
+    subprocess.run(
+        [sys.executable, 'manage.py', 'migrate', '--verbosity', '0'],
+        cwd=BASE_DIR, env={**os.environ, **env, 'SQLITE_PATH': str(path)}, check=True,
+    )
+
+
+@contextmanager
+def app_server(kind, port, env, workers=2, threads=1):
+    """
+    Run the Django app in a subprocess for the duration of the block.
+    `kind` is 'wsgi' (gunicorn, sync workers) or 'asgi' (uvicorn).
+    """
+    if kind == 'wsgi':
+        command = [
+            sys.executable, '-m', 'gunicorn', 'song_recommender.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--threads', str(threads),
+            '--log-level', 'warning',
+        ]
+    elif kind == 'asgi':
+        command = [
+            sys.executable, '-m', 'uvicorn', 'song_recommender.asgi:application',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', str(workers),
+            '--log-level', 'warning', '--no-access-log',
+        ]
+    else:
+        raise ValueError(f'Unknown server kind: {kind}')
+
+    process = subprocess.Popen(command, cwd=BASE_DIR, env={**os.environ, **env})
+    try:
+        wait_for_port(port)
+        yield f'http://127.0.0.1:{port}'
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def make_session_cookie(user):
+    """Create a logged-in session for `user` and return the session key"""
+    from django.conf import settings
+    from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+    from django.contrib.sessions.backends.db import SessionStore
+
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+def drive_load(make_request, concurrency, duration):
+    """
+    Call `make_request(session)` from `concurrency` threads for `duration`
+    seconds, each thread with its own keep-alive requests.Session.
+    `make_request` returns a (label, response) pair. Returns per-label latencies
+    (ms) and error counts, plus the wall time spent.
+    """
+    import requests
+
+    results = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        local = {}
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                label, response = make_request(session)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                label, ok = 'connection_error', False
+            elapsed = (time.perf_counter() - started) * 1000
+            entry = local.setdefault(label, {'latencies': [], 'errors': 0})
+            entry['latencies'].append(elapsed)
+            if not ok:
+                entry['errors'] += 1
+        with lock:
+            for label, entry in local.items():
+                merged = results.setdefault(label, {'latencies': [], 'errors': 0})
+                merged['latencies'].extend(entry['latencies'])
+                merged['errors'] += entry['errors']
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def drive_rate(make_request, rate, duration, concurrency):
+    """
+    Open-loop version of drive_load: start requests at `rate` per second for
+    `duration` seconds, whether or not earlier ones have finished, on up to
+    `concurrency` threads. Latency is measured from when a request was due,
+    so time spent waiting for a free thread counts (no coordinated omission).
+    Each thread keeps its own requests.Session. Returns the same shape as
+    drive_load, plus how many requests started over 100 ms late.
+    """
+    import queue
+    import requests
+
+    results = {}
+    lock = threading.Lock()
+    due = queue.Queue()
+    late = [0]
+
+    def worker():
+        session = requests.Session()
+        local = {}
+        late_here = 0
+        while True:
+            scheduled = due.get()
+            if scheduled is None:
+                break
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            elif wait < -0.1:
+                late_here += 1
+            try:
+                label, response = make_request(session)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                label, ok = 'connection_error', False
+            elapsed = (time.perf_counter() - scheduled) * 1000
+            entry = local.setdefault(label, {'latencies': [], 'errors': 0})
+            entry['latencies'].append(elapsed)
+            if not ok:
+                entry['errors'] += 1
+        with lock:
+            late[0] += late_here
+            for label, entry in local.items():
+                merged = results.setdefault(label, {'latencies': [], 'errors': 0})
+                merged['latencies'].extend(entry['latencies'])
+                merged['errors'] += entry['errors']
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+
+    started = time.perf_counter()
+    total = int(rate * duration)
+    for i in range(total):
+        scheduled = started + i / rate
+        # Stay a little ahead of the schedule so idle workers can pick it up on time
+        ahead = scheduled - time.perf_counter() - 0.05
+        if ahead > 0:
+            time.sleep(ahead)
+        due.put(scheduled)
+    for _ in threads:
+        due.put(None)
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - started, late[0]
@@ -0,0 +1,131 @@
+"""
+Local stand-in for api.deezer.com, used by the benchmarks and load tests.
+
+Serves /search, /track/<id> and /artist/<id>/top with deterministic fake
+data, after an artificial delay, and fails a configurable share of requests
+with a 503.
+
+    python benchmarks/fake_deezer.py --port 8765 --latency-ms 200 --error-rate 0.01
+
+Point the app at it with DEEZER_API_URL=http://127.0.0.1:8765
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+ARTISTS = 500
+TRACKS_PER_ARTIST = 25
+
+
+def make_track(track_id):
+    """Deterministic fake track; artists own contiguous blocks of track ids"""
+    track_id = int(track_id)
+    artist_id = track_id // TRACKS_PER_ARTIST % ARTISTS + 1
+    album_id = track_id // 5 + 1
+    return {
+        'id': track_id,
+        'title': f'Track {track_id}',
+        'link': f'https://www.deezer.com/track/{track_id}',
+        'preview': f'https://cdn.example.com/preview/{track_id}.mp3',
+        'artist': {'id': artist_id, 'name': f'Artist {artist_id}'},
+        'album': {
+            'id': album_id,
+            'title': f'Album {album_id}',
+            'cover_medium': f'https://cdn.example.com/cover/{album_id}.jpg',
+            'cover_xl': f'https://cdn.example.com/cover/{album_id}-xl.jpg',
+        },
+    }
+
+
+class FakeDeezerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        limit = int(params.get('limit', ['20'])[0])
+
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        with server.lock:
+            server.request_count += 1
+
+        if random.random() < server.error_rate:
+            return self.respond(503, {'error': 'unavailable'})
+
+        match = re.fullmatch(r'/track/(\d+)', url.path)
+        if match:
+            return self.respond(200, make_track(match.group(1)))
+
+        match = re.fullmatch(r'/artist/(\d+)/top', url.path)
+        if match:
+            first = (int(match.group(1)) - 1) * TRACKS_PER_ARTIST
+            return self.respond(200, {'data': [make_track(first + i) for i in range(min(limit, TRACKS_PER_ARTIST))]})
+
+        if url.path == '/search':
+            query = params.get('q', [''])[0]
+            first = abs(hash(query)) % (ARTISTS * TRACKS_PER_ARTIST)
+            return self.respond(200, {'data': [make_track(first + i) for i in range(limit)]})
+
+        return self.respond(404, {'error': {'type': 'DataException', 'message': 'no data', 'code': 800}})
+
+    def respond(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeDeezerServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_fake_deezer(port=0, latency=0.0, jitter=0.0, error_rate=0.0):
+    """Start the stand-in on a background thread and return the server"""
+    server = FakeDeezerServer(('127.0.0.1', port), FakeDeezerHandler)
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.url = f'http://127.0.0.1:{server.server_port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for api.deezer.com')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=100)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = start_fake_deezer(args.port, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+    print(f'Fake Deezer listening on {server.url}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Song, UserProfile, Subscription, Purchase
+from .models import Song, Artist, UserProfile, Subscription, Purchase
 
 
 @admin.register(Song)
@@ -10,11 +10,20 @@ class SongAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at', 'updated_at']
 
 
+@admin.register(Artist)
+class ArtistAdmin(admin.ModelAdmin):
+    list_display = ['name', 'deezer_id', 'top_tracks_fetched_at']
+    search_fields = ['name', 'deezer_id']
+    readonly_fields = ['created_at', 'updated_at']
+
+
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ['user', 'daily_usage_count', 'last_usage_date', 'has_active_subscription']
+    list_display = ['user', 'daily_usage_count', 'last_usage_date', 'has_active_subscription', 'premium_until']
     search_fields = ['user__username', 'user__email']
     list_filter = ['last_usage_date']
+    list_select_related = ['user']
+    readonly_fields = ['premium_until']
 
     def has_active_subscription(self, obj):
         return obj.has_active_subscription()
@@ -0,0 +1,257 @@
+import mmap
+import os
+import random
+import shutil
+import struct
+import tempfile
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+SNAPSHOT_MAGIC = b'SONGCAT1'
+SNAPSHOT_FORMAT = 1
+# magic, format, version (export time in ns), songs, size of the strings blob
+HEADER = struct.Struct('<8sIqqq')
+# Song text fields, stored back to back per song in one UTF-8 blob
+STRING_FIELDS = ('deezer_id', 'title', 'artist', 'album', 'link', 'preview', 'cover')
+
+
+def _columns(count):
+    """(name, dtype, length) of the fixed-width columns, in file order"""
+    return (
+        ('ids', np.int64, count),
+        ('sentiment', np.float64, count),
+        # Deezer artist id, -1 if unknown
+        ('artist_ids', np.int64, count),
+        # Positions in sentiment order, and the sentiments in that order, so a
+        # mood's songs are one contiguous range
+        ('by_sentiment', np.int64, count),
+        ('sorted_sentiment', np.float64, count),
+        # Where each song's STRING_FIELDS start in the blob, plus its end
+        ('string_offsets', np.int64, count * len(STRING_FIELDS) + 1),
+    )
+
+
+def _padding(offset):
+    return -offset % 8
+
+
+def write_snapshot(path, chunk_size=10000):
+    """
+    Export every scored song to a snapshot file at `path`, replacing any
+    previous snapshot atomically: the file is written next to it and renamed
+    over it, so readers see either the old or the new one, never a mix.
+    Processes still mapping the old one keep it until they reopen. Returns
+    (songs, version).
+    """
+    from .models import Song
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    version = time.time_ns()
+    songs = Song.objects.filter(sentiment__isnull=False).order_by('id')
+    count = songs.count()
+
+    ids = np.empty(count, dtype=np.int64)
+    sentiment = np.empty(count, dtype=np.float64)
+    artist_ids = np.empty(count, dtype=np.int64)
+    offsets = np.empty(count * len(STRING_FIELDS) + 1, dtype=np.int64)
+
+    # Strings are streamed to a scratch file, as the blob can be large
+    n = 0
+    with tempfile.TemporaryFile(dir=directory) as strings:
+        position = 0
+        rows = songs.values_list('id', 'sentiment', 'deezer_artist_id', *STRING_FIELDS)
+        for row in rows.iterator(chunk_size=chunk_size):
+            if n == count:
+                # Scored since the count; it'll be in the next snapshot
+                break
+            ids[n], sentiment[n] = row[0], row[1]
+            artist_ids[n] = row[2] if row[2] is not None else -1
+            for field, value in enumerate(row[3:]):
+                encoded = value.encode('utf-8')
+                offsets[n * len(STRING_FIELDS) + field] = position
+                strings.write(encoded)
+                position += len(encoded)
+            n += 1
+        offsets[n * len(STRING_FIELDS)] = position
+
+        by_sentiment = np.argsort(sentiment[:n], kind='stable')
+        columns = {
+            'ids': ids[:n],
+            'sentiment': sentiment[:n],
+            'artist_ids': artist_ids[:n],
+            'by_sentiment': by_sentiment,
+            'sorted_sentiment': sentiment[:n][by_sentiment],
+            'string_offsets': offsets[:n * len(STRING_FIELDS) + 1],
+        }
+
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, version, n, position))
+                for name, dtype, _length in _columns(n):
+                    out.write(b'\0' * _padding(out.tell()))
+                    out.write(columns[name].astype(dtype, copy=False).tobytes())
+                strings.seek(0)
+                shutil.copyfileobj(strings, out)
+                out.flush()
+                os.fsync(out.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return n, version
+
+
+class CatalogSnapshot:
+    """
+    A memory-mapped catalog snapshot. The columns are NumPy views straight
+    onto the mapping, so every process mapping the file shares one copy of
+    its pages (through the page cache) and nothing is parsed up front.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, file_format, self.version, count, strings_size = HEADER.unpack_from(self._map, 0)
+        except struct.error:
+            magic = None
+        if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT:
+            self._map.close()
+            raise ValueError(f"{path} is not a catalog snapshot")
+
+        layout = []
+        offset = HEADER.size
+        for name, dtype, length in _columns(count):
+            offset += _padding(offset)
+            layout.append((name, dtype, length, offset))
+            offset += length * np.dtype(dtype).itemsize
+        if offset + strings_size != len(self._map):
+            self._map.close()
+            raise ValueError(f"{path} is truncated")
+
+        for name, dtype, length, column_offset in layout:
+            setattr(self, name, np.frombuffer(self._map, dtype=dtype, count=length, offset=column_offset))
+        self._strings_offset = offset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def positions(self, song_ids):
+        """Positions of the given song ids, in order; ids not in the snapshot are dropped"""
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        if not len(self):
+            return song_ids[:0]
+        found = np.minimum(np.searchsorted(self.ids, song_ids), len(self) - 1)
+        return found[self.ids[found] == song_ids]
+
+    def sample(self, min_sentiment, max_sentiment, limit):
+        """Positions of up to `limit` random songs with sentiment in the range"""
+        lo = np.searchsorted(self.sorted_sentiment, min_sentiment, side='left')
+        hi = np.searchsorted(self.sorted_sentiment, max_sentiment, side='right')
+        picks = random.sample(range(lo, hi), min(limit, hi - lo))
+        return self.by_sentiment[picks]
+
+    def strings(self, position):
+        """The song's STRING_FIELDS"""
+        start = position * len(STRING_FIELDS)
+        bounds = self.string_offsets[start:start + len(STRING_FIELDS) + 1].tolist()
+        base = self._strings_offset
+        return [
+            self._map[base + begin:base + end].decode('utf-8')
+            for begin, end in zip(bounds, bounds[1:])
+        ]
+
+    def songs(self, positions):
+        """
+        Song instances for the given positions, built from the snapshot
+        rather than read from the database. They only have the exported
+        fields (no created_at or updated_at, and a made-up random_rank), so
+        they are left unsaved: read them, but fetch the row to change it.
+        """
+        from .models import Song
+
+        songs = []
+        for position in np.asarray(positions).tolist():
+            artist_id = int(self.artist_ids[position])
+            songs.append(Song(
+                id=int(self.ids[position]),
+                sentiment=float(self.sentiment[position]),
+                deezer_artist_id=artist_id if artist_id >= 0 else None,
+                **dict(zip(STRING_FIELDS, self.strings(position))),
+            ))
+        return songs
+
+
+class SharedCatalogSnapshot:
+    """
+    The process's view of the catalog snapshot, per the CATALOG_SNAPSHOT
+    setting:
+
+        CATALOG_SNAPSHOT = {
+            'ENABLED': False,
+            'PATH': 'catalog.snapshot',
+            'CHECK_SECONDS': 30,    # how often to look for a newer export
+        }
+
+    Mapped on first use, or up front by wsgi.py so that workers forked by
+    `gunicorn --preload` inherit the mapping. When `manage.py
+    export_catalog_snapshot` swaps in a new file, each process maps it at its
+    next check; until then it keeps serving the one it has.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop the mapping so the next use re-reads settings and the file"""
+        with self._lock:
+            self._snapshot = None
+            self._checked_at = None
+
+    @property
+    def config(self):
+        return getattr(settings, 'CATALOG_SNAPSHOT', {})
+
+    @property
+    def enabled(self):
+        return bool(self.config.get('ENABLED', False))
+
+    def get(self):
+        """The current snapshot, or None when disabled or there's no valid snapshot file"""
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.config.get('CHECK_SECONDS', 30):
+            return self._snapshot
+
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.config.get('CHECK_SECONDS', 30):
+                self._snapshot = self._reopen(self._snapshot)
+                self._checked_at = now
+            return self._snapshot
+
+    def _reopen(self, current):
+        path = self.config.get('PATH', 'catalog.snapshot')
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if current is not None and (current.stat.st_ino, current.stat.st_mtime_ns) == (stat.st_ino, stat.st_mtime_ns):
+            return current
+        try:
+            return CatalogSnapshot(path)
+        except (OSError, ValueError) as e:
+            print(f"Catalog snapshot unavailable: {e}")
+            return None
+
+
+catalog_snapshot = SharedCatalogSnapshot()
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from django.conf import settings
+
+TAPE_MAGIC = b'DZTAPE1\n'
+# Each record: 16-byte key digest, body length, then the zlib-compressed JSON body
+RECORD_HEADER = struct.Struct('<16sI')
+
+
+class TapeMiss(LookupError):
+    """The tape has no response for the request"""
+
+
+def tape_digest(key):
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+class TapeWriter:
+    """
+    Appends responses to a tape file. Every record goes out in a single
+    O_APPEND write, so several processes (e.g. gunicorn workers) can record
+    to the same file.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, TAPE_MAGIC)
+
+    def put(self, key, value):
+        body = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+        os.write(self._fd, RECORD_HEADER.pack(tape_digest(key), len(body)) + body)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class TapeReader:
+    """
+    Serves responses from a memory-mapped tape file. Opening it walks the
+    record headers once to index them by key; bodies are only touched (and
+    decompressed) when requested, so every call gets its own copy. A key
+    recorded twice replays its latest response, and a partial record at the
+    end (from a recorder that was killed mid-write) is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._index = {}
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(TAPE_MAGIC)] != TAPE_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a Deezer tape")
+
+        offset, end = len(TAPE_MAGIC), len(self._map)
+        while offset + RECORD_HEADER.size <= end:
+            digest, length = RECORD_HEADER.unpack_from(self._map, offset)
+            offset += RECORD_HEADER.size
+            if offset + length > end:
+                break
+            self._index[digest] = (offset, length)
+            offset += length
+
+    def get(self, key):
+        try:
+            offset, length = self._index[tape_digest(key)]
+        except KeyError:
+            raise TapeMiss(f"No recorded Deezer response for {key}") from None
+        return json.loads(zlib.decompress(self._map[offset:offset + length]))
+
+    def __contains__(self, key):
+        return tape_digest(key) in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def close(self):
+        self._map.close()
+
+
+class DeezerTape:
+    """
+    Records Deezer API responses to a tape file, or replays them from one
+    without touching the network, per the DEEZER_TAPE setting:
+
+        DEEZER_TAPE = {
+            'MODE': 'off',              # 'off', 'record' or 'replay'
+            'PATH': 'deezer.tape',
+        }
+
+    Keys are the response cache's keys (see DeezerCache.make_key), so a
+    request replays whatever was recorded for the same endpoint and params.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._store = None
+
+    def reset(self):
+        """Close the tape so the next use re-reads settings"""
+        with self._lock:
+            store, self._store = self._store, None
+        if store is not None:
+            store.close()
+
+    @property
+    def config(self):
+        return getattr(settings, 'DEEZER_TAPE', {})
+
+    @property
+    def mode(self):
+        mode = self.config.get('MODE', 'off')
+        if mode not in ('off', 'record', 'replay'):
+            raise ValueError(f"Unknown DEEZER_TAPE mode: {mode}")
+        return mode
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    @property
+    def store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    path = self.config.get('PATH', 'deezer.tape')
+                    self._store = TapeReader(path) if self.replaying else TapeWriter(path)
+        return self._store
+
+    def record(self, key, value):
+        """Save a response when recording; Deezer's 200-with-"error" replies are skipped"""
+        if self.mode == 'record' and not (isinstance(value, dict) and 'error' in value):
+            self.store.put(key, value)
+
+    def replay(self, key):
+        """The recorded response for `key`; raises TapeMiss if there is none"""
+        return self.store.get(key)
+
+
+deezer_tape = DeezerTape()
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.utils import timezone
+
+from .metering import usage_meter
+from .models import UserProfile
+
+
+class Entitlement:
+    """A user's profile and what it entitles them to, for the current request"""
+
+    def __init__(self, profile, free_limit):
+        self.profile = profile
+        self.free_limit = free_limit
+
+    @property
+    def has_subscription(self):
+        return self.profile.has_active_subscription()
+
+    @property
+    def usage_count(self):
+        return self.profile.daily_usage_count
+
+    @property
+    def can_use(self):
+        return self.has_subscription or self.usage_count < self.free_limit
+
+    def use(self):
+        """Count one use against the daily quota; returns False (counting nothing) when it is used up"""
+        if self.has_subscription:
+            usage_meter.record(self.profile)
+            return True
+        if not self.can_use:
+            return False
+        # The meter checks the quota again as it counts, so concurrent
+        # requests can't push the count past the limit
+        return usage_meter.record(self.profile, limit=self.free_limit) is not None
+
+
+def load_entitlement(user):
+    """
+    Load the user's profile, which also carries their subscription status
+    (premium_until), in one query. A new day's usage reset is applied in
+    memory only; it is saved with the next usage increment.
+    """
+    profile = UserProfile.objects.filter(user=user).first()
+    if profile is None:
+        profile, created = UserProfile.objects.get_or_create(user=user)
+    profile.user = user
+
+    today = timezone.now().date()
+    if profile.last_usage_date != today:
+        profile.daily_usage_count = 0
+        profile.last_usage_date = today
+
+    return Entitlement(profile, getattr(settings, 'FREE_USAGE_LIMIT', 10))
+
+
+def get_entitlement(request, user=None):
+    """
+    The entitlement of the request's user, loaded on first use and then
+    memoized on the request so every check in a view (and its templates)
+    shares one profile and one subscription lookup. Pass `user` from async
+    views, where request.user can't be touched. Works with DRF requests too.
+    """
+    http_request = getattr(request, '_request', request)
+    entitlement = getattr(http_request, '_entitlement', None)
+    if entitlement is None:
+        entitlement = load_entitlement(user or request.user)
+        http_request._entitlement = entitlement
+    return entitlement
@@ -0,0 +1,54 @@
+import json
+import os
+from importlib.metadata import version
+
+from django.core.management.base import BaseCommand
+from recommender.utils import LexiconSentimentBackend
+
+
+class Command(BaseCommand):
+    help = "Compile TextBlob's English sentiment lexicon into the file used by the 'lexicon' sentiment backend"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            default=LexiconSentimentBackend.DEFAULT_PATH,
+            help='Where to write the compiled lexicon (default: the bundled recommender/data file)'
+        )
+
+    def handle(self, *args, **options):
+        from textblob import _text
+        from textblob.en import sentiment
+
+        sentiment.load()
+
+        # Only the part-of-speech-independent scores are used for plain strings,
+        # plus whether the word can modify the next one (i.e. it is an adverb)
+        words = {}
+        for word, scores in sorted(dict.items(sentiment)):
+            polarity, _subjectivity, intensity = scores[None]
+            words[word] = [polarity, intensity, int(any(pos in scores for pos in sentiment.modifiers))]
+
+        # Kept in TextBlob's order and case; the backend matches them case-insensitively
+        emoticons = {}
+        for (_name, polarity), faces in _text.EMOTICONS.items():
+            for face in sorted(faces):
+                emoticons[face] = polarity
+
+        lexicon = {
+            'source': f"textblob {version('textblob')} en-sentiment.xml",
+            'negations': list(sentiment.negations),
+            'punctuation': _text.PUNCTUATION,
+            'abbreviations': sorted(_text.ABBREVIATIONS),
+            'emoticons': emoticons,
+            'words': words,
+        }
+
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(lexicon, f, ensure_ascii=False, separators=(',', ':'))
+            f.write('\n')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Compiled {len(words)} words and {len(emoticons)} emoticons to {options['output']}"
+        ))
@@ -0,0 +1,58 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from recommender.neighbors import compute_neighbors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute each song's most similar songs (same artist or album, close sentiment, "
+        "alike titles) for song recommendations; only changed songs unless --full"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--neighbors',
+            type=int,
+            default=10,
+            help='Similar songs to keep per song (default: 10)'
+        )
+        parser.add_argument(
+            '--memory-mb',
+            type=int,
+            default=512,
+            help='Memory budget for the features and score matrices (default: 512)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Recompute every song, not just the ones that changed since the last run'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Songs whose neighbors are written per transaction (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        if options['neighbors'] < 1:
+            raise CommandError('--neighbors must be at least 1')
+
+        started = time.perf_counter()
+        try:
+            stats = compute_neighbors(
+                k=options['neighbors'],
+                memory_mb=options['memory_mb'],
+                full=options['full'],
+                batch_size=options['batch_size'],
+                log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Completed! Computed {stats['computed']} and updated {stats['merged']} of {stats['songs']} "
+            f"songs' neighbors{' (full run)' if stats['full'] else ''} "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
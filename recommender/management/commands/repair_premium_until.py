@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from recommender.models import Subscription, UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recompute UserProfile.premium_until from subscriptions and fix profiles that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report profiles that are out of sync'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Profiles to update per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        expected = dict(
+            Subscription.objects.filter(active=True)
+            .values('user_id')
+            .annotate(premium_until=Max('end_date'))
+            .values_list('user_id', 'premium_until')
+        )
+
+        stale = []
+        checked = 0
+        for profile in UserProfile.objects.only('id', 'user_id', 'premium_until').iterator(chunk_size=2000):
+            checked += 1
+            premium_until = expected.get(profile.user_id)
+            if profile.premium_until != premium_until:
+                self.stdout.write(
+                    f'Profile {profile.id} (user {profile.user_id}): {profile.premium_until} -> {premium_until}'
+                )
+                profile.premium_until = premium_until
+                stale.append(profile)
+
+        if options['dry_run']:
+            self.stdout.write(f'{len(stale)} of {checked} profiles out of sync (dry run, nothing changed)')
+            return
+
+        UserProfile.objects.bulk_update(stale, ['premium_until'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Completed! Fixed {len(stale)} of {checked} profiles.'))
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recommender.models import Song
+from recommender.utils import SentimentAnalyzer
+
+
+class Command(BaseCommand):
+    help = 'Score sentiment for songs waiting in the scoring queue (songs with no sentiment yet)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Songs to score per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep running and poll for new songs when the queue is empty'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5.0,
+            help='Seconds to wait between polls of an empty queue with --loop (default: 5)'
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Stop after this many batches'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batches = 0
+        total = 0
+
+        while options['max_batches'] is None or batches < options['max_batches']:
+            scored = self.score_batch(batch_size)
+            if scored:
+                batches += 1
+                total += scored
+                self.stdout.write(f'Scored {scored} songs ({total} total)')
+                continue
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Completed! Scored {total} songs.'))
+
+    def score_batch(self, batch_size):
+        """Score the oldest unscored songs; returns how many were scored"""
+        songs = list(
+            Song.objects.filter(sentiment__isnull=True)
+            .order_by('id')
+            .only('id', 'title', 'artist')[:batch_size]
+        )
+        if not songs:
+            return 0
+
+        scores = SentimentAnalyzer.analyze_batch([(song.title, song.artist) for song in songs])
+
+        # bulk_update skips auto_now, and the mood pools watch updated_at
+        now = timezone.now()
+        for song, sentiment in zip(songs, scores):
+            song.sentiment = sentiment
+            song.updated_at = now
+        Song.objects.bulk_update(songs, ['sentiment', 'updated_at'])
+
+        return len(songs)
@@ -1,6 +1,5 @@
 from django.core.management.base import BaseCommand
-from recommender.models import Song
-from recommender.utils import DeezerAPI, SentimentAnalyzer
+from recommender.utils import DeezerAPI, ingest_deezer_tracks
 
 
 class Command(BaseCommand):
@@ -33,57 +32,41 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING('No songs found.'))
             return
 
-        created_count = 0
-        updated_count = 0
-
+        tracks = []
         for track in results:
-            deezer_id = str(track['id'])
             title = track.get('title', '')
             artist = track.get('artist', {}).get('name', '')
-            album = track.get('album', {}).get('title', '')
-            link = track.get('link', '')
-            preview = track.get('preview', '')
-            cover = track.get('album', {}).get('cover_medium', '')
 
             # Skip songs without preview or cover
-            if not preview:
+            if not track.get('preview', ''):
                 self.stdout.write(
                     self.style.WARNING(f'○ Skipped (no preview): {title} - {artist}')
                 )
                 continue
-            if not cover:
+            if not track.get('album', {}).get('cover_medium', ''):
                 self.stdout.write(
                     self.style.WARNING(f'○ Skipped (no cover): {title} - {artist}')
                 )
                 continue
 
-            # Get or create song
-            song, created = Song.objects.get_or_create(
-                deezer_id=deezer_id,
-                defaults={
-                    'title': title,
-                    'artist': artist,
-                    'album': album,
-                    'link': link,
-                    'preview': preview,
-                    'cover': cover,
-                }
-            )
+            tracks.append(track)
 
-            # Calculate sentiment if not already done
-            if song.sentiment is None:
-                song.sentiment = SentimentAnalyzer.analyze_song(title, artist)
-                song.save()
+        # Store the whole batch and calculate sentiment for new songs
+        songs, created_ids = ingest_deezer_tracks(tracks, return_created=True)
 
-            if created:
+        created_count = 0
+        updated_count = 0
+
+        for song in songs:
+            if song.deezer_id in created_ids:
                 created_count += 1
                 self.stdout.write(
-                    self.style.SUCCESS(f'✓ Created: {title} - {artist}')
+                    self.style.SUCCESS(f'✓ Created: {song.title} - {song.artist}')
                 )
             else:
                 updated_count += 1
                 self.stdout.write(
-                    self.style.WARNING(f'○ Already exists: {title} - {artist}')
+                    self.style.WARNING(f'○ Already exists: {song.title} - {song.artist}')
                 )
 
         self.stdout.write(
@@ -91,4 +74,3 @@ class Command(BaseCommand):
                 f'\nCompleted! Created: {created_count}, Already existed: {updated_count}'
             )
         )
-
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.db.models.functions import Random
+from recommender.models import Song
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-draw every song's random_rank, so the rank gaps mood sampling sees "
+        "change over time (run periodically, e.g. nightly)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Songs to update per query (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # update() leaves updated_at alone, so the mood pools and the
+        # neighbor table don't see a change; id ranges keep each write short
+        last_id = Song.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        total = 0
+        for start in range(0, last_id, batch_size):
+            total += Song.objects.filter(id__gt=start, id__lte=start + batch_size).update(random_rank=Random())
+
+        self.stdout.write(self.style.SUCCESS(f'Completed! Shuffled the random ranks of {total} songs.'))
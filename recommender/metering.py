@@ -0,0 +1,177 @@
+import atexit
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UserProfile
+
+
+class DatabaseMeter:
+    """Writes every use straight to UserProfile.daily_usage_count"""
+
+    def record(self, profile, limit=None):
+        return profile.increment_usage(limit=limit)
+
+    def flush(self):
+        return 0
+
+
+class LocalMeter:
+    """
+    Counts uses in per-user daily buckets in this process's memory and
+    writes them to UserProfile in aggregated UPDATEs: when a user has
+    `max_pending` unwritten uses, or when `flush_interval` seconds have
+    passed since the last flush (checked as uses come in), and at exit.
+
+    Quota checks see the database count (as loaded with the profile, or as
+    returned by this process's last flush for the user) plus this process's
+    unwritten uses, but not other processes' unwritten uses. With N worker
+    processes, a free user can therefore get at most
+    (N - 1) * (max_pending - 1) uses over the limit before the counts catch
+    up. Uses still pending when a process is killed without running its
+    exit hooks are lost.
+    """
+
+    def __init__(self, flush_interval=5, max_pending=5):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        # profile pk -> {'day', 'pending': unwritten uses, 'writing': uses
+        # being written, 'stored': the count the database last reported}
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, profile, limit=None):
+        today = timezone.now().date()
+        loaded = 0
+        if profile.last_usage_date == today:
+            # A profile this meter already counted on carries the count it
+            # was loaded with; its daily_usage_count includes our pending uses
+            loaded = getattr(profile, '_metered_base', profile.daily_usage_count)
+
+        with self._lock:
+            bucket = self._buckets.get(profile.pk)
+            # Unwritten uses from a previous day no longer count towards anything
+            if bucket is None or bucket['day'] != today:
+                bucket = self._buckets[profile.pk] = {'day': today, 'pending': 0, 'writing': 0, 'stored': 0}
+
+            # The profile may have been loaded before this process's last flush
+            base = max(loaded, bucket['stored'])
+            current = base + bucket['writing'] + bucket['pending']
+            if limit is not None and current >= limit:
+                return None
+            bucket['pending'] += 1
+            flush_due = (
+                bucket['pending'] >= self.max_pending
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+        profile._metered_base = base
+        profile.daily_usage_count = current + 1
+        profile.last_usage_date = today
+        if flush_due:
+            self.flush()
+        return current + 1
+
+    def flush(self):
+        """Write every pending count to the database; returns how many profiles were updated"""
+        today = timezone.now().date()
+        with self._flush_lock:
+            with self._lock:
+                self._last_flush = time.monotonic()
+                # Forget finished days
+                finished = [
+                    pk for pk, bucket in self._buckets.items()
+                    if bucket['day'] != today and not bucket['pending'] and not bucket['writing']
+                ]
+                for pk in finished:
+                    del self._buckets[pk]
+                batch = [(pk, bucket) for pk, bucket in self._buckets.items() if bucket['pending']]
+                for pk, bucket in batch:
+                    bucket['writing'], bucket['pending'] = bucket['pending'], 0
+
+            for pk, bucket in batch:
+                try:
+                    stored = self._write(pk, bucket['day'], bucket['writing'])
+                except Exception:
+                    with self._lock:
+                        bucket['pending'] += bucket['writing']
+                        bucket['writing'] = 0
+                    raise
+                with self._lock:
+                    bucket['writing'] = 0
+                    if stored is not None:
+                        bucket['stored'] = max(bucket['stored'], stored)
+        return len(batch)
+
+    def _write(self, pk, day, amount):
+        return UserProfile.add_usage(pk, amount, day)
+
+    def __len__(self):
+        return sum(bucket['pending'] + bucket['writing'] for bucket in self._buckets.values())
+
+
+class UsageMeter:
+    """
+    Records metered uses (searches, recommendations) with the backend chosen
+    by the USAGE_METERING setting:
+
+        USAGE_METERING = {
+            'BACKEND': 'db',          # 'db' or 'local'
+            'FLUSH_INTERVAL': 5,      # 'local': seconds between flushes
+            'MAX_PENDING': 5,         # 'local': unwritten uses per user before a flush
+        }
+
+    See LocalMeter for how far over FREE_USAGE_LIMIT the 'local' backend can go.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+
+    def reset(self):
+        """Flush and drop the backend so the next use re-reads settings"""
+        with self._lock:
+            backend, self._backend = self._backend, None
+        if backend is not None:
+            backend.flush()
+
+    @property
+    def config(self):
+        return getattr(settings, 'USAGE_METERING', {})
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    name = self.config.get('BACKEND', 'db')
+                    if name == 'db':
+                        self._backend = DatabaseMeter()
+                    elif name == 'local':
+                        self._backend = LocalMeter(
+                            flush_interval=self.config.get('FLUSH_INTERVAL', 5),
+                            max_pending=self.config.get('MAX_PENDING', 5),
+                        )
+                    else:
+                        raise ValueError(f"Unknown USAGE_METERING backend: {name}")
+        return self._backend
+
+    def record(self, profile, limit=None):
+        """
+        Count one use for the profile's user today and return the new count.
+        With `limit`, returns None (counting nothing) once the count has reached it.
+        """
+        return self.backend.record(profile, limit=limit)
+
+    def flush(self):
+        if self._backend is None:
+            return 0
+        return self._backend.flush()
+
+
+usage_meter = UsageMeter()
+atexit.register(usage_meter.flush)
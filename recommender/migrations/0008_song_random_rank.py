@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:15
+
+import random
+
+import recommender.models
+from django.db import migrations, models
+
+
+def backfill_random_rank(apps, schema_editor):
+    # AddField evaluates the default once, so every existing row would share
+    # the same rank. Give each song its own draw.
+    Song = apps.get_model('recommender', 'Song')
+    batch = []
+    for song in Song.objects.only('id').iterator(chunk_size=2000):
+        song.random_rank = random.random()
+        batch.append(song)
+        if len(batch) >= 2000:
+            Song.objects.bulk_update(batch, ['random_rank'])
+            batch = []
+    if batch:
+        Song.objects.bulk_update(batch, ['random_rank'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0007_userprofile_email_verified_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='random_rank',
+            field=models.FloatField(default=recommender.models.generate_random_rank, editable=False),
+        ),
+        migrations.RunPython(backfill_random_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(fields=['random_rank', 'sentiment'], name='song_random_rank_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0008_song_random_rank'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='song',
+            index=models.Index(condition=models.Q(('sentiment__isnull', True)), fields=['id'], name='song_unscored_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:42
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_premium_until(apps, schema_editor):
+    Subscription = apps.get_model('recommender', 'Subscription')
+    UserProfile = apps.get_model('recommender', 'UserProfile')
+    active = (
+        Subscription.objects.filter(active=True)
+        .values('user_id')
+        .annotate(premium_until=Max('end_date'))
+    )
+    for row in active:
+        UserProfile.objects.filter(user_id=row['user_id']).update(premium_until=row['premium_until'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0009_song_unscored_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='premium_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_premium_until, migrations.RunPython.noop),
+    ]
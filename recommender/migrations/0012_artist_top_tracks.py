@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0011_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Artist',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('deezer_id', models.PositiveBigIntegerField(unique=True)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('top_track_ids', models.JSONField(blank=True, default=list)),
+                ('top_tracks_limit', models.PositiveSmallIntegerField(default=0)),
+                ('top_tracks_fetched_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='deezer_album_id',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='song',
+            name='deezer_artist_id',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
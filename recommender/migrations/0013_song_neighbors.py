@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommender', '0012_artist_top_tracks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='song',
+            name='neighbors_computed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='SongNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('neighbor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='recommender.song')),
+                ('song', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='recommender.song')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('song', 'rank'), name='song_neighbor_rank_uniq')],
+            },
+        ),
+    ]
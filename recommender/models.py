@@ -1,10 +1,16 @@
-from django.db import models
+from django.db import connection, models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
+import random
 import uuid
 
 
+def generate_random_rank():
+    """Default for Song.random_rank (module-level so migrations can serialize it)"""
+    return random.random()
+
+
 class Song(models.Model):
     deezer_id = models.CharField(max_length=100, unique=True, db_index=True)
     title = models.CharField(max_length=255)
@@ -13,17 +19,80 @@ class Song(models.Model):
     link = models.URLField()
     preview = models.URLField(blank=True)
     cover = models.URLField(blank=True)
+    # Deezer ids, filled in at ingest; older rows get the artist id the
+    # first time recommendations are asked for
+    deezer_artist_id = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    deezer_album_id = models.PositiveBigIntegerField(null=True, blank=True)
     sentiment = models.FloatField(null=True, blank=True)
+    # Uniform random key used to sample songs without ORDER BY RANDOM()
+    random_rank = models.FloatField(default=generate_random_rank, editable=False)
+    # When `manage.py compute_song_neighbors` last computed the song's
+    # SongNeighbor rows; null for songs it hasn't seen yet
+    neighbors_computed_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['random_rank', 'sentiment'], name='song_random_rank_idx'),
+            # Scoring queue: songs waiting for the score_songs worker
+            models.Index(fields=['id'], condition=models.Q(sentiment__isnull=True), name='song_unscored_idx'),
+            # Default ordering, and MoodCandidatePools.refresh()'s watermark scan
+            models.Index(fields=['-created_at'], name='song_created_at_idx'),
+            models.Index(fields=['updated_at'], name='song_updated_at_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.artist}"
 
 
+class SongNeighbor(models.Model):
+    """
+    One of a song's most similar songs, as computed offline by
+    `manage.py compute_song_neighbors` (see recommender.neighbors)
+    """
+    # Indexed by the unique constraint below
+    song = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='neighbors', db_index=False)
+    neighbor = models.ForeignKey(Song, on_delete=models.CASCADE, related_name='neighbor_of')
+    # 0 for the most similar
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            # Also the index a song's neighbors are read in order from
+            models.UniqueConstraint(fields=['song', 'rank'], name='song_neighbor_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.song_id} -> {self.neighbor_id} (#{self.rank})"
+
+
+class Artist(models.Model):
+    """A Deezer artist and a cached copy of their top tracks, used for song recommendations"""
+    deezer_id = models.PositiveBigIntegerField(unique=True)
+    name = models.CharField(max_length=255, blank=True)
+    # Song.deezer_id values in Deezer's order, as of top_tracks_fetched_at
+    top_track_ids = models.JSONField(default=list, blank=True)
+    # How many tracks were asked for (Deezer may return fewer)
+    top_tracks_limit = models.PositiveSmallIntegerField(default=0)
+    top_tracks_fetched_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name or f"Artist {self.deezer_id}"
+
+    def has_fresh_top_tracks(self, limit, max_age):
+        """Whether the cached list covers `limit` tracks and is younger than `max_age` seconds"""
+        return (
+            self.top_tracks_fetched_at is not None
+            and self.top_tracks_limit >= limit
+            and timezone.now() - self.top_tracks_fetched_at < timedelta(seconds=max_age)
+        )
+
+
 class UserProfile(models.Model):
     MOOD_CHOICES = [
         ('happy', 'Happy 😊'),
@@ -43,6 +112,15 @@ class UserProfile(models.Model):
     last_mood_update = models.DateTimeField(null=True, blank=True)
     email_verified = models.BooleanField(default=False)
     verification_token = models.UUIDField(default=uuid.uuid4, editable=False)
+    # Latest end date of the user's active subscriptions, kept in sync by
+    # recommender.signals (repair drift with `manage.py repair_premium_until`)
+    premium_until = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Email verification links
+            models.Index(fields=['verification_token'], name='profile_verification_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - Profile"
@@ -53,13 +131,66 @@ class UserProfile(models.Model):
         if self.last_usage_date != today:
             self.daily_usage_count = 0
             self.last_usage_date = today
-            self.save()
+            self.save(update_fields=['daily_usage_count', 'last_usage_date'])
 
-    def increment_usage(self):
-        """Increment daily usage count"""
-        self.reset_daily_usage_if_needed()
-        self.daily_usage_count += 1
-        self.save()
+    def increment_usage(self, limit=None):
+        """
+        Count one use for today in a single UPDATE, starting from zero on a
+        new day, so concurrent requests never lose increments. With `limit`,
+        nothing is counted once today's count has reached it.
+        Returns the new count, or None if the limit refused the increment.
+        """
+        today = timezone.now().date()
+        count = UserProfile.add_usage(self.pk, 1, today, limit=limit)
+        if count is not None:
+            self.daily_usage_count = count
+            self.last_usage_date = today
+        return count
+
+    @classmethod
+    def add_usage(cls, pk, amount, day, limit=None):
+        """
+        Add `amount` uses on `day` to a profile's counter in one UPDATE (the
+        count restarts if the stored day is earlier) and return the new count.
+        With `limit`, nothing is added once the day's count has reached it,
+        and None is returned. Uses for a day earlier than the stored one are
+        dropped, also returning None.
+        """
+        table = connection.ops.quote_name(cls._meta.db_table)
+        count, usage_date, pk_column = (
+            connection.ops.quote_name(cls._meta.get_field(name).column)
+            for name in ('daily_usage_count', 'last_usage_date', 'id')
+        )
+        sql = (
+            f'UPDATE {table} SET '
+            f'{count} = CASE WHEN {usage_date} = %s THEN {count} + %s ELSE %s END, '
+            f'{usage_date} = %s '
+            f'WHERE {pk_column} = %s AND ({usage_date} IS NULL OR {usage_date} <= %s)'
+        )
+        day_value = connection.ops.adapt_datefield_value(day)
+        params = [day_value, amount, amount, day_value, pk, day_value]
+        if limit is not None:
+            sql += f' AND ({usage_date} IS NULL OR {usage_date} < %s OR {count} < %s)'
+            params += [day_value, limit]
+
+        with connection.cursor() as cursor:
+            if cls._update_returning_supported():
+                cursor.execute(f'{sql} RETURNING {count}', params)
+                row = cursor.fetchone()
+            else:
+                cursor.execute(sql, params)
+                row = None
+                if cursor.rowcount:
+                    # No UPDATE ... RETURNING on this backend, so read it back
+                    cursor.execute(f'SELECT {count} FROM {table} WHERE {pk_column} = %s', [pk])
+                    row = cursor.fetchone()
+
+        return row[0] if row is not None else None
+
+    @staticmethod
+    def _update_returning_supported():
+        # SQLite 3.35+ and PostgreSQL; MySQL/MariaDB only have INSERT ... RETURNING
+        return connection.vendor in ('sqlite', 'postgresql') and connection.features.can_return_columns_from_insert
 
     def can_use_service(self, free_limit=10):
         """Check if user can use the service based on subscription or free tier"""
@@ -74,13 +205,20 @@ class UserProfile(models.Model):
 
     def has_active_subscription(self):
         """Check if user has an active subscription"""
-        return self.user.subscriptions.filter(active=True, end_date__gte=timezone.now()).exists()
+        return self.premium_until is not None and self.premium_until >= timezone.now()
+
+    @classmethod
+    def premium_until_for(cls, user_id):
+        """Compute premium_until from the user's subscriptions"""
+        return Subscription.objects.filter(user_id=user_id, active=True).aggregate(
+            premium_until=models.Max('end_date')
+        )['premium_until']
 
     def update_mood(self, mood):
         """Update user's current mood"""
         self.current_mood = mood
         self.last_mood_update = timezone.now()
-        self.save()
+        self.save(update_fields=['current_mood', 'last_mood_update'])
 
 
 class Subscription(models.Model):
@@ -101,6 +239,14 @@ class Subscription(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # premium_until_for(): MAX(end_date) of a user's active subscriptions
+            # straight from the index; also checkout_success's lookup
+            models.Index(fields=['user', 'end_date'], condition=models.Q(active=True),
+                         name='subscription_active_idx'),
+            # Stripe webhook lookups
+            models.Index(fields=['order_id'], name='subscription_order_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.plan_type} - {'Active' if self.active else 'Inactive'}"
@@ -137,6 +283,11 @@ class Purchase(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Stripe webhook lookups
+            models.Index(fields=['order_id'], name='purchase_order_id_idx'),
+            models.Index(fields=['stripe_payment_intent_id'], name='purchase_payment_intent_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.plan_type} - ${self.amount} - {self.status}"
@@ -0,0 +1,476 @@
+import re
+import zlib
+
+import numpy as np
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+
+from .models import Song, SongNeighbor
+
+# Share of a pair's similarity score per feature; they add up to 1, so scores
+# run from 0 (nothing in common) to 1
+ARTIST_WEIGHT = 0.4
+ALBUM_WEIGHT = 0.2
+TITLE_WEIGHT = 0.2
+SENTIMENT_WEIGHT = 0.2
+# Title tokens are hashed into a vector this long
+TITLE_DIMS = 16
+# A song is only scored against its candidates: the songs nearest to it in
+# sentiment order, and the nearest in sentiment of the songs sharing its
+# artist, its album or one of its title words, this many on each side. So
+# a run grows linearly with the catalog, and a catalog of up to
+# SENTIMENT_WINDOW + 1 songs is compared exhaustively.
+SENTIMENT_WINDOW = 64
+BUCKET_WINDOW = 32
+# Title words per song used to find candidates (the title vector has them all)
+MAX_TITLE_WORDS = 8
+# Memory per (song, candidate) pair while scoring a chunk: the pair's
+# positions and sort key (int64), both songs' title vectors (float32), its
+# score, and its cell in the padded matrix top_k() runs over
+BYTES_PER_PAIR = 3 * 8 + 2 * 4 * TITLE_DIMS + 4 + (4 + 8 + 8)
+# Memory per neighbor row waiting to be written (a tuple of four numbers)
+BYTES_PER_ROW = 200
+# With more changed songs than this share of the catalog, an incremental run
+# recomputes every list instead
+FULL_RUN_SHARE = 0.2
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class SongFeatures:
+    """
+    The catalog's similarity features as NumPy arrays, one row per song in
+    id order. Songs without a Deezer artist or album id get a negative
+    placeholder of their own, so they never match another song on it. A
+    song's title words (CRC-32s of its first MAX_TITLE_WORDS distinct
+    words) are words[word_offsets[i]:word_offsets[i + 1]].
+    """
+
+    def __init__(self, ids, sentiment, artists, albums, titles, words, word_offsets):
+        self.ids = ids
+        self.sentiment = sentiment
+        self.artists = artists
+        self.albums = albums
+        self.titles = titles
+        self.words = words
+        self.word_offsets = word_offsets
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.ids, self.sentiment, self.artists, self.albums, self.titles, self.words, self.word_offsets,
+        ))
+
+    @classmethod
+    def load(cls, chunk_size=10000):
+        last_id = Song.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+        songs = Song.objects.filter(id__lte=last_id)
+        n = songs.count()
+        ids = np.empty(n, dtype=np.int64)
+        sentiment = np.zeros(n, dtype=np.float32)
+        artists = np.empty(n, dtype=np.int64)
+        albums = np.empty(n, dtype=np.int64)
+        titles = np.zeros((n, TITLE_DIMS), dtype=np.float32)
+        words = []
+        word_offsets = np.zeros(n + 1, dtype=np.int64)
+
+        i = -1
+        rows = songs.order_by('id').values_list('id', 'sentiment', 'deezer_artist_id', 'deezer_album_id', 'title')
+        for i, (song_id, score, artist_id, album_id, title) in enumerate(rows.iterator(chunk_size=chunk_size)):
+            if i >= n:
+                # Only if songs were added below last_id since the count
+                break
+            ids[i] = song_id
+            sentiment[i] = score or 0.0
+            artists[i] = artist_id if artist_id is not None else -1 - i
+            albums[i] = album_id if album_id is not None else -1 - i
+            song_words = []
+            for token in TOKEN_RE.findall(title.lower()):
+                h = zlib.crc32(token.encode('utf-8'))
+                titles[i, h % TITLE_DIMS] += 1.0 if h & 0x80000000 else -1.0
+                if len(song_words) < MAX_TITLE_WORDS and h not in song_words:
+                    song_words.append(h)
+            words += song_words
+            word_offsets[i + 1] = len(words)
+
+        n = i + 1
+        titles = titles[:n]
+        norms = np.linalg.norm(titles, axis=1)
+        np.divide(titles, norms[:, None], out=titles, where=norms[:, None] > 0)
+        return cls(
+            ids[:n], sentiment[:n], artists[:n], albums[:n], titles,
+            np.array(words, dtype=np.int64), word_offsets[:n + 1],
+        )
+
+    def positions(self, song_ids):
+        """Positions of the given song ids; ids not in the catalog are dropped"""
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        found = np.searchsorted(self.ids, song_ids)
+        found = np.minimum(found, len(self.ids) - 1)
+        return found[self.ids[found] == song_ids]
+
+    def score(self, positions, rows, candidates):
+        """
+        Similarity of each (positions[rows[i]], candidates[i]) pair of songs,
+        as float32
+        """
+        songs = positions[rows]
+        scores = np.einsum('ij,ij->i', self.titles[songs], self.titles[candidates])
+        scores *= TITLE_WEIGHT
+        distance = np.abs(self.sentiment[songs] - self.sentiment[candidates])
+        # Sentiment runs from -1 to 1, so the distance from 0 to 2
+        scores += SENTIMENT_WEIGHT - distance * (SENTIMENT_WEIGHT / 2)
+        np.add(scores, ARTIST_WEIGHT, out=scores, where=self.artists[songs] == self.artists[candidates])
+        np.add(scores, ALBUM_WEIGHT, out=scores, where=self.albums[songs] == self.albums[candidates])
+        return scores
+
+
+def _ranges(starts, lengths):
+    """range(start, start + length) for each start and length, concatenated"""
+    ends = np.cumsum(lengths)
+    return np.repeat(starts - ends + lengths, lengths) + np.arange(ends[-1] if len(ends) else 0)
+
+
+class CandidateIndex:
+    """
+    The songs each song is scored against (see SENTIMENT_WINDOW). Every
+    grouping of songs (the whole catalog, and each artist, album and title
+    word) is a run of entries sorted by sentiment, and a song's candidates
+    are the entries within `window` of its own entry in each of its groups.
+    Windows are symmetric, so every song is a candidate of its candidates,
+    which is what lets an incremental run offer a changed song's scores to
+    the lists it may enter.
+    """
+
+    def __init__(self, features, sentiment_window, bucket_window):
+        # Positions and entry numbers are int32 (a few entries per song), to
+        # halve the index and the temporaries building it
+        n = len(features)
+        songs = np.arange(n, dtype=np.int32)
+        has_artist = features.artists >= 0
+        has_album = features.albums >= 0
+        word_songs = np.repeat(songs, np.diff(features.word_offsets))
+        positions = np.concatenate([songs, songs[has_artist], songs[has_album], word_songs])
+        kinds = np.repeat(np.arange(4, dtype=np.int8), [n, has_artist.sum(), has_album.sum(), len(word_songs)])
+        keys = np.concatenate([np.zeros(n, dtype=np.int64), features.artists[has_artist],
+                               features.albums[has_album], features.words])
+        # Ties in sentiment go in id order, so candidates don't depend on load order
+        order = np.lexsort((positions, features.sentiment[positions], keys, kinds))
+        positions, kinds, keys = positions[order], kinds[order], keys[order]
+        del order
+
+        starts = np.flatnonzero(np.r_[True, (kinds[1:] != kinds[:-1]) | (keys[1:] != keys[:-1])])
+        del keys
+        sizes = np.diff(np.r_[starts, len(positions)])
+        window = np.where(kinds == 0, sentiment_window, bucket_window).astype(np.int32)
+        del kinds
+        entries = np.arange(len(positions), dtype=np.int32)
+        group_sizes = np.repeat(sizes.astype(np.int32), sizes)
+        # Entries of groups too big to be compared exhaustively
+        self.windowed = group_sizes > window + 1
+        group_edges = np.repeat(starts.astype(np.int32), sizes)
+        self.lo = np.maximum(group_edges, entries - window)
+        group_edges += group_sizes
+        self.hi = np.minimum(group_edges, entries + window + 1)
+        del group_sizes, group_edges, window, entries
+        self.positions = positions
+        # A song's own entries are by_song[song_offsets[i]:song_offsets[i + 1]]
+        self.by_song = np.argsort(positions, kind='stable').astype(np.int32)
+        self.song_offsets = np.r_[0, np.cumsum(np.bincount(positions, minlength=n))]
+        self.songs = n
+        self.max_candidates = min(2 * sentiment_window + 2 * bucket_window * (2 + MAX_TITLE_WORDS), max(n - 1, 1))
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (
+            self.positions, self.lo, self.hi, self.windowed, self.by_song, self.song_offsets,
+        ))
+
+    def pairs(self, positions, windowed_only=False):
+        """
+        (rows, candidates): the candidates of the songs at `positions`, each
+        with the index of its song in `positions`, sorted by row and then
+        candidate, without repeats or the song itself. With `windowed_only`,
+        only candidates from groups bigger than their window.
+        """
+        starts = self.song_offsets[positions]
+        counts = self.song_offsets[positions + 1] - starts
+        rows = np.repeat(np.arange(len(positions)), counts)
+        entries = self.by_song[_ranges(starts, counts)]
+        if windowed_only:
+            rows, entries = rows[self.windowed[entries]], entries[self.windowed[entries]]
+        lo, hi = self.lo[entries], self.hi[entries]
+        rows = np.repeat(rows, hi - lo)
+        candidates = self.positions[_ranges(lo, hi - lo)]
+        # A pair turns up once per group the two songs share
+        keys = rows * self.songs + candidates
+        keys.sort()
+        keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+        rows, candidates = np.divmod(keys, self.songs)
+        own = candidates == positions[rows]
+        return rows[~own], candidates[~own]
+
+
+def top_k(rows, candidates, scores, count, k):
+    """
+    Positions and scores of the k best candidates of each of `count` rows,
+    best first, from pairs sorted by row; every row needs at least k
+    """
+    per_row = np.bincount(rows, minlength=count)
+    slots = np.arange(len(rows)) - np.repeat(np.cumsum(per_row) - per_row, per_row)
+    block = np.full((count, max(per_row.max(), k)), -np.inf, dtype=np.float32)
+    block[rows, slots] = scores
+    columns = np.zeros(block.shape, dtype=np.int64)
+    columns[rows, slots] = candidates
+
+    best = np.argpartition(block, -k, axis=1)[:, -k:]
+    best_scores = np.take_along_axis(block, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    best = np.take_along_axis(best, order, axis=1)
+    return np.take_along_axis(columns, best, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+def chunk_rows_for(features, index, memory_mb, pending_rows=0):
+    """
+    How many songs can be scored against their candidates at once within
+    `memory_mb`, next to the features, the candidate index and
+    `pending_rows` rows waiting to be written
+    """
+    n = len(features)
+    fixed = features.nbytes + index.nbytes + pending_rows * BYTES_PER_ROW
+    per_song = index.max_candidates * BYTES_PER_PAIR
+    rows = (memory_mb * 2 ** 20 - fixed) // per_song
+    if rows < 1:
+        raise ValueError(
+            f"{memory_mb} MB is not enough for {n} songs; "
+            f"need at least {(fixed + per_song) // 2 ** 20 + 1} MB"
+        )
+    return int(min(rows, n))
+
+
+class NeighborWriter:
+    """
+    Replaces songs' SongNeighbor rows, `batch_size` songs per transaction.
+    Rows go in with a plain executemany, as building a model instance per
+    row costs more than the scoring does.
+    """
+
+    def __init__(self, batch_size=5000, computed_at=None):
+        self.batch_size = batch_size
+        self.computed_at = computed_at
+        self.written = 0
+        self._song_ids = []
+        self._rows = []
+
+    def add(self, song_id, neighbor_ids, scores):
+        song_id = int(song_id)
+        self._song_ids.append(song_id)
+        self._rows += [
+            (song_id, neighbor_id, rank, score)
+            for rank, (neighbor_id, score) in enumerate(zip(list(map(int, neighbor_ids)), list(map(float, scores))))
+        ]
+        if len(self._song_ids) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._song_ids:
+            return
+        table = connection.ops.quote_name(SongNeighbor._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(SongNeighbor._meta.get_field(name).column)
+            for name in ('song', 'neighbor', 'rank', 'score')
+        )
+        with transaction.atomic():
+            SongNeighbor.objects.filter(song_id__in=self._song_ids).delete()
+            with connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES (%s, %s, %s, %s)', self._rows)
+            if self.computed_at is not None:
+                Song.objects.filter(pk__in=self._song_ids).update(neighbors_computed_at=self.computed_at)
+        self.written += len(self._song_ids)
+        self._song_ids, self._rows = [], []
+
+
+def changed_song_ids(features, expected):
+    """
+    Ids of songs whose list must be recomputed: new or edited since their
+    list was computed, or whose list doesn't have `expected` rows (a
+    neighbor was deleted, or the list was computed with another k).
+    Also returns each song's current lowest neighbor score, by position.
+    """
+    last_id = int(features.ids[-1])
+    changed = set(Song.objects.filter(id__lte=last_id).filter(
+        Q(neighbors_computed_at__isnull=True) | Q(updated_at__gt=F('neighbors_computed_at'))
+    ).values_list('id', flat=True).iterator(chunk_size=10000))
+
+    lists = SongNeighbor.objects.values_list('song_id').annotate(count=Count('id'), lowest=Min('score'))
+    rows = np.array(list(lists.iterator(chunk_size=10000)), dtype=np.float64).reshape(-1, 3)
+    positions = np.minimum(np.searchsorted(features.ids, rows[:, 0]), len(features) - 1)
+    found = features.ids[positions] == rows[:, 0]
+
+    counts = np.zeros(len(features), dtype=np.int64)
+    lowest = np.full(len(features), np.inf, dtype=np.float32)
+    counts[positions[found]] = rows[found, 1]
+    lowest[positions[found]] = rows[found, 2]
+    changed.update(features.ids[counts != expected].tolist())
+    return np.array(sorted(changed), dtype=np.int64), lowest
+
+
+def lists_containing(song_ids, batch_size=5000):
+    """Ids of songs with any of `song_ids` among their neighbors"""
+    found = set()
+    for start in range(0, len(song_ids), batch_size):
+        batch = [int(song_id) for song_id in song_ids[start:start + batch_size]]
+        found.update(SongNeighbor.objects.filter(neighbor_id__in=batch).values_list('song_id', flat=True))
+    return found
+
+
+def compute_neighbors(k=10, memory_mb=512, full=False, batch_size=5000, log=None):
+    """
+    Compute every song's `k` most similar songs and store them as SongNeighbor
+    rows. A pair's score mixes whether the songs share their Deezer artist and
+    album, how close their sentiment is and how alike their titles are (a
+    hashed bag of title words), per the *_WEIGHT constants.
+
+    Songs are scored against their candidates (see CandidateIndex) a chunk
+    at a time, with the chunk sized so that the features, the index and the
+    chunk's pairs fit in `memory_mb`. Pairs that are never compared share no
+    artist, album or title word and are far apart in sentiment; in catalogs
+    of up to SENTIMENT_WINDOW + 1 songs there are none. Unless `full`, only
+    the lists of changed songs (see changed_song_ids) are recomputed; their
+    new scores are merged into the other songs' stored lists, and a list
+    that can no longer be completed from what is stored is recomputed too,
+    as are, once windows are in play, the lists around the changed songs.
+    The result is the same as a full run's, but for the odd pair that a
+    changed song's move pushed into or out of a window around its old
+    place. Returns a dict of counts.
+    """
+    log = log or (lambda message: None)
+    started = timezone.now()
+    features = SongFeatures.load()
+    n = len(features)
+    stats = {'songs': n, 'full': full, 'computed': 0, 'merged': 0, 'chunk_rows': 0, 'pairs': 0}
+    if n == 0:
+        return stats
+    expected = min(k, n - 1)
+
+    # Enough candidates in sentiment order alone for every list
+    index = CandidateIndex(features, max(SENTIMENT_WINDOW, expected), BUCKET_WINDOW)
+    chunk_rows = stats['chunk_rows'] = chunk_rows_for(features, index, memory_mb, min(batch_size, n) * expected)
+
+    lowest = None
+    nearby = np.empty(0, dtype=np.int64)
+    if full:
+        queries = np.arange(n)
+    else:
+        changed, lowest = changed_song_ids(features, expected)
+        queries = features.positions(changed)
+        if len(queries) and index.windowed.any():
+            # A changed song may have moved in sentiment order, which shifts
+            # the windows of the songs around its old place and its new one.
+            # Their own lists are redone; their scores haven't changed.
+            _rows, nearby = index.pairs(queries, windowed_only=True)
+            around = features.positions(sorted(lists_containing(features.ids[queries])))
+            nearby = np.setdiff1d(np.union1d(nearby, around), queries)
+        if len(queries) + len(nearby) > FULL_RUN_SHARE * n:
+            log(f'{len(queries)} of {n} songs changed, {len(nearby)} more around them; recomputing every list')
+            full, queries, lowest = True, np.arange(n), None
+            stats['full'] = True
+    if len(queries) == 0:
+        return stats
+
+    def write_lists(queries, writer, candidates=None):
+        for start in range(0, len(queries), chunk_rows):
+            positions = queries[start:start + chunk_rows]
+            rows, columns = index.pairs(positions)
+            scores = features.score(positions, rows, columns)
+            stats['pairs'] += len(scores)
+            if candidates is not None:
+                # Scores that would make it into another song's current list
+                hits = scores >= lowest[columns]
+                candidates.append((columns[hits], positions[rows[hits]], scores[hits]))
+            if expected:
+                best, best_scores = top_k(rows, columns, scores, len(positions), expected)
+                for position, neighbors, neighbor_scores in zip(positions, best, best_scores):
+                    writer.add(features.ids[position], features.ids[neighbors], neighbor_scores)
+            else:
+                for position in positions:
+                    writer.add(features.ids[position], [], [])
+            if start and start // chunk_rows % 100 == 0:
+                log(f'Scored {start + len(positions)} of {len(queries)} songs')
+        writer.flush()
+        return writer.written
+
+    if lowest is None:
+        stats['computed'] = write_lists(queries, NeighborWriter(batch_size, computed_at=started))
+        return stats
+
+    # Songs being recomputed take no merged candidates
+    lowest[queries] = lowest[nearby] = np.inf
+    candidates = []
+    stats['computed'] = write_lists(queries, NeighborWriter(batch_size, computed_at=started), candidates)
+    stats['computed'] += write_lists(nearby, NeighborWriter(batch_size, computed_at=started))
+    incomplete = merge_candidates(features, queries, candidates, expected, batch_size, redone=nearby)
+    stats['merged'] = incomplete['merged']
+    if len(incomplete['recompute']):
+        log(f"Recomputing {len(incomplete['recompute'])} lists that lost a neighbor")
+        stats['computed'] += write_lists(incomplete['recompute'], NeighborWriter(batch_size))
+    return stats
+
+
+def merge_candidates(features, queries, candidates, expected, batch_size, redone=()):
+    """
+    Fold the recomputed songs' new scores into the other songs' stored lists.
+    A recomputed song is dropped from every list it was in and put back only
+    if its new score still ranks; a list left short of `expected` is returned
+    for recomputing, as songs beyond its old last place may now belong in it.
+    The lists of `redone` songs were recomputed too, and are left alone.
+    """
+    recomputed = np.zeros(len(features), dtype=bool)
+    recomputed[queries] = True
+    skipped = recomputed.copy()
+    skipped[redone] = True
+
+    if candidates:
+        targets = np.concatenate([c[0] for c in candidates])
+        sources = np.concatenate([c[1] for c in candidates])
+        candidate_scores = np.concatenate([c[2] for c in candidates])
+    else:
+        targets = sources = np.empty(0, dtype=np.int64)
+        candidate_scores = np.empty(0, dtype=np.float32)
+    order = np.argsort(targets, kind='stable')
+    targets, sources, candidate_scores = targets[order], sources[order], candidate_scores[order]
+
+    affected = set(features.ids[np.unique(targets)].tolist())
+    affected.update(lists_containing(features.ids[queries]))
+    affected = sorted(song_id for song_id in affected if not skipped[features.positions([song_id])].all())
+
+    writer = NeighborWriter(batch_size)
+    recompute = []
+    for start in range(0, len(affected), batch_size):
+        batch = affected[start:start + batch_size]
+        stored = {}
+        for song_id, neighbor_id, score in SongNeighbor.objects.filter(
+            song_id__in=batch
+        ).values_list('song_id', 'neighbor_id', 'score'):
+            stored.setdefault(song_id, []).append((score, neighbor_id))
+
+        for song_id in batch:
+            position = features.positions([song_id])[0]
+            kept = [
+                (score, neighbor_id) for score, neighbor_id in stored.get(song_id, [])
+                if not recomputed[features.positions([neighbor_id])].any()
+            ]
+            lo, hi = np.searchsorted(targets, [position, position + 1])
+            kept += zip(candidate_scores[lo:hi].tolist(), features.ids[sources[lo:hi]].tolist())
+            if len(kept) < expected:
+                recompute.append(position)
+                continue
+            kept.sort(key=lambda pair: -pair[0])
+            kept = kept[:expected]
+            writer.add(song_id, [neighbor_id for _score, neighbor_id in kept], [score for score, _id in kept])
+    writer.flush()
+    return {'merged': writer.written, 'recompute': np.array(recompute, dtype=np.int64)}
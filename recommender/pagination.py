@@ -0,0 +1,94 @@
+import base64
+import binascii
+
+from rest_framework.settings import api_settings
+
+
+class SongCursorPagination:
+    """
+    Keyset (cursor) pagination over songs in id order, for the API views.
+
+    The cursor is the id of the last song on the previous page, so a page is
+    an index range scan starting right where the previous one stopped, and
+    costs the same however deep it is. PageNumberPagination's OFFSET reads
+    and discards every row before the page instead. Rows are read and
+    yielded a chunk at a time, so a page can be serialized while it streams
+    (see StreamingJSONRenderer) without holding it all in memory.
+
+    Works on plain Django requests, so the async views can use it too.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    chunk_size = 500
+
+    def __init__(self, request):
+        """Raises ValueError on a malformed cursor"""
+        self.request = request
+        self.after = self.decode_cursor(request.GET.get(self.cursor_query_param, ''))
+        self.page_size = self.get_page_size(request)
+        self.count = 0
+        self.last_id = None
+        self.has_next = False
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.GET[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE or 20
+        return max(1, min(page_size, self.max_page_size))
+
+    @staticmethod
+    def encode_cursor(last_id):
+        return base64.urlsafe_b64encode(str(last_id).encode('ascii')).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        """The id a cursor points after; an empty cursor is the first page"""
+        if not cursor:
+            return 0
+        try:
+            return int(base64.urlsafe_b64decode(cursor.encode('ascii') + b'=' * (-len(cursor) % 4)))
+        except (ValueError, binascii.Error):
+            raise ValueError('Invalid cursor')
+
+    def _page(self, queryset):
+        # One row past the page tells whether there's a next one
+        return queryset.filter(id__gt=self.after).order_by('id')[:self.page_size + 1]
+
+    def _seen(self, song):
+        """Record `song`; returns False once past the end of the page"""
+        if self.count == self.page_size:
+            self.has_next = True
+            return False
+        self.count += 1
+        self.last_id = song.id
+        return True
+
+    def rows(self, queryset):
+        """The page's songs, read from `queryset` a chunk at a time"""
+        for song in self._page(queryset).iterator(chunk_size=self.chunk_size):
+            if not self._seen(song):
+                break
+            yield song
+
+    async def arows(self, queryset):
+        """Async version of rows()"""
+        async for song in self._page(queryset).aiterator(chunk_size=self.chunk_size):
+            if not self._seen(song):
+                break
+            yield song
+
+    def get_link(self, after):
+        query = self.request.GET.copy()
+        query[self.cursor_query_param] = self.encode_cursor(after)
+        return self.request.build_absolute_uri(f'{self.request.path}?{query.urlencode()}')
+
+    def get_first_link(self):
+        return self.get_link(0)
+
+    def get_next_link(self):
+        """The next page's URL, or None on the last page; only known once rows() is consumed"""
+        if not self.has_next:
+            return None
+        return self.get_link(self.last_id)
@@ -0,0 +1,84 @@
+from collections.abc import AsyncIterator, Iterator
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+
+class StreamingJSONRenderer(JSONRenderer):
+    """
+    Renders a dict as JSON a piece at a time, for StreamingHttpResponse,
+    producing the same bytes as JSONRenderer would for the whole dict.
+
+    Values that are iterators (a generator, map() over a queryset's
+    .iterator()) are written as arrays as their items come in, so a page
+    of serialized rows is never held in memory all at once. Callables are
+    called when their key is reached, after everything before it has been
+    written: a next-page link that depends on the rows can follow them.
+    Output is flushed in chunks of about `chunk_size` bytes.
+    """
+    chunk_size = 16 * 1024
+
+    def __init__(self):
+        # One encoder for every value, set up as JSONRenderer.render() does
+        # without an indent; render() would build one per row
+        self._encoder = self.encoder_class(
+            ensure_ascii=self.ensure_ascii, allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+        )
+
+    def encode(self, value):
+        text = self._encoder.encode(value)
+        # As JSONRenderer, for embedding in JavaScript
+        return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+    def _pieces(self, data, item_pieces):
+        yield b'{'
+        for index, (key, value) in enumerate(data.items()):
+            yield (b',' if index else b'') + self.encode(key) + b':'
+            if callable(value):
+                value = value()
+            if isinstance(value, (Iterator, AsyncIterator)):
+                yield b'['
+                yield from item_pieces(value)
+                yield b']'
+            else:
+                yield self.encode(value)
+        yield b'}'
+
+    def stream(self, data):
+        """Chunks of the JSON for `data`; iterator values must be sync"""
+        def items(iterator):
+            for index, item in enumerate(iterator):
+                yield (b',' if index else b'') + self.encode(item)
+
+        buffer = bytearray()
+        for piece in self._pieces(data, items):
+            buffer += piece
+            if len(buffer) >= self.chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    async def astream(self, data):
+        """Async version of stream(); iterator values may be sync or async"""
+        buffer = bytearray()
+        for piece in self._pieces(data, lambda iterator: [iterator]):
+            if not isinstance(piece, (Iterator, AsyncIterator)):
+                buffer += piece
+            elif isinstance(piece, AsyncIterator):
+                index = 0
+                async for item in piece:
+                    buffer += (b',' if index else b'') + self.encode(item)
+                    index += 1
+                    if len(buffer) >= self.chunk_size:
+                        yield bytes(buffer)
+                        buffer.clear()
+            else:
+                for index, item in enumerate(piece):
+                    buffer += (b',' if index else b'') + self.encode(item)
+            if len(buffer) >= self.chunk_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
@@ -1,13 +1,103 @@
-from rest_framework import serializers
+from operator import attrgetter
+
+from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Song, UserProfile, Subscription, Purchase
+from .utils import SentimentAnalyzer
 from django.contrib.auth.models import User
 
 
+# The Song fields SongSerializer outputs, in order; sentiment_label comes
+# after sentiment and is computed from it
+SONG_VALUE_FIELDS = (
+    'id', 'deezer_id', 'title', 'artist', 'album', 'link', 'preview', 'cover', 'sentiment', 'created_at',
+)
+song_values = attrgetter(*SONG_VALUE_FIELDS)
+
+
+class SongListSerializer(serializers.ListSerializer):
+    """
+    SongSerializer(many=True). Builds each song's dict straight from its
+    values rather than through every field's get_attribute() and
+    to_representation(), with the same output. Querysets not yet evaluated
+    are read with values_list(), so no Song instances are built at all.
+    """
+
+    @cached_property
+    def _created_at(self):
+        """
+        created_at's DateTimeField.to_representation, with the time zone
+        looked up once for this serializer rather than once per song. Other
+        than ISO 8601 with a time zone, DRF's own method is used.
+        """
+        field = self.child.fields['created_at']
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+            return field.to_representation
+
+        def to_representation(value):
+            if isinstance(value, str) or not timezone.is_aware(value):
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+        return to_representation
+
+    @cached_property
+    def _id_type(self):
+        # str when COERCE_BIG_INT_TO_STRING is on
+        return str if getattr(self.child.fields['id'], 'coerce_to_string', False) else int
+
+    def represent_values(self, values):
+        """The representation of one song from its SONG_VALUE_FIELDS values"""
+        pk, deezer_id, title, artist, album, link, preview, cover, sentiment, created_at = values
+        if sentiment is None:
+            label = "Unknown"
+        elif sentiment > SentimentAnalyzer.POSITIVE_THRESHOLD:
+            label = "Positive"
+        elif sentiment < SentimentAnalyzer.NEGATIVE_THRESHOLD:
+            label = "Negative"
+        else:
+            label = "Neutral"
+        # DRF leaves None as None for every field
+        return {
+            'id': None if pk is None else self._id_type(int(pk)),
+            'deezer_id': None if deezer_id is None else str(deezer_id),
+            'title': None if title is None else str(title),
+            'artist': None if artist is None else str(artist),
+            'album': None if album is None else str(album),
+            'link': None if link is None else str(link),
+            'preview': None if preview is None else str(preview),
+            'cover': None if cover is None else str(cover),
+            'sentiment': None if sentiment is None else float(sentiment),
+            'sentiment_label': label,
+            'created_at': None if created_at is None else self._created_at(created_at),
+        }
+
+    def represent(self, song):
+        """The representation of one Song instance"""
+        return self.represent_values(song_values(song))
+
+    def to_representation(self, data):
+        if isinstance(data, models.manager.BaseManager):
+            data = data.all()
+        # An evaluated queryset is read from its cache, as ListSerializer does
+        if isinstance(data, models.QuerySet) and data._result_cache is None:
+            return [self.represent_values(values) for values in data.values_list(*SONG_VALUE_FIELDS)]
+        return [self.represent(song) for song in data]
+
+
 class SongSerializer(serializers.ModelSerializer):
     sentiment_label = serializers.SerializerMethodField()
 
     class Meta:
         model = Song
+        list_serializer_class = SongListSerializer
         fields = [
             'id',
             'deezer_id',
@@ -25,8 +115,7 @@ class SongSerializer(serializers.ModelSerializer):
     def get_sentiment_label(self, obj):
         if obj.sentiment is None:
             return "Unknown"
-        
-        from .utils import SentimentAnalyzer
+
         return SentimentAnalyzer.get_sentiment_label(obj.sentiment)
 
 
@@ -0,0 +1,35 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Subscription, UserProfile
+
+
+def sync_premium_until(subscription):
+    """
+    Recompute the cached premium_until of the subscription's user. A profile
+    already loaded on the subscription's user object (e.g. the one a view is
+    working with) is updated in place too, so it doesn't go stale.
+    """
+    user_id = subscription.user_id
+    premium_until = UserProfile.premium_until_for(user_id)
+
+    updated = UserProfile.objects.filter(user_id=user_id).update(premium_until=premium_until)
+    if not updated and premium_until is not None:
+        UserProfile.objects.get_or_create(user_id=user_id, defaults={'premium_until': premium_until})
+
+    if Subscription.user.is_cached(subscription) and User.profile.is_cached(subscription.user):
+        subscription.user.profile.premium_until = premium_until
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, raw=False, **kwargs):
+    # Covers Subscription.activate(), the Stripe webhook and admin edits.
+    # Queryset .update() calls bypass signals; repair_premium_until fixes those.
+    if not raw:
+        sync_premium_until(instance)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, **kwargs):
+    sync_premium_until(instance)
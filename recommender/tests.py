@@ -1,9 +1,50 @@
-from django.test import TestCase, Client
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.utils.http import http_date
+from contextlib import nullcontext
 from datetime import timedelta
-from .models import Song, UserProfile, Subscription, Purchase
-from .utils import SentimentAnalyzer
+from io import StringIO
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
+from asgiref.sync import async_to_sync
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+import base64
+import json
+import math
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+import numpy as np
+import requests
+from .models import Artist, Song, SongNeighbor, UserProfile, Subscription, Purchase
+from .urls import get_urlpatterns
+from .entitlements import get_entitlement
+from .metering import LocalMeter, usage_meter
+from .deezer_tape import TapeReader, TapeWriter, deezer_tape
+from .neighbors import CandidateIndex, SongFeatures, compute_neighbors
+from .catalog_snapshot import CatalogSnapshot, catalog_snapshot, write_snapshot
+from .pagination import SongCursorPagination
+from .serializers import SongSerializer
+from .renderers import StreamingJSONRenderer
+from .utils import (
+    DeezerAPI, AsyncDeezerAPI, DeezerCache, LocMemLRUBackend, deezer_cache, reset_deezer_session,
+    SentimentAnalyzer, StripeAPI, MoodCandidatePools, get_mood_based_recommendations, mood_pools,
+    MoodScorer, mood_scorer,
+    sample_songs_by_sentiment, ingest_deezer_tracks, polarity_memo,
+    get_song_recommendations, aget_song_recommendations,
+    get_sentiment_backend, LexiconSentimentBackend, TextBlobSentimentBackend,
+    analyze_mood_text, _detect_mood,
+)
 
 
 class SongModelTest(TestCase):
@@ -48,6 +89,37 @@ class UserProfileModelTest(TestCase):
         self.assertEqual(self.profile.daily_usage_count, 1)
         self.assertEqual(self.profile.last_usage_date, timezone.now().date())
 
+    def test_increment_usage_returns_count(self):
+        self.assertEqual(self.profile.increment_usage(), 1)
+        self.assertEqual(self.profile.increment_usage(), 2)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_usage_count, 2)
+
+    def test_increment_usage_resets_on_new_day(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            daily_usage_count=7, last_usage_date=timezone.now().date() - timedelta(days=1)
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(self.profile.increment_usage(limit=5), 1)
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_usage_count, 1)
+        self.assertEqual(self.profile.last_usage_date, timezone.now().date())
+
+    def test_increment_usage_limit(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(
+            daily_usage_count=2, last_usage_date=timezone.now().date()
+        )
+        self.assertEqual(self.profile.increment_usage(limit=3), 3)
+        self.assertIsNone(self.profile.increment_usage(limit=3))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_usage_count, 3)
+
+    def test_increment_usage_only_writes_usage_columns(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(current_mood='calm')
+        self.profile.increment_usage()
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.current_mood, 'calm')
+
     def test_reset_daily_usage(self):
         self.profile.daily_usage_count = 5
         self.profile.last_usage_date = timezone.now().date() - timedelta(days=1)
@@ -85,6 +157,127 @@ class UserProfileModelTest(TestCase):
         self.assertTrue(self.profile.can_use_service(free_limit=10))
 
 
+class PremiumUntilTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser')
+        self.profile = UserProfile.objects.create(user=self.user)
+
+    def test_activation_sets_premium_until(self):
+        subscription = Subscription.objects.create(user=self.user, plan_type='monthly')
+        self.assertFalse(self.profile.has_active_subscription())
+        subscription.activate()
+        # the profile cached on self.user is updated in place
+        self.assertEqual(self.profile.premium_until, subscription.end_date)
+        profile = UserProfile.objects.get(pk=self.profile.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(profile.has_active_subscription())
+
+    def test_latest_active_subscription_wins(self):
+        now = timezone.now()
+        Subscription.objects.create(user=self.user, plan_type='yearly', active=True, end_date=now + timedelta(days=300))
+        Subscription.objects.create(user=self.user, plan_type='monthly', active=True, end_date=now + timedelta(days=20))
+        Subscription.objects.create(user=self.user, plan_type='yearly', active=False, end_date=now + timedelta(days=900))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.premium_until, now + timedelta(days=300))
+
+    def test_expired_and_deleted_subscriptions(self):
+        subscription = Subscription.objects.create(
+            user=self.user, plan_type='monthly', active=True, end_date=timezone.now() - timedelta(days=1)
+        )
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.has_active_subscription())
+
+        subscription.delete()
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.premium_until)
+
+    def test_creates_profile_for_new_subscriber(self):
+        other = User.objects.create_user(username='other')
+        Subscription.objects.create(user=other, plan_type='monthly').activate()
+        self.assertTrue(UserProfile.objects.get(user=other).has_active_subscription())
+
+    @mock.patch.object(StripeAPI, 'verify_webhook_signature', return_value=True)
+    def test_webhook_activation(self, verify):
+        Purchase.objects.create(user=self.user, plan_type='monthly', amount=20, order_id='order-1')
+        Subscription.objects.create(user=self.user, plan_type='monthly', order_id='order-1')
+        payload = {
+            'type': 'checkout.session.completed',
+            'data': {'object': {'id': 'cs_1', 'payment_intent': 'pi_1', 'metadata': {'order_id': 'order-1'}}},
+        }
+        response = self.client.post('/webhook/stripe/', json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.has_active_subscription())
+
+    def test_repair_command(self):
+        subscription = Subscription.objects.create(user=self.user, plan_type='monthly')
+        subscription.activate()
+        # Queryset updates bypass the signals
+        Subscription.objects.filter(pk=subscription.pk).update(active=False)
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.has_active_subscription())
+
+        out = StringIO()
+        call_command('repair_premium_until', '--dry-run', stdout=out)
+        self.assertIn('1 of 1 profiles out of sync', out.getvalue())
+        self.profile.refresh_from_db()
+        self.assertIsNotNone(self.profile.premium_until)
+
+        call_command('repair_premium_until', stdout=StringIO())
+        self.profile.refresh_from_db()
+        self.assertIsNone(self.profile.premium_until)
+
+
+class UsageCounterStressTest(TransactionTestCase):
+    THREADS = 8
+    CALLS = 25
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser')
+        self.profile = UserProfile.objects.create(user=self.user)
+
+    def hammer(self, limit=None):
+        """Increment from THREADS threads at once; returns every result"""
+        results = []
+        barrier = threading.Barrier(self.THREADS)
+
+        def worker():
+            profile = UserProfile.objects.get(pk=self.profile.pk)
+            barrier.wait()
+            try:
+                for _ in range(self.CALLS):
+                    while True:
+                        try:
+                            results.append(profile.increment_usage(limit=limit))
+                            break
+                        except OperationalError:
+                            # SQLite's shared-cache test database reports
+                            # lock contention instead of waiting on it
+                            time.sleep(0.001)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_no_lost_increments(self):
+        results = self.hammer()
+        total = self.THREADS * self.CALLS
+        self.assertEqual(sorted(results), list(range(1, total + 1)))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_usage_count, total)
+
+    def test_limit_is_never_exceeded(self):
+        results = self.hammer(limit=50)
+        self.assertEqual(sorted(r for r in results if r is not None), list(range(1, 51)))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.daily_usage_count, 50)
+
+
 class SubscriptionModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -171,6 +364,1619 @@ class SentimentAnalyzerTest(TestCase):
         self.assertEqual(SentimentAnalyzer.get_sentiment_label(0.0), 'Neutral')
 
 
+class SentimentBackendTest(TestCase):
+    TEXTS = [
+        'I love this amazing wonderful song',
+        'Not Good Enough The Band',
+        'really not bad at all',
+        'very very happy!!',
+        "Don't Stop Me Now Queen",
+        'Sweet Child O\' Mine (Remastered) Guns N\' Roses',
+        'Great song (!) Mr. Brightside',
+        'sad :( but okay :-D <3',
+        'Love Story (Taylor\'s Version) Taylor Swift',
+        'U.S. Hits... feat. Someone',
+        '',
+        'zzz qqq',
+    ]
+
+    def test_lexicon_matches_textblob(self):
+        textblob, lexicon = TextBlobSentimentBackend(), LexiconSentimentBackend()
+        for text in self.TEXTS:
+            with self.subTest(text=text):
+                self.assertEqual(lexicon.polarity(text), textblob.polarity(text))
+
+    def test_setting_selects_backend(self):
+        polarity_memo.clear()
+        with override_settings(SENTIMENT_BACKEND='textblob'), \
+                mock.patch.object(TextBlobSentimentBackend, 'polarity', return_value=0.42):
+            self.assertIsInstance(get_sentiment_backend(), TextBlobSentimentBackend)
+            self.assertEqual(SentimentAnalyzer.analyze_text('anything'), 0.42)
+
+        with override_settings(SENTIMENT_BACKEND='nope'):
+            with self.assertRaises(ValueError):
+                SentimentAnalyzer.analyze_text('anything')
+
+
+class MoodTextTest(TestCase):
+    def setUp(self):
+        _detect_mood.cache_clear()
+        self.addCleanup(_detect_mood.cache_clear)
+
+    def test_first_mood_wins(self):
+        self.assertEqual(analyze_mood_text('sad but also happy'), 'happy')
+        self.assertEqual(analyze_mood_text('Feeling LONELY and angry'), 'sad')
+        # 'pumped' (energetic) outranks 'pumped up' (motivated)
+        self.assertEqual(analyze_mood_text('ready and pumped up'), 'energetic')
+
+    def test_multi_word_keywords(self):
+        self.assertEqual(analyze_mood_text('thinking about the old   times'), 'nostalgic')
+        self.assertEqual(analyze_mood_text('so in love!'), 'romantic')
+
+    def test_whole_words_only(self):
+        with mock.patch.object(SentimentAnalyzer, 'analyze_text', return_value=-0.1):
+            # not 'down', 'ready' or 'mad'
+            self.assertEqual(analyze_mood_text('I already downloaded what she made'), 'nostalgic')
+
+    def test_memoized_by_normalized_text(self):
+        with mock.patch.object(SentimentAnalyzer, 'analyze_text', return_value=0.6) as analyze:
+            self.assertEqual(analyze_mood_text('What a  Day'), 'happy')
+            self.assertEqual(analyze_mood_text('what a day'), 'happy')
+            self.assertEqual(analyze.call_count, 1)
+
+
+class MoodSamplingTest(TestCase):
+    def setUp(self):
+        for i in range(40):
+            Song.objects.create(
+                deezer_id=str(i),
+                title=f'Song {i}',
+                artist='Test Artist',
+                link=f'https://deezer.com/track/{i}',
+                sentiment=-1.0 + i * 0.05,
+            )
+        # Unscored songs must never be recommended
+        Song.objects.create(deezer_id='unscored', title='Pending', artist='Test Artist',
+                            link='https://deezer.com/track/unscored')
+        mood_pools.reset()
+
+    def test_sample_respects_range_and_limit(self):
+        songs = sample_songs_by_sentiment(0.3, 1.0, limit=5)
+        self.assertEqual(len(songs), 5)
+        self.assertEqual(len({s.pk for s in songs}), 5)
+        for song in songs:
+            self.assertGreaterEqual(song.sentiment, 0.3)
+            self.assertLessEqual(song.sentiment, 1.0)
+
+    def test_sample_returns_everything_when_range_is_small(self):
+        expected = set(Song.objects.filter(sentiment__gte=-0.2, sentiment__lte=0.2).values_list('pk', flat=True))
+        songs = sample_songs_by_sentiment(-0.2, 0.2, limit=50)
+        self.assertEqual({s.pk for s in songs}, expected)
+
+    def test_sample_empty_range(self):
+        Song.objects.filter(sentiment__gt=0.9).delete()
+        self.assertEqual(sample_songs_by_sentiment(0.95, 1.0, limit=5), [])
+
+    def test_sample_covers_whole_range(self):
+        expected = set(Song.objects.filter(sentiment__gte=0.3).values_list('pk', flat=True))
+        seen = set()
+        for _ in range(100):
+            seen.update(s.pk for s in sample_songs_by_sentiment(0.3, 1.0, limit=3))
+        self.assertEqual(seen, expected)
+
+    def test_sample_is_a_few_reads(self):
+        before = dict(Song.objects.values_list('pk', 'random_rank'))
+        with CaptureQueriesContext(connection) as queries:
+            songs = sample_songs_by_sentiment(-1.0, 1.0, limit=20)
+        self.assertEqual(len(songs), 20)
+        # A window query per pivot (two if it wraps around), then the songs
+        self.assertLessEqual(len(queries), 2 * 4 + 1)
+        self.assertTrue(all(q['sql'].lstrip().upper().startswith('SELECT') for q in queries.captured_queries))
+        self.assertEqual(dict(Song.objects.values_list('pk', 'random_rank')), before)
+
+    def test_shuffle_random_ranks(self):
+        before = dict(Song.objects.values_list('pk', 'random_rank'))
+        updated_at = dict(Song.objects.values_list('pk', 'updated_at'))
+        out = StringIO()
+        call_command('shuffle_random_ranks', '--batch-size', '7', stdout=out)
+        after = dict(Song.objects.values_list('pk', 'random_rank'))
+        self.assertIn('41 songs', out.getvalue())
+        self.assertTrue(all(before[pk] != after[pk] and 0 <= after[pk] < 1 for pk in before))
+        # Not a change the mood pools or neighbor runs need to pick up
+        self.assertEqual(dict(Song.objects.values_list('pk', 'updated_at')), updated_at)
+
+    def test_mood_recommendations_use_mood_range(self):
+        for song in get_mood_based_recommendations('sad', limit=10):
+            self.assertLessEqual(song.sentiment, -0.2)
+
+
+def make_song(deezer_id, sentiment):
+    return Song.objects.create(
+        deezer_id=str(deezer_id),
+        title=f'Song {deezer_id}',
+        artist='Test Artist',
+        link=f'https://deezer.com/track/{deezer_id}',
+        sentiment=sentiment,
+    )
+
+
+class MoodCandidatePoolsTest(TestCase):
+    def setUp(self):
+        self.happy = [make_song(f'h{i}', 0.8) for i in range(5)]
+        self.sad = [make_song(f's{i}', -0.8) for i in range(5)]
+        self.pools = MoodCandidatePools(max_size=100, refresh_interval=3600)
+        mood_pools.reset()
+
+    def test_full_load(self):
+        self.pools.refresh()
+        stats = self.pools.stats()
+        self.assertEqual(stats['moods']['happy']['size'], 5)
+        self.assertEqual(stats['moods']['sad']['size'], 5)
+        self.assertEqual(stats['moods']['calm']['size'], 0)
+        self.assertEqual(set(self.pools.sample('happy', 10)), {s.pk for s in self.happy})
+
+    def test_incremental_refresh_moves_rescored_song(self):
+        self.pools.refresh()
+        song = self.happy[0]
+        song.sentiment = -0.8
+        song.save()
+        self.pools.refresh()
+        self.assertNotIn(song.pk, self.pools.sample('happy', 10))
+        self.assertIn(song.pk, self.pools.sample('sad', 10))
+        self.assertEqual(self.pools.stats()['moods']['happy']['size'], 4)
+
+    def test_incremental_refresh_only_reads_changed_rows(self):
+        self.pools.refresh()
+        applied = self.pools.stats()['rows_applied']
+        make_song('new', 0.9)
+        self.pools.refresh()
+        # Rows re-read through the watermark overlap were applied already
+        self.assertEqual(self.pools.stats()['rows_applied'] - applied, 1)
+        self.assertEqual(self.pools.stats()['moods']['happy']['size'], 6)
+
+    def test_reservoir_caps_pool(self):
+        pools = MoodCandidatePools(max_size=3, refresh_interval=3600)
+        pools.refresh()
+        stats = pools.stats()['moods']['happy']
+        self.assertEqual(stats['size'], 3)
+        self.assertEqual(stats['seen'], 5)
+        self.assertTrue(stats['capped'])
+
+    def test_reservoir_does_not_recount_overlap(self):
+        pools = MoodCandidatePools(max_size=3, refresh_interval=3600)
+        pools.refresh()
+        pool = set(pools.sample('happy', 3))
+        for _ in range(5):
+            pools.refresh()
+        self.assertEqual(pools.stats()['moods']['happy']['seen'], 5)
+        self.assertEqual(set(pools.sample('happy', 3)), pool)
+
+    @override_settings(MOOD_POOL_REFRESH_SECONDS=3600)
+    def test_recommendations_from_warm_pool_use_one_query(self):
+        get_mood_based_recommendations('happy', limit=3)
+        with self.assertNumQueries(1):
+            songs = get_mood_based_recommendations('happy', limit=3)
+        self.assertEqual(len(songs), 3)
+        self.assertTrue(all(s.sentiment >= 0.3 for s in songs))
+
+    @override_settings(MOOD_POOL_REFRESH_SECONDS=3600)
+    def test_deleted_songs_are_dropped(self):
+        get_mood_based_recommendations('sad', limit=10)
+        self.sad[0].delete()
+        songs = get_mood_based_recommendations('sad', limit=10)
+        self.assertEqual(len(songs), 4)
+        self.assertEqual(mood_pools.stats()['moods']['sad']['size'], 4)
+
+    def test_stats_endpoint_requires_staff(self):
+        user = User.objects.create_user(username='staff', password='pass12345')
+        self.client.login(username='staff', password='pass12345')
+        self.assertEqual(self.client.get('/api/metrics/mood-pools/').status_code, 403)
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/api/metrics/mood-pools/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('seconds_since_refresh', response.json())
+
+
+@override_settings(MOOD_MATCHING='soft', MOOD_MATCH_SOFTNESS=0.5, MOOD_POOL_REFRESH_SECONDS=3600)
+class MoodScorerTest(TestCase):
+    def setUp(self):
+        # happy is (0.3, 1.0): middle 0.65, Gaussian width 0.175, cutoff at 3 widths
+        self.songs = {sentiment: make_song(f'x{sentiment}', sentiment) for sentiment in (0.65, 0.5, 0.3, 0.2, -0.5)}
+        self.scorer = MoodScorer(refresh_interval=3600)
+        self.scorer._rng = np.random.default_rng(0)
+        mood_scorer.reset()
+        self.addCleanup(mood_scorer.reset)
+
+    def sentiments(self, songs):
+        return [song.sentiment for song in songs]
+
+    def test_everything_in_reach_best_first(self):
+        self.assertEqual(self.sentiments(self.scorer.recommend('happy', limit=10)), [0.65, 0.5, 0.3, 0.2])
+
+    def test_picks_are_weighted_by_distance(self):
+        counts = {sentiment: 0 for sentiment in self.songs}
+        for _ in range(400):
+            for song in self.scorer.recommend('happy', limit=1):
+                counts[song.sentiment] += 1
+        self.assertGreater(counts[0.65], counts[0.5])
+        self.assertGreater(counts[0.5], counts[0.3])
+        self.assertGreater(counts[0.3], counts[0.2])
+        self.assertEqual(counts[-0.5], 0)
+
+    def test_refresh_applies_changes(self):
+        self.scorer.refresh()
+        song = self.songs[0.2]
+        song.sentiment = -0.5
+        song.save()
+        make_song('new', 0.7)
+        self.scorer.refresh()
+        self.assertEqual(self.sentiments(self.scorer.recommend('happy', limit=10)), [0.65, 0.7, 0.5, 0.3])
+
+        self.songs[0.65].delete()
+        self.assertEqual(self.sentiments(self.scorer.recommend('happy', limit=10)), [0.7, 0.5, 0.3])
+
+    def test_used_behind_the_setting(self):
+        get_mood_based_recommendations('happy', limit=2)
+        with self.assertNumQueries(1):
+            songs = get_mood_based_recommendations('happy', limit=10)
+        self.assertEqual(self.sentiments(songs), [0.65, 0.5, 0.3, 0.2])
+        with override_settings(MOOD_MATCHING='range'):
+            self.assertEqual(sorted(self.sentiments(get_mood_based_recommendations('happy', limit=10))),
+                             [0.3, 0.5, 0.65])
+
+    def test_reads_the_catalog_snapshot(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, 'catalog.snapshot')
+        write_snapshot(path)
+        catalog_snapshot.reset()
+        self.addCleanup(catalog_snapshot.reset)
+        with override_settings(CATALOG_SNAPSHOT={'ENABLED': True, 'PATH': path}), self.assertNumQueries(0):
+            songs = get_mood_based_recommendations('happy', limit=10)
+        self.assertEqual(self.sentiments(songs), [0.65, 0.5, 0.3, 0.2])
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        self.happy = [make_song(f'h{i}', 0.3 + i / 10) for i in range(5)]
+        self.sad = [make_song(f's{i}', -0.8) for i in range(5)]
+        Song.objects.create(deezer_id='unscored', title='Ünscored', artist='Test Artist',
+                            link='https://deezer.com/track/unscored')
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'catalog.snapshot')
+        override = override_settings(CATALOG_SNAPSHOT={'ENABLED': True, 'PATH': self.path, 'CHECK_SECONDS': 0})
+        override.enable()
+        self.addCleanup(override.disable)
+        catalog_snapshot.reset()
+        self.addCleanup(catalog_snapshot.reset)
+
+    def test_export_and_read(self):
+        count, version = write_snapshot(self.path)
+        self.assertEqual(count, 10)
+        snapshot = CatalogSnapshot(self.path)
+        self.assertEqual((len(snapshot), snapshot.version), (10, version))
+        song = snapshot.songs(snapshot.positions([self.happy[2].pk]))[0]
+        for field in ('pk', 'deezer_id', 'title', 'artist', 'album', 'link', 'preview', 'cover', 'sentiment'):
+            self.assertEqual(getattr(song, field), getattr(self.happy[2], field))
+        self.assertEqual(len(snapshot.positions([self.happy[0].pk, 999999])), 1)
+        # Partial copies, so they don't pass for rows loaded from the database
+        self.assertTrue(song._state.adding)
+        self.assertIsNone(song._state.db)
+
+    def test_sample_stays_in_range(self):
+        write_snapshot(self.path)
+        snapshot = CatalogSnapshot(self.path)
+        ids = {s.pk for s in snapshot.songs(snapshot.sample(0.3, 1.0, 10))}
+        self.assertEqual(ids, {s.pk for s in self.happy})
+        self.assertEqual(len(snapshot.sample(0.3, 1.0, 2)), 2)
+        self.assertEqual(len(snapshot.sample(0.0, 0.2, 10)), 0)
+
+    def test_mood_recommendations_skip_the_database(self):
+        write_snapshot(self.path)
+        with self.assertNumQueries(0):
+            songs = get_mood_based_recommendations('sad', limit=3)
+        self.assertEqual(len(songs), 3)
+        self.assertTrue(all(s.sentiment == -0.8 for s in songs))
+
+    def test_rebuild_swaps_in_new_version(self):
+        write_snapshot(self.path)
+        old = catalog_snapshot.get()
+        self.sad[0].delete()
+        _count, version = write_snapshot(self.path)
+        current = catalog_snapshot.get()
+        self.assertEqual((len(current), current.version), (9, version))
+        # Still readable by whoever had it mapped
+        self.assertEqual(len(old.songs(old.sample(-1.0, -0.5, 10))), 5)
+        self.assertEqual([f for f in os.listdir(os.path.dirname(self.path))], ['catalog.snapshot'])
+
+    def test_disabled_missing_or_invalid_snapshot_falls_back(self):
+        self.assertIsNone(catalog_snapshot.get())
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot')
+        with mock.patch('builtins.print'):
+            self.assertIsNone(catalog_snapshot.get())
+        write_snapshot(self.path)
+        with override_settings(CATALOG_SNAPSHOT={'ENABLED': False, 'PATH': self.path}):
+            self.assertIsNone(catalog_snapshot.get())
+        self.assertEqual(len(get_mood_based_recommendations('happy', limit=10)), 5)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_catalog_snapshot', stdout=out)
+        self.assertIn('Exported 10 songs', out.getvalue())
+        self.assertEqual(len(CatalogSnapshot(self.path)), 10)
+
+
+def fake_response(payload, status_code=200):
+    response = mock.Mock(status_code=status_code)
+    response.json.return_value = payload
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(f'{status_code} error')
+    return response
+
+
+class DeezerCacheTest(TestCase):
+    def setUp(self):
+        deezer_cache.reset()
+        self.addCleanup(deezer_cache.reset)
+
+    @mock.patch('requests.Session.get')
+    def test_repeated_lookups_hit_cache(self, get):
+        get.return_value = fake_response({'id': 1, 'title': 'Song'})
+        self.assertEqual(DeezerAPI.get_song_details(1), {'id': 1, 'title': 'Song'})
+        self.assertEqual(DeezerAPI.get_song_details('1'), {'id': 1, 'title': 'Song'})
+        self.assertEqual(get.call_count, 1)
+        self.assertEqual(deezer_cache.stats()['track'], {'hits': 1, 'misses': 1})
+
+    @mock.patch('requests.Session.get')
+    def test_search_key_is_normalized(self, get):
+        get.return_value = fake_response({'data': [{'id': 1}]})
+        DeezerAPI.search_songs('Hello  World')
+        DeezerAPI.search_songs(' hello world ')
+        self.assertEqual(get.call_count, 1)
+        DeezerAPI.search_songs('hello world', limit=5)
+        self.assertEqual(get.call_count, 2)
+
+    @mock.patch('requests.Session.get')
+    def test_failures_are_not_cached(self, get):
+        get.return_value = fake_response({}, status_code=503)
+        self.assertEqual(DeezerAPI.get_artist_top_tracks(7), [])
+        get.return_value = fake_response({'error': {'code': 4, 'message': 'Quota limit exceeded'}})
+        DeezerAPI.get_song_details(7)
+        get.return_value = fake_response({'data': [{'id': 2}]})
+        self.assertEqual(DeezerAPI.get_artist_top_tracks(7), [{'id': 2}])
+        DeezerAPI.get_song_details(7)
+        self.assertEqual(get.call_count, 4)
+
+    @override_settings(DEEZER_CACHE={'BACKEND': 'locmem', 'TIMEOUTS': {'track': 0}})
+    @mock.patch('requests.Session.get')
+    def test_zero_ttl_disables_endpoint(self, get):
+        deezer_cache.reset()
+        get.return_value = fake_response({'id': 1})
+        DeezerAPI.get_song_details(1)
+        DeezerAPI.get_song_details(1)
+        self.assertEqual(get.call_count, 2)
+
+    @override_settings(DEEZER_CACHE={'BACKEND': 'django'})
+    @mock.patch('requests.Session.get')
+    def test_django_cache_backend(self, get):
+        deezer_cache.reset()
+        deezer_cache.backend.clear()
+        get.return_value = fake_response({'data': [{'id': 3}]})
+        DeezerAPI.get_artist_top_tracks(3)
+        self.assertEqual(DeezerAPI.get_artist_top_tracks(3), [{'id': 3}])
+        self.assertEqual(get.call_count, 1)
+
+    def test_locmem_ttl_expiry(self):
+        backend = LocMemLRUBackend()
+        with mock.patch('recommender.utils.time.monotonic', return_value=100.0):
+            backend.set('key', 'value', 60)
+        with mock.patch('recommender.utils.time.monotonic', return_value=159.0):
+            self.assertEqual(backend.get('key'), (True, 'value'))
+        with mock.patch('recommender.utils.time.monotonic', return_value=161.0):
+            self.assertEqual(backend.get('key'), (False, None))
+
+    def test_locmem_lru_eviction(self):
+        backend = LocMemLRUBackend(max_entries=2)
+        backend.set('a', 1, 60)
+        backend.set('b', 2, 60)
+        backend.get('a')
+        backend.set('c', 3, 60)
+        self.assertEqual(backend.get('b'), (False, None))
+        self.assertEqual(backend.get('a'), (True, 1))
+        self.assertEqual(len(backend), 2)
+
+    def test_make_key_ignores_param_order(self):
+        self.assertEqual(
+            DeezerCache.make_key('search', {'q': 'a', 'limit': 5}),
+            DeezerCache.make_key('search', {'limit': '5', 'q': 'A'}),
+        )
+
+
+@override_settings(DEEZER_CACHE={'BACKEND': 'none'})
+class DeezerTapeTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.path = os.path.join(tmpdir.name, 'deezer.tape')
+        deezer_tape.reset()
+        self.addCleanup(deezer_tape.reset)
+
+    def use_tape(self, mode):
+        deezer_tape.reset()
+        override = override_settings(DEEZER_TAPE={'MODE': mode, 'PATH': self.path})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    @mock.patch('requests.Session.get')
+    def test_record_then_replay(self, get):
+        self.use_tape('record')
+        get.side_effect = lambda url, **kwargs: fake_response(
+            {'id': 1, 'title': 'Song'} if '/track/' in url else {'data': [{'id': 1}, {'id': 2}]}
+        )
+        results = DeezerAPI.search_songs('happy songs')
+        details = DeezerAPI.get_song_details(1)
+        self.assertEqual(get.call_count, 2)
+
+        self.use_tape('replay')
+        get.reset_mock()
+        get.side_effect = AssertionError('replay must not touch the network')
+        self.assertEqual(DeezerAPI.search_songs('Happy  Songs'), results)
+        self.assertEqual(DeezerAPI.get_song_details('1'), details)
+        self.assertEqual(async_to_sync(AsyncDeezerAPI.search_songs)('happy songs'), results)
+        self.assertEqual(async_to_sync(AsyncDeezerAPI.get_song_details)(1), details)
+        get.assert_not_called()
+
+    @mock.patch('requests.Session.get')
+    def test_replay_miss_is_a_failed_call(self, get):
+        TapeWriter(self.path).close()
+        self.use_tape('replay')
+        self.assertEqual(DeezerAPI.search_songs('unrecorded'), [])
+        self.assertIsNone(DeezerAPI.get_song_details(404))
+        self.assertEqual(async_to_sync(AsyncDeezerAPI.get_artist_top_tracks)(7), [])
+        get.assert_not_called()
+
+    @mock.patch('requests.Session.get')
+    def test_failures_are_not_recorded(self, get):
+        self.use_tape('record')
+        get.return_value = fake_response({}, status_code=503)
+        DeezerAPI.get_artist_top_tracks(7)
+        get.return_value = fake_response({'error': {'code': 4, 'message': 'Quota limit exceeded'}})
+        DeezerAPI.get_song_details(7)
+        get.return_value = fake_response({'id': 8})
+        DeezerAPI.get_song_details(8)
+        deezer_tape.reset()
+        reader = TapeReader(self.path)
+        self.assertEqual(len(reader), 1)
+        reader.close()
+
+    def test_latest_recording_wins_and_partial_tail_is_ignored(self):
+        writer = TapeWriter(self.path)
+        writer.put('a', {'v': 1})
+        writer.put('b', [1, 2, 3])
+        writer.put('a', {'v': 2})
+        writer.close()
+        with open(self.path, 'ab') as f:
+            f.write(b'\x00' * 10)  # a recorder killed mid-write
+
+        reader = TapeReader(self.path)
+        self.assertEqual(len(reader), 2)
+        self.assertEqual(reader.get('a'), {'v': 2})
+        self.assertEqual(reader.get('b'), [1, 2, 3])
+        self.assertIsNot(reader.get('b'), reader.get('b'))
+        self.assertNotIn('c', reader)
+        reader.close()
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a tape')
+        with self.assertRaises(ValueError):
+            TapeReader(self.path)
+
+
+class StandInDeezerHandler(BaseHTTPRequestHandler):
+    """Serves scripted responses: each entry is (status, payload, delay, headers)"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, self.client_address))
+            status, payload, delay, headers = server.script.pop(0) if server.script else (200, {'data': []}, 0, {})
+        if delay:
+            time.sleep(delay)
+        body = json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@override_settings(
+    DEEZER_CACHE={'BACKEND': 'none'},
+    DEEZER_HTTP={'CONNECT_TIMEOUT': 1, 'READ_TIMEOUT': 0.5, 'MAX_RETRIES': 2,
+                 'BACKOFF_FACTOR': 0.01, 'BACKOFF_MAX': 0.05},
+)
+class DeezerHTTPClientTest(TestCase):
+    """DeezerAPI against a local stand-in for api.deezer.com"""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInDeezerHandler)
+        self.server.daemon_threads = True
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.script = []
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        patcher = mock.patch.object(DeezerAPI, 'BASE_URL', f'http://127.0.0.1:{self.server.server_port}')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        deezer_cache.reset()
+        reset_deezer_session()
+        self.addCleanup(deezer_cache.reset)
+        self.addCleanup(reset_deezer_session)
+
+    def test_connections_are_reused(self):
+        for _ in range(3):
+            self.server.script.append((200, {'data': [{'id': 1}]}, 0, {}))
+        for _ in range(3):
+            self.assertEqual(DeezerAPI.search_songs('keep alive'), [{'id': 1}])
+        client_ports = {address[1] for path, address in self.server.requests}
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(len(client_ports), 1)
+
+    def test_retries_server_errors(self):
+        self.server.script = [
+            (503, {}, 0, {}),
+            (502, {}, 0, {}),
+            (200, {'id': 5, 'title': 'Recovered'}, 0, {}),
+        ]
+        self.assertEqual(DeezerAPI.get_song_details(5)['title'], 'Recovered')
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_retry_after_is_bounded(self):
+        self.server.script = [
+            (429, {}, 0, {'Retry-After': '3600'}),
+            (200, {'data': [{'id': 9}]}, 0, {}),
+        ]
+        started = time.monotonic()
+        self.assertEqual(DeezerAPI.get_artist_top_tracks(9), [{'id': 9}])
+        self.assertLess(time.monotonic() - started, 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.script = [(500, {}, 0, {})] * 5
+        self.assertEqual(DeezerAPI.search_songs('down'), [])
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_read_timeout(self):
+        self.server.script = [(200, {'data': [{'id': 1}]}, 2, {})] * 3
+        started = time.monotonic()
+        self.assertEqual(DeezerAPI.search_songs('slow'), [])
+        # Three attempts at a 0.5s read timeout, never the full 2s stall each
+        self.assertLess(time.monotonic() - started, 3)
+
+    async def test_async_retries_server_errors(self):
+        self.server.script = [
+            (503, {}, 0, {}),
+            (429, {}, 0, {'Retry-After': '3600'}),
+            (200, {'id': 5, 'title': 'Recovered'}, 0, {}),
+        ]
+        song = await AsyncDeezerAPI.get_song_details(5)
+        self.assertEqual(song['title'], 'Recovered')
+        self.assertEqual(len(self.server.requests), 3)
+
+    async def test_async_gives_up_after_max_retries(self):
+        self.server.script = [(500, {}, 0, {})] * 5
+        self.assertEqual(await AsyncDeezerAPI.search_songs('down'), [])
+        self.assertEqual(len(self.server.requests), 3)
+
+    async def test_async_read_timeout(self):
+        self.server.script = [(200, {'data': [{'id': 1}]}, 2, {})] * 3
+        self.assertEqual(await AsyncDeezerAPI.get_artist_top_tracks(1), [])
+
+    async def test_async_connections_are_reused(self):
+        for _ in range(3):
+            self.server.script.append((200, {'data': [{'id': 1}]}, 0, {}))
+        for _ in range(3):
+            self.assertEqual(await AsyncDeezerAPI.search_songs('keep alive'), [{'id': 1}])
+        client_ports = {address[1] for path, address in self.server.requests}
+        self.assertEqual(len(client_ports), 1)
+
+
+TOP_TRACKS = [
+    {
+        'id': 2000 + i,
+        'title': f'Top Track {i}',
+        'link': f'https://deezer.com/track/{2000 + i}',
+        'preview': f'https://cdn.deezer.com/preview/{2000 + i}.mp3',
+        'artist': {'id': 77, 'name': 'Test Artist'},
+        'album': {'id': 88, 'title': 'Test Album', 'cover_medium': 'https://cdn.deezer.com/cover.jpg'},
+    }
+    for i in range(3)
+]
+
+class AsyncURLConf:
+    """URLconf serving the async views, as on the ASGI entry point"""
+    urlpatterns = get_urlpatterns(async_views=True)
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf, DEEZER_CACHE={'BACKEND': 'none'})
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.song = Song.objects.create(
+            deezer_id='1', title='Happy Song', artist='Test Artist',
+            link='https://deezer.com/track/1', sentiment=0.8,
+        )
+        self.patchers = [
+            mock.patch.object(AsyncDeezerAPI, 'get_song_details',
+                              mock.AsyncMock(return_value={'id': 1, 'artist': {'id': 77}})),
+            mock.patch.object(AsyncDeezerAPI, 'get_artist_top_tracks',
+                              mock.AsyncMock(return_value=TOP_TRACKS)),
+            mock.patch.object(AsyncDeezerAPI, 'search_songs',
+                              mock.AsyncMock(return_value=TOP_TRACKS)),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_api_recommend_matches_sync_view(self):
+        async_response = self.client.get('/api/recommend/1/')
+        self.assertEqual(async_response.status_code, 200)
+        with override_settings(ROOT_URLCONF='song_recommender.urls'), \
+                mock.patch.object(DeezerAPI, 'get_song_details', return_value={'id': 1, 'artist': {'id': 77}}), \
+                mock.patch.object(DeezerAPI, 'get_artist_top_tracks', return_value=TOP_TRACKS):
+            sync_response = self.client.get('/api/recommend/1/', HTTP_ACCEPT='application/json')
+        self.assertEqual(async_response.content, sync_response.content)
+        self.assertEqual(len(async_response.json()['recommendations']), 3)
+
+    def test_api_recommend_not_found(self):
+        self.assertEqual(self.client.get('/api/recommend/404/').status_code, 404)
+
+    def test_api_search_requires_login(self):
+        self.assertEqual(self.client.get('/api/search/?q=test').status_code, 401)
+
+    def basic_auth(self, password):
+        credentials = base64.b64encode(f'testuser:{password}'.encode()).decode()
+        return {'HTTP_AUTHORIZATION': f'Basic {credentials}'}
+
+    def test_api_search_basic_auth(self):
+        response = self.client.get('/api/search/?q=test', **self.basic_auth('testpass123'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['usage_count'], 1)
+
+    def test_api_bad_credentials_match_sync_views(self):
+        for path in ('/api/search/?q=test', '/api/recommend/1/'):
+            async_response = self.client.get(path, **self.basic_auth('wrong'))
+            with override_settings(ROOT_URLCONF='song_recommender.urls'):
+                sync_response = self.client.get(path, HTTP_ACCEPT='application/json', **self.basic_auth('wrong'))
+            self.assertEqual(async_response.status_code, sync_response.status_code)
+            self.assertEqual(async_response.content, sync_response.content)
+
+    def test_api_search(self):
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get('/api/search/?q=test')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([r['deezer_id'] for r in data['results']], ['2000', '2001', '2002'])
+        self.assertEqual(data['usage_count'], 1)
+
+    def test_search_page(self):
+        self.assertEqual(self.client.get('/search/?q=test').status_code, 302)
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get('/search/?q=test')
+        self.assertContains(response, 'Top Track 1')
+
+    def test_song_detail_page(self):
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get('/song/1/')
+        self.assertContains(response, 'Top Track 2')
+        self.assertEqual(self.client.get('/song/404/').status_code, 404)
+
+    def test_song_detail_page_unscored(self):
+        Song.objects.update(sentiment=None)
+        self.client.login(username='testuser', password='testpass123')
+        response = self.client.get('/song/1/')
+        self.assertContains(response, 'Pending')
+        self.assertContains(response, 'Top Track 2')
+        self.assertNotContains(response, 'Neutral')
+
+
+
+def streamed_json(response):
+    """The JSON body of a streaming response, sync or async"""
+    if response.is_async:
+        async def join():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        return json.loads(async_to_sync(join)())
+    return json.loads(b''.join(response.streaming_content))
+
+
+@override_settings(DEEZER_CACHE={'BACKEND': 'none'}, FREE_USAGE_LIMIT=100)
+class SongCursorPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='testpass123')
+        Song.objects.bulk_create([
+            Song(deezer_id=str(i), title=f'Love Song {i}' if i % 3 else f'Other {i}', artist='Test Artist',
+                 link=f'https://deezer.com/track/{i}', sentiment=0.5 if i % 2 else None)
+            for i in range(1, 61)
+        ])
+        cls.matching = list(Song.objects.filter(title__icontains='love').order_by('id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.login(username='testuser', password='testpass123')
+
+    def walk(self, url):
+        """Follow `next` links from `url`; returns the pages' bodies"""
+        pages = []
+        while url:
+            with mock.patch.object(DeezerAPI, 'search_songs') as search:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            search.assert_not_called()
+            pages.append(streamed_json(response))
+            url = pages[-1]['next']
+        return pages
+
+    def test_pages_cover_every_match_once_in_id_order(self):
+        pages = self.walk('/api/search/?q=love&cursor=&page_size=7')
+        self.assertEqual([len(page['results']) for page in pages], [7, 7, 7, 7, 7, 5])
+        self.assertEqual([r['id'] for page in pages for r in page['results']], self.matching)
+        self.assertIsNone(pages[-1]['next'])
+        self.assertEqual(pages[-1]['usage_count'], 6)
+
+    def test_rows_match_song_serializer(self):
+        page = self.walk('/api/search/?q=love&cursor=&page_size=1000')[0]
+        songs = Song.objects.filter(id__in=self.matching).order_by('id')
+        self.assertEqual(page['results'], json.loads(JSONRenderer().render(SongSerializer(songs, many=True).data)))
+
+    def test_async_view_streams_the_same_pages(self):
+        sync_pages = self.walk('/api/search/?q=love&cursor=&page_size=9')
+        with override_settings(ROOT_URLCONF=AsyncURLConf), \
+                mock.patch.object(AsyncDeezerAPI, 'search_songs', mock.AsyncMock()) as search:
+            async_pages = self.walk('/api/search/?q=love&cursor=&page_size=9')
+        search.assert_not_called()
+        self.assertEqual([p['results'] for p in async_pages], [p['results'] for p in sync_pages])
+        self.assertEqual([p['next'] for p in async_pages], [p['next'] for p in sync_pages])
+
+    def test_first_search_page_links_to_stored_matches(self):
+        with mock.patch.object(DeezerAPI, 'search_songs', return_value=[]):
+            data = self.client.get('/api/search/?q=love', HTTP_ACCEPT='application/json').json()
+        self.assertEqual(data['results'], [])
+        pages = self.walk(data['next'])
+        self.assertEqual(len(pages[0]['results']), 20)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/search/?q=love&cursor=%21%21')
+        self.assertEqual(response.status_code, 400)
+        # Not counted as a search
+        self.assertEqual(self.walk('/api/search/?q=love&cursor=')[0]['usage_count'], 1)
+
+    def test_page_size_is_capped(self):
+        request = mock.Mock(GET={'page_size': '100000'})
+        self.assertEqual(SongCursorPagination(request).page_size, SongCursorPagination.max_page_size)
+        request = mock.Mock(GET={'page_size': 'lots'})
+        self.assertEqual(SongCursorPagination(request).page_size, 20)
+
+    def test_cursor_round_trip(self):
+        for last_id in (0, 1, 99, 123456789):
+            cursor = SongCursorPagination.encode_cursor(last_id)
+            self.assertNotIn('=', cursor)
+            self.assertEqual(SongCursorPagination.decode_cursor(cursor), last_id)
+
+
+
+class SongListSerializerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        sentiments = [None, 0.3, 0.30001, -0.3, -0.30001, 0.0, 1.0, -1.0, 0.5]
+        for i, sentiment in enumerate(sentiments):
+            Song.objects.create(
+                deezer_id=str(i), title=f'S\u00f8ng {i}\u2028"quoted"', artist='Test Artist',
+                album='' if i % 2 else 'Album',
+                link=f'https://deezer.com/track/{i}', preview='', cover=f'https://cdn.deezer.com/{i}.jpg',
+                sentiment=sentiment,
+            )
+
+    def assertSameJSON(self, data):
+        """SongSerializer(many=True) renders `data` exactly as DRF's field-by-field ListSerializer"""
+        # Fast path first, so a queryset is still unevaluated
+        rendered = JSONRenderer().render(SongSerializer(data, many=True).data)
+        expected = JSONRenderer().render(serializers.ListSerializer(child=SongSerializer(), instance=data).data)
+        self.assertEqual(rendered, expected)
+
+    def test_instances_match_field_by_field_serializer(self):
+        self.assertSameJSON(list(Song.objects.order_by('id')))
+
+    def test_queryset_matches_field_by_field_serializer(self):
+        self.assertSameJSON(Song.objects.order_by('-id'))
+        with self.assertNumQueries(1):
+            self.assertEqual(len(SongSerializer(Song.objects.all(), many=True).data), 9)
+
+    def test_evaluated_queryset_is_not_read_again(self):
+        songs = Song.objects.order_by('id')
+        list(songs)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(SongSerializer(songs, many=True).data), 9)
+
+    def test_unsaved_songs(self):
+        # As built by the catalog snapshot, with no created_at
+        self.assertSameJSON([Song(deezer_id='x', title='Unsaved', artist='A', link='https://x', sentiment=0.9)])
+
+    @override_settings(TIME_ZONE='America/New_York')
+    def test_other_time_zones(self):
+        with timezone.override('Asia/Kolkata'):
+            self.assertSameJSON(list(Song.objects.all()))
+
+    def test_labels_use_the_sentiment_thresholds(self):
+        labels = {r['sentiment']: r['sentiment_label'] for r in SongSerializer(Song.objects.all(), many=True).data}
+        self.assertEqual(labels[None], 'Unknown')
+        self.assertEqual(labels[0.3], 'Neutral')
+        self.assertEqual(labels[0.30001], 'Positive')
+        self.assertEqual(labels[-0.30001], 'Negative')
+        with mock.patch.object(SentimentAnalyzer, 'POSITIVE_THRESHOLD', 0.6):
+            self.assertSameJSON(list(Song.objects.all()))
+            self.assertEqual(SongSerializer(Song.objects.get(sentiment=0.5)).data['sentiment_label'], 'Neutral')
+
+class StreamingJSONRendererTest(TestCase):
+    def data(self):
+        rows = [{'id': i, 'title': f'S\u00f8ng {i}\u2028', 'at': timezone.now().replace(microsecond=0), 'x': None}
+                for i in range(500)]
+        return rows, {'query': 'q', 'results': iter(rows), 'empty': iter([]), 'next': lambda: None, 'n': 1.5}
+
+    def expected(self, rows):
+        return JSONRenderer().render({'query': 'q', 'results': rows, 'empty': [], 'next': None, 'n': 1.5})
+
+    def test_stream_matches_json_renderer(self):
+        renderer = StreamingJSONRenderer()
+        renderer.chunk_size = 1024
+        rows, data = self.data()
+        chunks = list(renderer.stream(data))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(b''.join(chunks), self.expected(rows))
+
+    def test_astream_matches_json_renderer(self):
+        rows, data = self.data()
+
+        async def results():
+            for row in rows:
+                yield row
+
+        async def join():
+            return b''.join([chunk async for chunk in StreamingJSONRenderer().astream({**data, 'results': results()})])
+
+        self.assertEqual(async_to_sync(join)(), self.expected(rows))
+
+    def test_callables_run_after_the_rows_before_them(self):
+        seen = []
+        rows = ({'id': i} for i in range(3) if not seen.append(i))
+        body = b''.join(StreamingJSONRenderer().stream({'results': rows, 'count': lambda: len(seen)}))
+        self.assertEqual(json.loads(body), {'results': [{'id': 0}, {'id': 1}, {'id': 2}], 'count': 3})
+
+
+
+@override_settings(DEEZER_CACHE={'BACKEND': 'none'}, SONG_API_MAX_AGE=300, RECOMMEND_API_MAX_AGE=60)
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.songs = [
+            Song.objects.create(deezer_id=str(i), title=f'Song {i}', artist='Test Artist',
+                                link=f'https://deezer.com/track/{i}', sentiment=0.1 * i)
+            for i in range(1, 5)
+        ]
+        self.song = self.songs[0]
+        patcher = mock.patch('recommender.views.get_song_recommendations', return_value=self.songs[1:])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, path, **headers):
+        return self.client.get(path, HTTP_ACCEPT='application/json', **headers)
+
+    def test_song_detail_validators_and_cache_control(self):
+        response = self.get('/api/song/1/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertEqual(response['Last-Modified'], http_date(self.song.updated_at.timestamp()))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        self.assertIn('Accept', response['Vary'])
+
+    def test_song_detail_not_modified_without_serializing(self):
+        etag = self.get('/api/song/1/')['ETag']
+        with mock.patch.object(SongSerializer, 'to_representation') as to_representation:
+            response = self.get('/api/song/1/', HTTP_IF_NONE_MATCH=etag)
+        to_representation.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+
+    def test_song_detail_changes_with_updated_at(self):
+        etag = self.get('/api/song/1/')['ETag']
+        self.song.title = 'Renamed'
+        self.song.save()
+        response = self.get('/api/song/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_if_modified_since(self):
+        last_modified = self.get('/api/song/1/')['Last-Modified']
+        self.assertEqual(self.get('/api/song/1/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+        earlier = http_date(self.song.updated_at.timestamp() - 60)
+        self.assertEqual(self.get('/api/song/1/', HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_representations_have_their_own_etags(self):
+        html = self.client.get('/api/song/1/', HTTP_ACCEPT='text/html')
+        self.assertNotEqual(html['ETag'], self.get('/api/song/1/')['ETag'])
+
+    def test_recommend_etag_follows_the_recommended_set(self):
+        response = self.get('/api/recommend/1/')
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.get('/api/recommend/1/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # A recommended song changes
+        Song.objects.filter(pk=self.songs[2].pk).update(updated_at=timezone.now() + timedelta(seconds=5))
+        self.songs[2].refresh_from_db()
+        response = self.get('/api/recommend/1/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # The set itself changes
+        etag = response['ETag']
+        with mock.patch('recommender.views.get_song_recommendations', return_value=self.songs[:0:-1]):
+            self.assertEqual(self.get('/api/recommend/1/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_recommend_has_no_last_modified(self):
+        # A new set of older songs would pass an If-Modified-Since check
+        response = self.get('/api/recommend/1/')
+        self.assertNotIn('Last-Modified', response)
+        later = http_date(timezone.now().timestamp() + 60)
+        with mock.patch('recommender.views.get_song_recommendations', return_value=self.songs[:0:-1]):
+            self.assertEqual(self.get('/api/recommend/1/', HTTP_IF_MODIFIED_SINCE=later).status_code, 200)
+
+    def test_async_recommend_matches_sync_etag(self):
+        etag = self.get('/api/recommend/1/')['ETag']
+        with override_settings(ROOT_URLCONF=AsyncURLConf), \
+                mock.patch('recommender.views.aget_song_recommendations',
+                           mock.AsyncMock(return_value=self.songs[1:])):
+            response = self.client.get('/api/recommend/1/')
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+            self.assertEqual(self.client.get('/api/recommend/1/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertNotIn('Last-Modified', response)
+
+
+def make_track(track_id, preview=True):
+    return {
+        'id': track_id,
+        'title': f'Track {track_id}',
+        'link': f'https://deezer.com/track/{track_id}',
+        'preview': f'https://cdn.deezer.com/preview/{track_id}.mp3' if preview else '',
+        'artist': {'id': 77, 'name': 'Test Artist'},
+        'album': {'id': 88, 'title': 'Test Album', 'cover_medium': 'https://cdn.deezer.com/cover.jpg'},
+    }
+
+
+class IngestDeezerTracksTest(TestCase):
+    def test_new_batch_uses_two_queries(self):
+        tracks = [make_track(i) for i in range(20)]
+        with self.assertNumQueries(2):
+            songs = ingest_deezer_tracks(tracks)
+        self.assertEqual([s.deezer_id for s in songs], [str(i) for i in range(20)])
+        self.assertTrue(all(s.pk is not None and s.sentiment is not None for s in songs))
+        self.assertEqual(Song.objects.count(), 20)
+
+    def test_mixed_batch_uses_three_queries(self):
+        make_song('1', 0.5)
+        Song.objects.create(deezer_id='2', title='Pending', artist='Test Artist', link='https://deezer.com/track/2')
+        tracks = [make_track(i) for i in (3, 2, 1, 4, 3)]
+        with self.assertNumQueries(3):
+            songs, created = ingest_deezer_tracks(tracks, return_created=True)
+        # Original order, duplicates dropped
+        self.assertEqual([s.deezer_id for s in songs], ['3', '2', '1', '4'])
+        self.assertEqual(created, {'3', '4'})
+        self.assertIsNotNone(Song.objects.get(deezer_id='2').sentiment)
+        # Existing songs are not overwritten
+        self.assertEqual(Song.objects.get(deezer_id='1').title, 'Song 1')
+        self.assertEqual(Song.objects.get(deezer_id='1').sentiment, 0.5)
+
+    def test_known_songs_use_one_query(self):
+        ingest_deezer_tracks([make_track(i) for i in range(5)])
+        with self.assertNumQueries(1):
+            songs = ingest_deezer_tracks([make_track(i) for i in range(5)])
+        self.assertEqual(len(songs), 5)
+
+    def test_without_scoring(self):
+        songs = ingest_deezer_tracks([make_track(1)], score=False)
+        self.assertIsNone(songs[0].sentiment)
+
+    def test_stores_deezer_artist_and_album_ids(self):
+        make_song('1', 0.5)
+        with self.assertNumQueries(3):
+            ingest_deezer_tracks([make_track(1), make_track(2)])
+        for song in Song.objects.filter(deezer_id__in=['1', '2']):
+            self.assertEqual((song.deezer_artist_id, song.deezer_album_id), (77, 88))
+
+    def test_empty_batch(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(ingest_deezer_tracks([]), [])
+
+    @mock.patch.object(DeezerAPI, 'search_songs')
+    def test_search_query_count_does_not_grow_with_results(self, search):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Subscription.objects.create(user=user, plan_type='monthly', active=True,
+                                    start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30))
+        self.client.login(username='testuser', password='testpass123')
+        counts = []
+        # The first request also creates the profile; compare the later two
+        for first, size in ((0, 1), (50, 2), (100, 20)):
+            search.return_value = [make_track(i) for i in range(first, first + size)] + [make_track(999, preview=False)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/search/?q=test')
+            self.assertEqual(len(response.json()['results']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[1], counts[2])
+
+    @mock.patch.object(DeezerAPI, 'search_songs')
+    def test_seed_songs_command(self, search):
+        make_song('1', 0.5)
+        search.return_value = [make_track(1), make_track(2), make_track(3, preview=False)]
+        out = StringIO()
+        call_command('seed_songs', '--q', 'pop', '--limit', '3', stdout=out)
+        self.assertIn('Skipped (no preview): Track 3', out.getvalue())
+        self.assertIn('Created: 1, Already existed: 1', out.getvalue())
+        self.assertTrue(Song.objects.filter(deezer_id='2').exists())
+
+
+@override_settings(ARTIST_TOP_TRACKS_MAX_AGE=3600)
+class ArtistRecommendationsTest(TestCase):
+    def setUp(self):
+        self.song = Song.objects.create(
+            deezer_id='1', title='Happy Song', artist='Test Artist', link='https://deezer.com/track/1',
+        )
+        self.details = mock.patch.object(DeezerAPI, 'get_song_details',
+                                         return_value={'id': 1, 'artist': {'id': 77}, 'album': {'id': 88}}).start()
+        self.top_tracks = mock.patch.object(DeezerAPI, 'get_artist_top_tracks', return_value=TOP_TRACKS).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def recommended_ids(self, song, limit=10):
+        return [s.deezer_id for s in get_song_recommendations(song, limit=limit)]
+
+    def test_unknown_artist_is_looked_up_once(self):
+        self.assertEqual(self.recommended_ids(self.song), ['2000', '2001', '2002'])
+        self.song.refresh_from_db()
+        self.assertEqual((self.song.deezer_artist_id, self.song.deezer_album_id), (77, 88))
+        self.assertEqual(Artist.objects.get(deezer_id=77).top_track_ids, ['2000', '2001', '2002'])
+
+        self.assertEqual(self.recommended_ids(self.song), ['2000', '2001', '2002'])
+        self.details.assert_called_once()
+        self.top_tracks.assert_called_once_with(77, limit=10)
+
+    def test_fresh_top_tracks_skip_deezer(self):
+        self.recommended_ids(self.song)
+        self.details.reset_mock()
+        self.top_tracks.reset_mock()
+        other = Song.objects.get(deezer_id='2001')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.recommended_ids(other), ['2000', '2002'])
+        self.assertEqual(self.recommended_ids(other, limit=1), ['2000'])
+        self.details.assert_not_called()
+        self.top_tracks.assert_not_called()
+
+    def test_stale_or_short_list_is_refetched(self):
+        self.recommended_ids(self.song, limit=3)
+        self.recommended_ids(self.song, limit=5)
+        self.assertEqual(self.top_tracks.call_count, 2)
+        self.assertEqual(Artist.objects.get(deezer_id=77).top_tracks_limit, 5)
+
+        Artist.objects.update(top_tracks_fetched_at=timezone.now() - timedelta(hours=2))
+        self.recommended_ids(self.song, limit=5)
+        self.assertEqual(self.top_tracks.call_count, 3)
+        self.details.assert_called_once()
+
+    def test_failed_lookup_is_not_kept(self):
+        self.top_tracks.return_value = []
+        self.assertEqual(self.recommended_ids(self.song), [])
+        self.assertFalse(Artist.objects.exists())
+        self.top_tracks.return_value = TOP_TRACKS
+        self.assertEqual(self.recommended_ids(self.song), ['2000', '2001', '2002'])
+
+    def test_async_version_reads_the_same_cache(self):
+        self.recommended_ids(self.song)
+        with mock.patch.object(AsyncDeezerAPI, 'get_artist_top_tracks') as top_tracks:
+            songs = async_to_sync(aget_song_recommendations)(self.song)
+        top_tracks.assert_not_called()
+        self.assertEqual([s.deezer_id for s in songs], ['2000', '2001', '2002'])
+
+
+class SongNeighborsTest(TestCase):
+    WORDS = ['love', 'night', 'summer', 'rain', 'fire', 'heart', 'dance', 'blue']
+
+    def setUp(self):
+        self.rng = random.Random(0)
+        for i in range(60):
+            self.add_song(i)
+
+    def add_song(self, i):
+        words = self.rng.sample(self.WORDS, 2)
+        return Song.objects.create(
+            deezer_id=str(i), title=' '.join(words), artist=f'Artist {i % 7}',
+            link=f'https://deezer.com/track/{i}', sentiment=self.rng.uniform(-1, 1),
+            deezer_artist_id=i % 7 or None, deezer_album_id=i % 13,
+        )
+
+    def table(self):
+        return sorted(SongNeighbor.objects.values_list('song_id', 'rank', 'neighbor_id'))
+
+    def expected_table(self, k):
+        """Every song's k best neighbors, scored one pair at a time"""
+        features = SongFeatures.load()
+        ids = features.ids.tolist()
+        rows = []
+        for i, song_id in enumerate(ids):
+            scores = []
+            for j, other_id in enumerate(ids):
+                if i != j:
+                    score = (
+                        0.4 * (features.artists[i] == features.artists[j])
+                        + 0.2 * (features.albums[i] == features.albums[j])
+                        + 0.2 * float(features.titles[i] @ features.titles[j])
+                        + 0.2 * (1 - abs(float(features.sentiment[i]) - float(features.sentiment[j])) / 2)
+                    )
+                    scores.append((-score, other_id))
+            rows += [(song_id, rank, other_id) for rank, (_score, other_id) in enumerate(sorted(scores)[:k])]
+        return sorted(rows)
+
+    def test_full_run_matches_pairwise_scores(self):
+        stats = compute_neighbors(k=5, memory_mb=1, full=True)
+        self.assertEqual((stats['songs'], stats['computed']), (60, 60))
+        self.assertEqual(self.table(), self.expected_table(5))
+        self.assertEqual(Song.objects.filter(neighbors_computed_at__isnull=True).count(), 0)
+
+    @mock.patch('recommender.neighbors.FULL_RUN_SHARE', 0.5)
+    def test_incremental_run_matches_full_run(self):
+        compute_neighbors(k=5)
+        self.assertEqual(compute_neighbors(k=5)['computed'], 0)
+
+        for song in Song.objects.order_by('id')[:4]:
+            song.sentiment = -song.sentiment
+            song.save()
+        Song.objects.order_by('id')[10].delete()
+        self.add_song(100)
+        stats = compute_neighbors(k=5)
+        self.assertFalse(stats['full'])
+        self.assertLess(stats['computed'], stats['songs'] / 2)
+        self.assertGreater(stats['merged'], 0)
+        self.assertEqual(self.table(), self.expected_table(5))
+
+    def test_candidates_are_symmetric_and_capped(self):
+        features = SongFeatures.load()
+        index = CandidateIndex(features, sentiment_window=3, bucket_window=2)
+        rows, candidates = index.pairs(np.arange(len(features)))
+        pairs = set(zip(rows.tolist(), candidates.tolist()))
+        self.assertEqual(pairs, {(b, a) for a, b in pairs})
+        self.assertLess(len(pairs), len(features) * (len(features) - 1))
+        # The songs nearest in sentiment overall and among the same artist's
+        by_sentiment = sorted(range(len(features)), key=lambda i: (features.sentiment[i], i))
+        for rank in range(len(by_sentiment) - 3):
+            self.assertIn((by_sentiment[rank], by_sentiment[rank + 3]), pairs)
+        same_artist = [i for i in by_sentiment if features.artists[i] == features.artists[0]]
+        for a, b in zip(same_artist, same_artist[2:]):
+            self.assertIn((a, b), pairs)
+
+    @mock.patch('recommender.neighbors.BUCKET_WINDOW', 2)
+    @mock.patch('recommender.neighbors.SENTIMENT_WINDOW', 5)
+    def test_windowed_run_keeps_the_best_candidates(self):
+        stats = compute_neighbors(k=5, full=True)
+        self.assertLess(stats['pairs'], 60 * 59)
+        features = SongFeatures.load()
+        index = CandidateIndex(features, sentiment_window=5, bucket_window=2)
+        rows, candidates = index.pairs(np.arange(len(features)))
+        scores = features.score(np.arange(len(features)), rows, candidates)
+        best = {}
+        for row, candidate, score in zip(rows.tolist(), candidates.tolist(), scores.tolist()):
+            best.setdefault(int(features.ids[row]), []).append((-score, int(features.ids[candidate])))
+        expected = sorted(
+            (song_id, rank, neighbor_id)
+            for song_id, scored in best.items()
+            for rank, (_score, neighbor_id) in enumerate(sorted(scored)[:5])
+        )
+        self.assertEqual(self.table(), expected)
+
+    @mock.patch('recommender.neighbors.FULL_RUN_SHARE', 1)
+    @mock.patch('recommender.neighbors.BUCKET_WINDOW', 2)
+    @mock.patch('recommender.neighbors.SENTIMENT_WINDOW', 5)
+    def test_windowed_incremental_run_matches_full_run(self):
+        compute_neighbors(k=5)
+        for song in Song.objects.order_by('id')[:4]:
+            song.sentiment = -song.sentiment
+            song.save()
+        Song.objects.order_by('id')[10].delete()
+        self.add_song(100)
+        self.assertFalse(compute_neighbors(k=5)['full'])
+        incremental = self.table()
+        compute_neighbors(k=5, full=True)
+        self.assertEqual(incremental, self.table())
+
+    def test_many_changes_or_a_new_k_recompute_everything(self):
+        compute_neighbors(k=5)
+        stats = compute_neighbors(k=3)
+        self.assertTrue(stats['full'])
+        self.assertEqual(self.table(), self.expected_table(3))
+
+    def test_memory_budget(self):
+        with self.assertRaises(CommandError):
+            call_command('compute_song_neighbors', '--memory-mb', '0', stdout=StringIO())
+        out = StringIO()
+        call_command('compute_song_neighbors', '--neighbors', '4', stdout=out)
+        self.assertIn('Computed 60', out.getvalue())
+
+    @mock.patch.object(DeezerAPI, 'get_artist_top_tracks')
+    @mock.patch.object(DeezerAPI, 'get_song_details')
+    def test_recommendations_read_the_table(self, details, top_tracks):
+        compute_neighbors(k=5)
+        song = Song.objects.get(deezer_id='3')
+        with self.assertNumQueries(1):
+            recommended = get_song_recommendations(song, limit=3)
+        self.assertEqual(
+            [s.id for s in recommended],
+            list(song.neighbors.order_by('rank').values_list('neighbor_id', flat=True)[:3]),
+        )
+        self.assertEqual([s.id for s in async_to_sync(aget_song_recommendations)(song, limit=3)],
+                         [s.id for s in recommended])
+        details.assert_not_called()
+        top_tracks.assert_not_called()
+
+        # Songs added since the last run still go to Deezer
+        top_tracks.return_value = []
+        self.assertEqual(get_song_recommendations(self.add_song(200)), [])
+        top_tracks.assert_called_once()
+
+
+class ScoringQueueTest(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        Subscription.objects.create(user=user, plan_type='monthly', active=True,
+                                    start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30))
+        self.client.login(username='testuser', password='testpass123')
+        mood_pools.reset()
+
+    @mock.patch.object(DeezerAPI, 'search_songs')
+    def test_search_queues_new_songs_for_scoring(self, search):
+        search.return_value = [make_track(i) for i in range(3)]
+        with mock.patch.object(SentimentAnalyzer, 'analyze_text') as analyze:
+            response = self.client.get('/api/search/?q=test')
+            analyze.assert_not_called()
+        self.assertEqual([r['sentiment_label'] for r in response.json()['results']], ['Unknown'] * 3)
+        self.assertEqual(Song.objects.filter(sentiment__isnull=True).count(), 3)
+
+        # Pending songs stay invisible to mood recommendations
+        self.assertEqual(get_mood_based_recommendations('nostalgic'), [])
+
+        out = StringIO()
+        call_command('score_songs', '--batch-size', '2', stdout=out)
+        self.assertIn('Scored 3 songs.', out.getvalue())
+        self.assertFalse(Song.objects.filter(sentiment__isnull=True).exists())
+        song = Song.objects.get(deezer_id='0')
+        self.assertEqual(song.sentiment, SentimentAnalyzer.analyze_song(song.title, song.artist))
+
+        mood_pools.refresh()
+        self.assertEqual(len(get_mood_based_recommendations('nostalgic')), 3)
+
+    @override_settings(SENTIMENT_SCORING='inline')
+    @mock.patch.object(DeezerAPI, 'search_songs')
+    def test_inline_scoring(self, search):
+        search.return_value = [make_track(1)]
+        self.client.get('/api/search/?q=test')
+        self.assertIsNotNone(Song.objects.get(deezer_id='1').sentiment)
+
+    def test_max_batches(self):
+        for i in range(5):
+            Song.objects.create(deezer_id=str(i), title=f'Song {i}', artist='Test Artist',
+                                link=f'https://deezer.com/track/{i}')
+        call_command('score_songs', '--batch-size', '2', '--max-batches', '1', stdout=StringIO())
+        self.assertEqual(Song.objects.filter(sentiment__isnull=True).count(), 3)
+
+
+class SentimentBatchTest(TestCase):
+    SONGS = [
+        ('Happy', 'Pharrell Williams'),
+        ('Mad World', 'Gary Jules'),
+        ('Happy', 'Pharrell Williams'),
+        ('I love this amazing song', 'Someone'),
+        ('', ''),
+        ('Hurt', 'Johnny Cash'),
+    ]
+
+    def setUp(self):
+        polarity_memo.clear()
+        self.addCleanup(polarity_memo.clear)
+
+    def expected(self):
+        return [SentimentAnalyzer.analyze_text(f'{title} {artist}') for title, artist in self.SONGS]
+
+    def test_matches_single_item_path(self):
+        self.assertEqual(SentimentAnalyzer.analyze_batch(self.SONGS, processes=1), self.expected())
+        self.assertEqual(
+            [SentimentAnalyzer.analyze_song(title, artist) for title, artist in self.SONGS],
+            self.expected(),
+        )
+
+    def test_dedupes_and_memoizes(self):
+        with mock.patch.object(SentimentAnalyzer, 'analyze_text', wraps=SentimentAnalyzer.analyze_text) as analyze:
+            SentimentAnalyzer.analyze_batch(self.SONGS, processes=1)
+            self.assertEqual(analyze.call_count, 5)
+            SentimentAnalyzer.analyze_batch(self.SONGS, processes=1)
+            SentimentAnalyzer.analyze_song('Mad World', 'Gary Jules')
+            self.assertEqual(analyze.call_count, 5)
+
+    @override_settings(SENTIMENT_POOL_THRESHOLD=2)
+    def test_process_pool_matches_single_item_path(self):
+        self.assertEqual(SentimentAnalyzer.analyze_batch(self.SONGS, processes=2), self.expected())
+
+    def test_memo_is_bounded(self):
+        with override_settings(SENTIMENT_MEMO_SIZE=3):
+            SentimentAnalyzer.analyze_batch(self.SONGS, processes=1)
+            self.assertEqual(len(polarity_memo), 3)
+
+
+class EntitlementTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.profile = UserProfile.objects.create(
+            user=self.user, daily_usage_count=10, last_usage_date=timezone.now().date()
+        )
+        self.client.force_login(self.user)
+
+    def subscribe(self):
+        Subscription.objects.create(
+            user=self.user, plan_type='monthly', active=True,
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30),
+        )
+
+    def test_memoized_on_request(self):
+        request = mock.Mock(user=self.user, spec=['user'])
+        with self.assertNumQueries(1):
+            entitlement = get_entitlement(request)
+            self.assertIs(get_entitlement(request), entitlement)
+            self.assertFalse(entitlement.has_subscription)
+            self.assertFalse(entitlement.can_use)
+            self.assertFalse(entitlement.profile.has_active_subscription())
+
+    def test_subscription_loaded_with_profile(self):
+        self.subscribe()
+        request = mock.Mock(user=self.user, spec=['user'])
+        with self.assertNumQueries(1):
+            self.assertTrue(get_entitlement(request).can_use)
+
+    def test_new_day_resets_without_writing(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(last_usage_date=timezone.now().date() - timedelta(days=1))
+        request = mock.Mock(user=self.user, spec=['user'])
+        with self.assertNumQueries(1):
+            entitlement = get_entitlement(request)
+            self.assertEqual(entitlement.usage_count, 0)
+            self.assertTrue(entitlement.can_use)
+
+    def test_creates_missing_profile(self):
+        other = User.objects.create_user(username='other')
+        request = mock.Mock(user=other, spec=['user'])
+        self.assertTrue(get_entitlement(request).can_use)
+        self.assertTrue(UserProfile.objects.filter(user=other).exists())
+
+    def test_home_query_count(self):
+        self.subscribe()
+        # session, user, profile + subscription
+        with self.assertNumQueries(3):
+            response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_mood_recommendations_query_count(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(current_mood='happy')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/recommendations/')
+        # profile + subscription, usage update
+        entitlement_queries = [
+            query['sql'] for query in queries
+            if 'recommender_userprofile' in query['sql'] or 'recommender_subscription' in query['sql']
+        ]
+        self.assertEqual(len(entitlement_queries), 2, entitlement_queries)
+
+    @mock.patch.object(DeezerAPI, 'search_songs', return_value=[])
+    def test_search_query_count(self, search):
+        self.subscribe()
+        # session, user, profile + subscription, usage update
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/search/?q=test')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['has_subscription'])
+
+    @mock.patch.object(DeezerAPI, 'search_songs', return_value=[])
+    def test_search_over_quota(self, search):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/search/?q=test')
+        self.assertEqual(response.status_code, 429)
+        search.assert_not_called()
+
+
+class UsageMeterTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user)
+        self.addCleanup(usage_meter.reset)
+
+    def load_profile(self):
+        return UserProfile.objects.get(pk=self.profile.pk)
+
+    def test_batches_writes(self):
+        meter = LocalMeter(flush_interval=3600, max_pending=3)
+        profile = self.load_profile()
+        with self.assertNumQueries(0):
+            self.assertEqual(meter.record(profile), 1)
+            self.assertEqual(meter.record(profile), 2)
+        self.assertEqual(self.load_profile().daily_usage_count, 0)
+        self.assertEqual(len(meter), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(meter.record(profile), 3)
+        self.assertEqual(self.load_profile().daily_usage_count, 3)
+        self.assertEqual(len(meter), 0)
+
+    def test_flush_writes_pending_uses(self):
+        meter = LocalMeter(flush_interval=3600, max_pending=100)
+        for _ in range(4):
+            meter.record(self.load_profile())
+        self.assertEqual(meter.flush(), 1)
+        profile = self.load_profile()
+        self.assertEqual(profile.daily_usage_count, 4)
+        self.assertEqual(profile.last_usage_date, timezone.now().date())
+        self.assertEqual(meter.flush(), 0)
+
+    def test_flushes_after_interval(self):
+        meter = LocalMeter(flush_interval=0, max_pending=100)
+        meter.record(self.load_profile())
+        self.assertEqual(self.load_profile().daily_usage_count, 1)
+
+    def test_limit_checked_locally(self):
+        meter = LocalMeter(flush_interval=3600, max_pending=100)
+        profile = self.load_profile()
+        with self.assertNumQueries(0):
+            self.assertEqual(meter.record(profile, limit=2), 1)
+            self.assertEqual(meter.record(profile, limit=2), 2)
+            self.assertIsNone(meter.record(profile, limit=2))
+        meter.flush()
+        self.assertEqual(self.load_profile().daily_usage_count, 2)
+
+    def test_counts_on_top_of_stored_usage(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(daily_usage_count=9, last_usage_date=timezone.now().date())
+        meter = LocalMeter(flush_interval=3600, max_pending=100)
+        self.assertEqual(meter.record(self.load_profile(), limit=10), 10)
+        self.assertIsNone(meter.record(self.load_profile(), limit=10))
+        meter.flush()
+        self.assertEqual(self.load_profile().daily_usage_count, 10)
+
+    def test_previous_day_uses_dropped(self):
+        meter = LocalMeter(flush_interval=3600, max_pending=100)
+        yesterday = timezone.now() - timedelta(days=1)
+        with mock.patch('django.utils.timezone.now', return_value=yesterday):
+            meter.record(self.load_profile())
+            meter.record(self.load_profile())
+        self.assertEqual(meter.record(self.load_profile()), 1)
+        meter.flush()
+        self.assertEqual(self.load_profile().daily_usage_count, 1)
+
+    def test_stale_write_does_not_clobber_today(self):
+        today = timezone.now().date()
+        UserProfile.objects.filter(pk=self.profile.pk).update(daily_usage_count=3, last_usage_date=today)
+        self.assertIsNone(UserProfile.add_usage(self.profile.pk, 5, today - timedelta(days=1)))
+        profile = self.load_profile()
+        self.assertEqual((profile.daily_usage_count, profile.last_usage_date), (3, today))
+
+    def test_overshoot_bound_across_workers(self):
+        limit, max_pending = 10, 3
+        workers = [LocalMeter(flush_interval=3600, max_pending=max_pending) for _ in range(3)]
+        admitted = 0
+        refused_round = False
+        while not refused_round:
+            refused_round = True
+            for meter in workers:
+                if meter.record(self.load_profile(), limit=limit) is not None:
+                    admitted += 1
+                    refused_round = False
+        for meter in workers:
+            meter.flush()
+
+        self.assertGreaterEqual(admitted, limit)
+        self.assertLessEqual(admitted, limit + (len(workers) - 1) * (max_pending - 1))
+        self.assertEqual(self.load_profile().daily_usage_count, admitted)
+
+    def test_unknown_backend(self):
+        with override_settings(USAGE_METERING={'BACKEND': 'redis'}):
+            usage_meter.reset()
+            with self.assertRaises(ValueError):
+                usage_meter.backend
+
+    @mock.patch.object(DeezerAPI, 'search_songs', return_value=[])
+    def test_search_with_local_backend(self, search):
+        self.client.force_login(self.user)
+        with override_settings(USAGE_METERING={'BACKEND': 'local', 'FLUSH_INTERVAL': 3600, 'MAX_PENDING': 5}):
+            usage_meter.reset()
+            self.assertIsInstance(usage_meter.backend, LocalMeter)
+            # session, user, profile; no usage update
+            with self.assertNumQueries(3):
+                response = self.client.get('/api/search/?q=test')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['usage_count'], 1)
+            self.assertEqual(self.load_profile().daily_usage_count, 0)
+            usage_meter.reset()
+        self.assertEqual(self.load_profile().daily_usage_count, 1)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN output checked is SQLite\'s')
+class QueryPlanTest(TestCase):
+    """The hot lookups must stay on their indexes (see migration 0011)"""
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertRegex(plan, rf'USING (COVERING )?INDEX {index_name}\b', plan)
+
+    def test_premium_until(self):
+        with CaptureQueriesContext(connection) as queries:
+            UserProfile.premium_until_for(1)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[0]['sql']}")
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('INDEX subscription_active_idx', plan)
+
+    def test_checkout_success_lookup(self):
+        self.assertUsesIndex(Subscription.objects.filter(user_id=1, active=True), 'subscription_active_idx')
+
+    def test_webhook_lookups(self):
+        self.assertUsesIndex(Purchase.objects.filter(order_id='order'), 'purchase_order_id_idx')
+        self.assertUsesIndex(Subscription.objects.filter(order_id='order'), 'subscription_order_id_idx')
+        self.assertUsesIndex(Purchase.objects.filter(stripe_payment_intent_id='pi_1'), 'purchase_payment_intent_idx')
+
+    def test_email_verification_lookup(self):
+        self.assertUsesIndex(
+            UserProfile.objects.filter(verification_token='00000000-0000-0000-0000-000000000000'),
+            'profile_verification_idx',
+        )
+
+    def test_song_default_ordering(self):
+        plan = Song.objects.all()[:20].explain()
+        self.assertIn('song_created_at_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_mood_sampling(self):
+        queryset = Song.objects.filter(
+            sentiment__gte=0.3, sentiment__lte=1.0, random_rank__gte=0.5
+        ).order_by('random_rank')[:5]
+        self.assertUsesIndex(queryset, 'song_random_rank_idx')
+        self.assertNotIn('TEMP B-TREE', queryset.explain())
+
+    def test_mood_pools_refresh(self):
+        queryset = Song.objects.filter(updated_at__gte=timezone.now()).order_by('updated_at')
+        self.assertUsesIndex(queryset, 'song_updated_at_idx')
+        self.assertNotIn('TEMP B-TREE', queryset.explain())
+
+    def test_scoring_queue(self):
+        self.assertUsesIndex(Song.objects.filter(sentiment__isnull=True).order_by('id'), 'song_unscored_idx')
+
+
 class ViewsTest(TestCase):
     def setUp(self):
         self.client = Client()
@@ -199,3 +2005,211 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, 'Monthly Plan')
         self.assertContains(response, 'Yearly Plan')
+
+
+def record_query(queries):
+    """Database execute wrapper appending each statement's SQL to `queries`"""
+    def wrapper(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+VIEW_BUDGETS_PATH = Path(__file__).with_name('view_budgets.json')
+
+# Every URL in recommender/urls.py, as (budget key, URL name, method, path,
+# data, who is logged in). Keys with "[async]" run on the ASGI URLconf.
+VIEW_BUDGET_CASES = [
+    ('home[anonymous]', 'home', 'get', '/', None, None),
+    ('home', 'home', 'get', '/', None, 'user'),
+    ('home[post]', 'home', 'post', '/', {'mood_text': 'feeling great today'}, 'user'),
+    ('login', 'login', 'get', '/login/', None, None),
+    ('login[post]', 'login', 'post', '/login/', {'username': 'budget', 'password': 'budget-pass'}, None),
+    ('signup', 'signup', 'get', '/signup/', None, None),
+    ('signup[post]', 'signup', 'post', '/signup/', {
+        'username': 'newuser', 'email': 'new@example.com', 'password1': 'pw-12345', 'password2': 'pw-12345',
+    }, None),
+    ('verify_email', 'verify_email', 'get', '/verify-email/{token}/', None, None),
+    ('logout', 'logout', 'get', '/logout/', None, 'user'),
+    ('password_reset', 'password_reset', 'get', '/password-reset/', None, None),
+    ('password_reset_done', 'password_reset_done', 'get', '/password-reset/done/', None, None),
+    ('password_reset_confirm', 'password_reset_confirm', 'get', '/password-reset-confirm/MQ/bad-token/', None, None),
+    ('password_reset_complete', 'password_reset_complete', 'get', '/password-reset-complete/', None, None),
+    ('mood_recommendations', 'mood_recommendations', 'get', '/recommendations/', None, 'user'),
+    ('search', 'search', 'get', '/search/?q=happy', None, 'user'),
+    ('search[async]', 'search', 'get', '/search/?q=happy', None, 'user'),
+    ('song_detail', 'song_detail', 'get', '/song/1/', None, 'user'),
+    ('song_detail[async]', 'song_detail', 'get', '/song/1/', None, 'user'),
+    ('subscribe', 'subscribe', 'get', '/subscribe/', None, 'user'),
+    ('subscribe_plan', 'subscribe_plan', 'get', '/subscribe/monthly/', None, 'user'),
+    ('checkout_success', 'checkout_success', 'get', '/checkout/success/?session_id=cs_budget', None, 'subscriber'),
+    ('checkout_cancel', 'checkout_cancel', 'get', '/checkout/cancel/', None, 'user'),
+    ('checkout', 'checkout', 'get', '/checkout/monthly/', None, 'user'),
+    ('stripe_webhook', 'stripe_webhook', 'post', '/webhook/stripe/', {
+        'type': 'checkout.session.completed',
+        'data': {'object': {'id': 'cs_budget', 'payment_intent': 'pi_budget', 'metadata': {'order_id': 'order-budget'}}},
+    }, None),
+    ('api_search', 'api_search', 'get', '/api/search/?q=happy', None, 'user'),
+    ('api_search[async]', 'api_search', 'get', '/api/search/?q=happy', None, 'user'),
+    ('api_song_detail', 'api_song_detail', 'get', '/api/song/1/', None, 'user'),
+    ('api_recommend', 'api_recommend', 'get', '/api/recommend/1/', None, 'user'),
+    ('api_recommend[async]', 'api_recommend', 'get', '/api/recommend/1/', None, 'user'),
+    ('api_checkout', 'api_checkout', 'post', '/api/checkout/', {'plan_type': 'monthly'}, 'user'),
+    ('create_payment_intent', 'create_payment_intent', 'post', '/api/create-payment-intent/',
+     {'plan_type': 'monthly'}, 'user'),
+    ('api_mood_pool_stats', 'api_mood_pool_stats', 'get', '/api/metrics/mood-pools/', None, 'staff'),
+]
+
+
+# Password hashing would dominate the auth views' timings without telling
+# us anything about the views themselves
+@override_settings(
+    DEEZER_CACHE={'BACKEND': 'none'},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ViewBudgetTest(TestCase):
+    """
+    Runs every URL against a seeded catalog, with Deezer and Stripe stubbed,
+    and fails when a view exceeds its budget in view_budgets.json: queries,
+    wall time (best of a few runs, ms) or peak Python allocations (KiB).
+    The budgeted response status makes sure each case still takes the path
+    it was measured on.
+
+        python -m pytest recommender/tests.py -k ViewBudget
+
+    VIEW_BUDGET_TIME_FACTOR scales the time budgets on slow machines, and
+    UPDATE_VIEW_BUDGETS=1 rewrites the file from this run's measurements.
+    """
+    RUNS = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        Song.objects.bulk_create([
+            Song(deezer_id=str(i), title=f'Song {i}', artist=f'Artist {i % 20}', album=f'Album {i % 50}',
+                 link=f'https://deezer.com/track/{i}', preview=f'https://cdn.deezer.com/preview/{i}.mp3',
+                 cover='https://cdn.deezer.com/cover.jpg', sentiment=-1.0 + (i % 200) / 100)
+            for i in range(1, 501)
+        ])
+        cls.users = {
+            'user': User.objects.create_user(username='budget', email='budget@example.com', password='budget-pass'),
+            'subscriber': User.objects.create_user(username='subscriber'),
+            'staff': User.objects.create_user(username='staff', is_staff=True),
+        }
+        cls.profile = UserProfile.objects.create(user=cls.users['user'], current_mood='happy')
+        Subscription.objects.create(
+            user=cls.users['subscriber'], plan_type='monthly', active=True,
+            start_date=timezone.now(), end_date=timezone.now() + timedelta(days=30),
+        )
+        Purchase.objects.create(user=cls.users['user'], plan_type='monthly', amount=20, order_id='order-budget')
+        Subscription.objects.create(user=cls.users['user'], plan_type='monthly', order_id='order-budget')
+
+    def setUp(self):
+        intent = mock.Mock(id='pi_budget', client_secret='pi_budget_secret')
+        patchers = [
+            mock.patch.object(DeezerAPI, 'search_songs', return_value=TOP_TRACKS),
+            mock.patch.object(DeezerAPI, 'get_song_details', return_value={'id': 1, 'artist': {'id': 77}}),
+            mock.patch.object(DeezerAPI, 'get_artist_top_tracks', return_value=TOP_TRACKS),
+            mock.patch.object(AsyncDeezerAPI, 'search_songs', mock.AsyncMock(return_value=TOP_TRACKS)),
+            mock.patch.object(AsyncDeezerAPI, 'get_song_details',
+                              mock.AsyncMock(return_value={'id': 1, 'artist': {'id': 77}})),
+            mock.patch.object(AsyncDeezerAPI, 'get_artist_top_tracks', mock.AsyncMock(return_value=TOP_TRACKS)),
+            mock.patch('stripe.PaymentIntent.create', return_value=intent),
+            mock.patch.object(StripeAPI, 'create_checkout_session',
+                              return_value={'id': 'cs_budget', 'url': 'https://checkout.stripe.com/cs_budget'}),
+            mock.patch.object(StripeAPI, 'verify_webhook_signature', return_value=True),
+            # The webhook and checkout views narrate to stdout
+            mock.patch('builtins.print'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        mood_pools.reset()
+        self.addCleanup(mood_pools.reset)
+
+    def request(self, case):
+        """A function making the case's request with a fresh client; returns (response, ms)"""
+        key, _name, method, path, data, who = case
+        path = path.format(token=self.profile.verification_token)
+        kwargs = {}
+        if data is not None and key in ('stripe_webhook', 'create_payment_intent', 'api_checkout'):
+            kwargs = {'data': json.dumps(data), 'content_type': 'application/json'}
+        elif data is not None:
+            kwargs = {'data': data}
+        urlconf = AsyncURLConf if '[async]' in key else 'song_recommender.urls'
+
+        def run(queries=None):
+            # Roll back whatever the view (or logging in) wrote, so every run
+            # sees the same data
+            with override_settings(ROOT_URLCONF=urlconf), transaction.atomic():
+                client = Client()
+                if who:
+                    client.force_login(self.users[who])
+                with connection.execute_wrapper(record_query(queries)) if queries is not None else nullcontext():
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, **kwargs)
+                    elapsed = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+            return response, elapsed
+        return run
+
+    def measure(self, case):
+        run = self.request(case)
+        response, _ = run()  # warm up imports, templates and the mood pools
+        self.assertLess(response.status_code, 500, case[0])
+
+        # Counted directly: every request resets connection.queries
+        queries = []
+        run(queries)
+        timings = [run()[1] for _ in range(self.RUNS)]
+
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {'status': response.status_code, 'queries': len(queries), 'ms': min(timings), 'kib': peak / 1024}
+
+    def test_every_url_has_a_budget(self):
+        names = {pattern.name for pattern in get_urlpatterns()}
+        self.assertEqual(names - {case[1] for case in VIEW_BUDGET_CASES}, set())
+        budgets = json.loads(VIEW_BUDGETS_PATH.read_text())
+        self.assertEqual(set(budgets), {case[0] for case in VIEW_BUDGET_CASES})
+
+    def test_views_within_budget(self):
+        budgets = json.loads(VIEW_BUDGETS_PATH.read_text())
+        time_factor = float(os.getenv('VIEW_BUDGET_TIME_FACTOR', '1'))
+        measured, over = {}, []
+        for case in VIEW_BUDGET_CASES:
+            key = case[0]
+            measured[key] = usage = self.measure(case)
+            budget = budgets.get(key)
+            if budget is None:
+                over.append(f'{key}: no budget')
+                continue
+            if usage['status'] != budget['status']:
+                # The case no longer exercises the path it was budgeted for
+                over.append(f"{key}: status {usage['status']}, expected {budget['status']}")
+            if usage['queries'] > budget['queries']:
+                over.append(f"{key}: {usage['queries']} queries > {budget['queries']}")
+            if usage['ms'] > budget['ms'] * time_factor:
+                over.append(f"{key}: {usage['ms']:.1f} ms > {budget['ms'] * time_factor:.1f}")
+            if usage['kib'] > budget['kib']:
+                over.append(f"{key}: {usage['kib']:.0f} KiB > {budget['kib']}")
+
+        if os.getenv('UPDATE_VIEW_BUDGETS'):
+            # Exact query counts; headroom for machine-dependent time and memory
+            VIEW_BUDGETS_PATH.write_text(json.dumps({
+                key: {
+                    'status': usage['status'],
+                    'queries': usage['queries'],
+                    'ms': max(50, math.ceil(usage['ms'] * 5)),
+                    'kib': max(512, math.ceil(usage['kib'] * 2)),
+                }
+                for key, usage in measured.items()
+            }, indent=2) + '\n')
+            return
+        if over:
+            self.fail('Views over budget (UPDATE_VIEW_BUDGETS=1 to accept):\n' + '\n'.join(over))
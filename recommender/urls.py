@@ -1,50 +1,69 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
 
-urlpatterns = [
-    # Web views
-    path('', views.home, name='home'),
-
-    # Authentication
-    path('login/', views.user_login, name='login'),
-    path('signup/', views.user_signup, name='signup'),
-    path('verify-email/<uuid:token>/', views.verify_email, name='verify_email'),
-    path('logout/', views.user_logout, name='logout'),
-
-    # Password Reset
-    path('password-reset/', 
-         auth_views.PasswordResetView.as_view(template_name='recommender/password_reset_form.html'), 
-         name='password_reset'),
-    path('password-reset/done/', 
-         auth_views.PasswordResetDoneView.as_view(template_name='recommender/password_reset_done.html'), 
-         name='password_reset_done'),
-    path('password-reset-confirm/<uidb64>/<token>/', 
-         auth_views.PasswordResetConfirmView.as_view(template_name='recommender/password_reset_confirm.html'), 
-         name='password_reset_confirm'),
-    path('password-reset-complete/', 
-         auth_views.PasswordResetCompleteView.as_view(template_name='recommender/password_reset_complete.html'), 
-         name='password_reset_complete'),
-
-    # Main features
-    path('recommendations/', views.mood_recommendations, name='mood_recommendations'),
-    path('search/', views.search_songs, name='search'),
-    path('song/<str:deezer_id>/', views.song_detail, name='song_detail'),
-    path('subscribe/', views.subscribe, name='subscribe'),
-    path('subscribe/<str:plan_type>/', views.subscribe, name='subscribe_plan'),
-    # Specific checkout routes MUST come before generic <str:plan_type> route
-    path('checkout/success/', views.checkout_success, name='checkout_success'),
-    path('checkout/cancel/', views.checkout_cancel, name='checkout_cancel'),
-    path('checkout/<str:plan_type>/', views.checkout, name='checkout'),
-
-    # Webhook
-    path('webhook/stripe/', views.stripe_webhook, name='stripe_webhook'),
+
+def get_urlpatterns(async_views=False):
+    """
+    Build the URL patterns. With `async_views` the Deezer-backed pages and
+    API endpoints are served by their async versions (used on the ASGI entry
+    point, see song_recommender/asgi.py).
+    """
+    if async_views:
+        search_songs, song_detail = views.search_songs_async, views.song_detail_async
+        api_search_songs, api_recommend = views.api_search_songs_async, views.api_recommend_async
+    else:
+        search_songs, song_detail = views.search_songs, views.song_detail
+        api_search_songs, api_recommend = views.api_search_songs, views.api_recommend
+
+    return [
+        # Web views
+        path('', views.home, name='home'),
+
+        # Authentication
+        path('login/', views.user_login, name='login'),
+        path('signup/', views.user_signup, name='signup'),
+        path('verify-email/<uuid:token>/', views.verify_email, name='verify_email'),
+        path('logout/', views.user_logout, name='logout'),
+
+        # Password Reset
+        path('password-reset/', 
+             auth_views.PasswordResetView.as_view(template_name='recommender/password_reset_form.html'), 
+             name='password_reset'),
+        path('password-reset/done/', 
+             auth_views.PasswordResetDoneView.as_view(template_name='recommender/password_reset_done.html'), 
+             name='password_reset_done'),
+        path('password-reset-confirm/<uidb64>/<token>/', 
+             auth_views.PasswordResetConfirmView.as_view(template_name='recommender/password_reset_confirm.html'), 
+             name='password_reset_confirm'),
+        path('password-reset-complete/', 
+             auth_views.PasswordResetCompleteView.as_view(template_name='recommender/password_reset_complete.html'), 
+             name='password_reset_complete'),
+
+        # Main features
+        path('recommendations/', views.mood_recommendations, name='mood_recommendations'),
+        path('search/', search_songs, name='search'),
+        path('song/<str:deezer_id>/', song_detail, name='song_detail'),
+        path('subscribe/', views.subscribe, name='subscribe'),
+        path('subscribe/<str:plan_type>/', views.subscribe, name='subscribe_plan'),
+        # Specific checkout routes MUST come before generic <str:plan_type> route
+        path('checkout/success/', views.checkout_success, name='checkout_success'),
+        path('checkout/cancel/', views.checkout_cancel, name='checkout_cancel'),
+        path('checkout/<str:plan_type>/', views.checkout, name='checkout'),
+
+        # Webhook
+        path('webhook/stripe/', views.stripe_webhook, name='stripe_webhook'),
     
-    # API endpoints
-    path('api/search/', views.api_search_songs, name='api_search'),
-    path('api/song/<str:deezer_id>/', views.api_song_detail, name='api_song_detail'),
-    path('api/recommend/<str:deezer_id>/', views.api_recommend, name='api_recommend'),
-    path('api/checkout/', views.api_checkout, name='api_checkout'),
-    path('api/create-payment-intent/', views.create_payment_intent, name='create_payment_intent'),
-]
+        # API endpoints
+        path('api/search/', api_search_songs, name='api_search'),
+        path('api/song/<str:deezer_id>/', views.api_song_detail, name='api_song_detail'),
+        path('api/recommend/<str:deezer_id>/', api_recommend, name='api_recommend'),
+        path('api/checkout/', views.api_checkout, name='api_checkout'),
+        path('api/create-payment-intent/', views.create_payment_intent, name='create_payment_intent'),
+        path('api/metrics/mood-pools/', views.api_mood_pool_stats, name='api_mood_pool_stats'),
+    ]
+
+
+urlpatterns = get_urlpatterns(async_views=getattr(settings, 'ASYNC_VIEWS', False))
 
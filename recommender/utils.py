@@ -1,24 +1,350 @@
 import requests
 import hashlib
 import hmac
-from textblob import TextBlob
+import asyncio
+import functools
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+import httpx
+import numpy as np
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 
+from .catalog_snapshot import catalog_snapshot
+from .deezer_tape import TapeMiss, deezer_tape
+
+
+class LocMemLRUBackend:
+    """In-process response store with per-entry expiry and an LRU size bound"""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value, timeout):
+        self.set(key, value, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    """
+    Response store backed by one of the Django CACHES, so workers can share
+    entries (e.g. through Redis or Memcached). Eviction is left to the cache
+    itself (for LocMemCache that is its own MAX_ENTRIES option).
+    """
+
+    _missing = object()
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        value = self.cache.get(key, self._missing)
+        if value is self._missing:
+            return False, None
+        return True, value
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    async def aget(self, key):
+        value = await self.cache.aget(key, self._missing)
+        if value is self._missing:
+            return False, None
+        return True, value
+
+    async def aset(self, key, value, timeout):
+        await self.cache.aset(key, value, timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class DeezerCache:
+    """
+    Cache for Deezer API responses, keyed by endpoint and normalized params.
+
+    Each endpoint has its own TTL; a TTL of 0 disables caching for it.
+    Configured through the DEEZER_CACHE setting:
+
+        DEEZER_CACHE = {
+            'BACKEND': 'locmem',        # 'locmem', 'django' or 'none'
+            'MAX_ENTRIES': 2048,        # LRU bound for 'locmem'
+            'CACHE_ALIAS': 'default',   # which CACHES entry 'django' uses
+            'TIMEOUTS': {'search': 300, 'track': 3600, 'artist_top': 1800},
+        }
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    DEFAULT_TIMEOUTS = {'search': 300, 'track': 3600, 'artist_top': 1800}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Re-read settings, drop the backend and zero the counters"""
+        with self._lock:
+            self._backend = None
+            self._hits = {}
+            self._misses = {}
+
+    @property
+    def config(self):
+        return getattr(settings, 'DEEZER_CACHE', {})
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            name = self.config.get('BACKEND', 'locmem')
+            if name == 'django':
+                self._backend = DjangoCacheBackend(self.config.get('CACHE_ALIAS', 'default'))
+            elif name == 'locmem':
+                self._backend = LocMemLRUBackend(self.config.get('MAX_ENTRIES', 2048))
+            elif name == 'none':
+                self._backend = False
+            else:
+                raise ValueError(f"Unknown DEEZER_CACHE backend: {name}")
+        return self._backend
+
+    def timeout(self, endpoint):
+        timeouts = {**self.DEFAULT_TIMEOUTS, **self.config.get('TIMEOUTS', {})}
+        return timeouts.get(endpoint, 0)
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Build a cache key that ignores param order, case and extra whitespace"""
+        normalized = sorted(
+            (str(name), ' '.join(str(value).split()).lower())
+            for name, value in params.items()
+        )
+        digest = hashlib.sha1(json.dumps(normalized).encode('utf-8')).hexdigest()
+        return f"deezer:{endpoint}:{digest}"
+
+    def _count(self, counter, endpoint):
+        with self._lock:
+            counter[endpoint] = counter.get(endpoint, 0) + 1
+
+    def get_or_fetch(self, endpoint, params, fetch):
+        """
+        Return the cached response for (endpoint, params), calling `fetch()`
+        on a miss. Deezer reports some failures as a 200 with an "error"
+        object; those are returned but never cached.
+        """
+        backend = self.backend
+        timeout = self.timeout(endpoint)
+        if backend is False or timeout <= 0:
+            return fetch()
+
+        key = self.make_key(endpoint, params)
+        found, value = backend.get(key)
+        if found:
+            self._count(self._hits, endpoint)
+            return value
+
+        self._count(self._misses, endpoint)
+        value = fetch()
+        if not (isinstance(value, dict) and 'error' in value):
+            backend.set(key, value, timeout)
+        return value
+
+    async def aget_or_fetch(self, endpoint, params, fetch):
+        """Async version of get_or_fetch; `fetch` is a coroutine function"""
+        backend = self.backend
+        timeout = self.timeout(endpoint)
+        if backend is False or timeout <= 0:
+            return await fetch()
+
+        key = self.make_key(endpoint, params)
+        found, value = await backend.aget(key)
+        if found:
+            self._count(self._hits, endpoint)
+            return value
+
+        self._count(self._misses, endpoint)
+        value = await fetch()
+        if not (isinstance(value, dict) and 'error' in value):
+            await backend.aset(key, value, timeout)
+        return value
+
+    def stats(self):
+        """Hit/miss counters per endpoint"""
+        with self._lock:
+            endpoints = sorted(set(self._hits) | set(self._misses))
+            return {
+                endpoint: {
+                    'hits': self._hits.get(endpoint, 0),
+                    'misses': self._misses.get(endpoint, 0),
+                }
+                for endpoint in endpoints
+            }
+
+
+deezer_cache = DeezerCache()
+
+
+class DeezerRetry(Retry):
+    """Retry policy that never sleeps longer than backoff_max, even when told to by Retry-After"""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, self.backoff_max)
+
+
+DEEZER_HTTP_DEFAULTS = {
+    'POOL_SIZE': 20,
+    'CONNECT_TIMEOUT': 3.05,
+    'READ_TIMEOUT': 10,
+    'MAX_RETRIES': 3,
+    'BACKOFF_FACTOR': 0.3,
+    'BACKOFF_MAX': 5,
+}
+
+_deezer_session = None
+_deezer_session_pid = None
+_deezer_session_lock = threading.Lock()
+
+
+def get_deezer_http_config():
+    return {**DEEZER_HTTP_DEFAULTS, **getattr(settings, 'DEEZER_HTTP', {})}
+
+
+def get_deezer_session():
+    """
+    Shared keep-alive session for Deezer calls, one per process.
+
+    The session is rebuilt when the pid changes, so gunicorn workers forked
+    from a preloaded master never share sockets with it. Retries 429/5xx
+    responses and connection errors with bounded exponential backoff.
+    """
+    global _deezer_session, _deezer_session_pid
+
+    pid = os.getpid()
+    if _deezer_session is not None and _deezer_session_pid == pid:
+        return _deezer_session
+
+    with _deezer_session_lock:
+        if _deezer_session is None or _deezer_session_pid != pid:
+            config = get_deezer_http_config()
+            retry = DeezerRetry(
+                total=config['MAX_RETRIES'],
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({'GET'}),
+                backoff_factor=config['BACKOFF_FACTOR'],
+                backoff_max=config['BACKOFF_MAX'],
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=config['POOL_SIZE'],
+                pool_maxsize=config['POOL_SIZE'],
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _deezer_session = session
+            _deezer_session_pid = pid
+    return _deezer_session
+
+
+def reset_deezer_session():
+    """Close the shared session so the next call picks up new settings"""
+    global _deezer_session, _deezer_session_pid
+
+    with _deezer_session_lock:
+        if _deezer_session is not None and _deezer_session_pid == os.getpid():
+            _deezer_session.close()
+        _deezer_session = None
+        _deezer_session_pid = None
+
 
 class DeezerAPI:
     """Wrapper for Deezer API"""
-    BASE_URL = "https://api.deezer.com"
+    BASE_URL = getattr(settings, 'DEEZER_API_URL', "https://api.deezer.com")
 
     @staticmethod
-    def search_songs(query, limit=20):
-        """Search for songs on Deezer"""
-        try:
-            response = requests.get(
-                f"{DeezerAPI.BASE_URL}/search",
-                params={"q": query, "limit": limit}
+    def _get(endpoint, path, params=None):
+        """GET a Deezer resource through the response cache (and the tape, see DEEZER_TAPE)"""
+        params = params or {}
+        key_params = {'path': path, **params}
+
+        def fetch():
+            key = DeezerCache.make_key(endpoint, key_params)
+            if deezer_tape.replaying:
+                try:
+                    return deezer_tape.replay(key)
+                except TapeMiss as e:
+                    raise requests.ConnectionError(str(e)) from e
+
+            config = get_deezer_http_config()
+            response = get_deezer_session().get(
+                f"{DeezerAPI.BASE_URL}{path}",
+                params=params,
+                timeout=(config['CONNECT_TIMEOUT'], config['READ_TIMEOUT']),
             )
             response.raise_for_status()
             data = response.json()
+            deezer_tape.record(key, data)
+            return data
+
+        return deezer_cache.get_or_fetch(endpoint, key_params, fetch)
+
+    @staticmethod
+    def search_songs(query, limit=20):
+        """Search for songs on Deezer"""
+        try:
+            data = DeezerAPI._get('search', '/search', {"q": query, "limit": limit})
             return data.get('data', [])
         except requests.RequestException as e:
             print(f"Deezer API error: {e}")
@@ -28,9 +354,7 @@ class DeezerAPI:
     def get_song_details(deezer_id):
         """Get detailed information about a song"""
         try:
-            response = requests.get(f"{DeezerAPI.BASE_URL}/track/{deezer_id}")
-            response.raise_for_status()
-            return response.json()
+            return DeezerAPI._get('track', f"/track/{deezer_id}")
         except requests.RequestException as e:
             print(f"Deezer API error: {e}")
             return None
@@ -39,33 +363,370 @@ class DeezerAPI:
     def get_artist_top_tracks(artist_id, limit=10):
         """Get top tracks for an artist"""
         try:
-            response = requests.get(
-                f"{DeezerAPI.BASE_URL}/artist/{artist_id}/top",
-                params={"limit": limit}
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = DeezerAPI._get('artist_top', f"/artist/{artist_id}/top", {"limit": limit})
             return data.get('data', [])
         except requests.RequestException as e:
             print(f"Deezer API error: {e}")
             return []
 
 
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# One AsyncClient per event loop: httpx clients can't be shared across loops
+_async_deezer_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_deezer_client():
+    """Shared keep-alive httpx.AsyncClient for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_deezer_clients.get(loop)
+    if client is None or client.is_closed:
+        config = get_deezer_http_config()
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config['POOL_SIZE'],
+                max_keepalive_connections=config['POOL_SIZE'],
+            ),
+            timeout=httpx.Timeout(
+                config['READ_TIMEOUT'],
+                connect=config['CONNECT_TIMEOUT'],
+            ),
+        )
+        _async_deezer_clients[loop] = client
+    return client
+
+
+def get_retry_delay(attempt, config, retry_after=None):
+    """Seconds to wait before retry number `attempt` (1-based), capped at BACKOFF_MAX"""
+    if retry_after is not None:
+        try:
+            return min(max(float(retry_after), 0), config['BACKOFF_MAX'])
+        except ValueError:
+            pass
+    if attempt <= 1:
+        return 0
+    return min(config['BACKOFF_FACTOR'] * (2 ** (attempt - 1)), config['BACKOFF_MAX'])
+
+
+class AsyncDeezerAPI:
+    """
+    asyncio counterpart of DeezerAPI for the ASGI views.
+
+    Shares DeezerAPI's base URL, response cache and DEEZER_HTTP settings,
+    and applies the same retry policy (429/5xx and transport errors, bounded
+    exponential backoff) so both entry points behave alike.
+    """
+
+    @staticmethod
+    async def _get(endpoint, path, params=None):
+        """GET a Deezer resource through the response cache (and the tape, see DEEZER_TAPE)"""
+        params = params or {}
+        key_params = {'path': path, **params}
+
+        async def fetch():
+            key = DeezerCache.make_key(endpoint, key_params)
+            if deezer_tape.replaying:
+                try:
+                    return deezer_tape.replay(key)
+                except TapeMiss as e:
+                    raise httpx.ConnectError(str(e)) from e
+
+            config = get_deezer_http_config()
+            client = get_async_deezer_client()
+            url = f"{DeezerAPI.BASE_URL}{path}"
+            attempt = 0
+            while True:
+                try:
+                    response = await client.get(url, params=params)
+                except httpx.TransportError:
+                    if attempt >= config['MAX_RETRIES']:
+                        raise
+                    attempt += 1
+                    await asyncio.sleep(get_retry_delay(attempt, config))
+                    continue
+                if response.status_code in RETRY_STATUSES and attempt < config['MAX_RETRIES']:
+                    attempt += 1
+                    await asyncio.sleep(get_retry_delay(attempt, config, response.headers.get('Retry-After')))
+                    continue
+                response.raise_for_status()
+                data = response.json()
+                deezer_tape.record(key, data)
+                return data
+
+        return await deezer_cache.aget_or_fetch(endpoint, key_params, fetch)
+
+    @staticmethod
+    async def search_songs(query, limit=20):
+        """Search for songs on Deezer"""
+        try:
+            data = await AsyncDeezerAPI._get('search', '/search', {"q": query, "limit": limit})
+            return data.get('data', [])
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Deezer API error: {e}")
+            return []
+
+    @staticmethod
+    async def get_song_details(deezer_id):
+        """Get detailed information about a song"""
+        try:
+            return await AsyncDeezerAPI._get('track', f"/track/{deezer_id}")
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Deezer API error: {e}")
+            return None
+
+    @staticmethod
+    async def get_artist_top_tracks(artist_id, limit=10):
+        """Get top tracks for an artist"""
+        try:
+            data = await AsyncDeezerAPI._get('artist_top', f"/artist/{artist_id}/top", {"limit": limit})
+            return data.get('data', [])
+        except (httpx.HTTPError, ValueError) as e:
+            print(f"Deezer API error: {e}")
+            return []
+
+
+class TextBlobSentimentBackend:
+    """Polarity from TextBlob's pattern analyzer (imported on first use)"""
+
+    name = 'textblob'
+
+    def polarity(self, text):
+        from textblob import TextBlob
+        return TextBlob(text).sentiment.polarity
+
+
+class LexiconSentimentBackend:
+    """
+    Polarity from a precompiled copy of TextBlob's English sentiment lexicon.
+
+    Scores plain strings the way TextBlob's pattern analyzer does (the same
+    tokenization, negation, intensifier, "!" and emoticon rules) without
+    importing TextBlob or parsing its XML lexicon, so it loads in a few
+    milliseconds and is an order of magnitude faster on short texts.
+    Regenerate the lexicon file with `manage.py compile_sentiment_lexicon`.
+    """
+
+    name = 'lexicon'
+    DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sentiment_lexicon.json')
+
+    ABBR_LETTERS = re.compile(r"^([A-Za-z]\.)+$")  # "U.S."
+    ABBR_CAPITAL = re.compile(r"^[A-Z][" + "|".join("bcdfghjklmnpqrstvwxz") + r"]+.$")  # "Mr."
+    SARCASM = re.compile(r"\( ?\! ?\)")
+    QUOTES = str.maketrans({q: f" {q} " for q in "\"'“”‘’"})
+
+    def __init__(self, path=None):
+        with open(path or self.DEFAULT_PATH, encoding='utf-8') as f:
+            lexicon = json.load(f)
+        self.words = {word: tuple(entry) for word, entry in lexicon['words'].items()}
+        self.negations = frozenset(lexicon['negations'])
+        self.punctuation = frozenset(lexicon['punctuation'])
+        self.leading = frozenset(lexicon['punctuation'].replace('.', ''))
+        self.abbreviations = frozenset(lexicon['abbreviations'])
+
+        faces = lexicon['emoticons']
+        self.emoticons = {}
+        for face, polarity in faces.items():
+            self.emoticons.setdefault(face.lower(), polarity)
+        self.emoticon_chars = frozenset(char for face in faces for char in face if not char.isalpha())
+        # TextBlob splits ":)" into ": )" and then glues known faces back together
+        self.emoticon_re = re.compile(r"(?=[%s])(%s)($|\s)" % (
+            re.escape(''.join(sorted({face[0] for face in faces}))),
+            "|".join(
+                r" ?".join(re.escape(char) for char in face)
+                for face in sorted(faces, key=len, reverse=True)
+            ),
+        ))
+
+    def is_abbreviation(self, token):
+        return (
+            token in self.abbreviations
+            or self.ABBR_LETTERS.match(token) is not None
+            or self.ABBR_CAPITAL.match(token) is not None
+        )
+
+    def tokenize(self, text):
+        """Split text into the word and punctuation tokens TextBlob would assess"""
+        text = text.replace("n't", " n't").translate(self.QUOTES)
+        leading = self.leading
+        tokens = []
+        split = False
+        for token in text.split():
+            if token.isalnum():
+                tokens.append(token)
+                continue
+            split = True
+            while token and token[0] in leading:
+                tokens.append(token[0])
+                token = token[1:]
+            tail = []
+            while token and (token[-1] in leading or token[-1] == '.'):
+                if token[-1] in leading:
+                    tail.append(token[-1])
+                    token = token[:-1]
+                if token.endswith('...'):
+                    tail.append('...')
+                    token = token[:-3].rstrip('.')
+                if token.endswith('.'):
+                    if self.is_abbreviation(token):
+                        break
+                    tail.append('.')
+                    token = token[:-1]
+            if token:
+                tokens.append(token)
+            tokens.extend(reversed(tail))
+
+        if split and not self.emoticon_chars.isdisjoint(text):
+            joined = self.SARCASM.sub('(!)', ' '.join(tokens))
+            joined = self.emoticon_re.sub(lambda m: m.group(1).replace(' ', '') + m.group(2), joined)
+            tokens = joined.split()
+        return tokens
+
+    def polarity(self, text):
+        words = self.words
+        negations = self.negations
+        scores = []  # [polarity, intensity, negated] per assessed word
+        modifier = None
+        negation = None
+
+        for word in self.tokenize(text):
+            word = word.lower()
+            entry = words.get(word)
+            if entry is not None:
+                polarity, intensity, is_modifier = entry
+                if modifier is None:
+                    scores.append([polarity, intensity, False])
+                else:
+                    # "really good": the modifier's intensity scales this word
+                    last = scores[-1]
+                    last[0] = max(-1.0, min(polarity * last[1], 1.0))
+                    last[1] = intensity
+                if negation is not None:
+                    scores[-1][1] = 1.0 / scores[-1][1]
+                    scores[-1][2] = True
+                modifier = word if is_modifier else None
+                negation = word if word in negations else None
+                continue
+
+            if word in negations:
+                negation = word
+            elif negation and len(word.strip("'")) > 1:
+                # Negations carry across small words ("not a good")
+                negation = None
+            if negation is not None and modifier is not None and modifier.endswith('ly'):
+                # "really not good"
+                scores[-1][2] = True
+                negation = None
+            elif modifier and len(word) > 2:
+                modifier = None
+            if word == '!' and scores:
+                scores[-1][0] = max(-1.0, min(scores[-1][0] * 1.25, 1.0))
+            if word == '(!)':
+                scores.append([0.0, 1.0, False])
+            if not word.isalpha() and len(word) <= 5 and word not in self.punctuation:
+                polarity = self.emoticons.get(word)
+                if polarity is not None:
+                    scores.append([polarity, 1.0, False])
+
+        total = 0
+        for polarity, _intensity, negated in scores:
+            total += polarity * -0.5 if negated else polarity
+        return total / float(len(scores) or 1)
+
+
+SENTIMENT_BACKENDS = {
+    'textblob': TextBlobSentimentBackend,
+    'lexicon': LexiconSentimentBackend,
+}
+_sentiment_backends = {}
+_sentiment_backends_lock = threading.Lock()
+
+
+def get_sentiment_backend(name=None):
+    """The SENTIMENT_BACKEND analyzer ('lexicon' or 'textblob'), created once per process"""
+    name = name or getattr(settings, 'SENTIMENT_BACKEND', 'lexicon')
+    backend = _sentiment_backends.get(name)
+    if backend is None:
+        if name not in SENTIMENT_BACKENDS:
+            raise ValueError(f"Unknown SENTIMENT_BACKEND: {name}")
+        with _sentiment_backends_lock:
+            backend = _sentiment_backends.get(name)
+            if backend is None:
+                backend = _sentiment_backends[name] = SENTIMENT_BACKENDS[name]()
+    return backend
+
+
+class PolarityMemo:
+    """
+    LRU map from a content hash of a text to its polarity, so repeated
+    title+artist strings are only scored once per process. Keys are 16-byte
+    digests, which keeps entries small even for long texts.
+    """
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        if self._max_entries is not None:
+            return self._max_entries
+        return getattr(settings, 'SENTIMENT_MEMO_SIZE', 100000)
+
+    @staticmethod
+    def key(text):
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+    def get(self, key):
+        with self._lock:
+            score = self._scores.get(key)
+            if score is not None:
+                self._scores.move_to_end(key)
+            return score
+
+    def set(self, key, score):
+        with self._lock:
+            self._scores[key] = score
+            self._scores.move_to_end(key)
+            while len(self._scores) > self.max_entries:
+                self._scores.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+    def __len__(self):
+        return len(self._scores)
+
+
+polarity_memo = PolarityMemo()
+
+
+def _analyze_texts(texts):
+    """Process pool entry point: score a chunk of texts"""
+    return [SentimentAnalyzer.analyze_text(text) for text in texts]
+
+
 class SentimentAnalyzer:
     """Analyze sentiment of song titles and lyrics"""
 
+    # Scores above POSITIVE_THRESHOLD are "Positive", below
+    # NEGATIVE_THRESHOLD "Negative", anything between "Neutral"
+    POSITIVE_THRESHOLD = 0.3
+    NEGATIVE_THRESHOLD = -0.3
+
     @staticmethod
     def analyze_text(text):
         """
-        Analyze sentiment of text using TextBlob
+        Analyze sentiment of text with the SENTIMENT_BACKEND analyzer
         Returns a polarity score between -1 (negative) and 1 (positive)
         """
         if not text:
             return 0.0
-        
+
+        backend = get_sentiment_backend()
         try:
-            blob = TextBlob(text)
-            return blob.sentiment.polarity
+            return backend.polarity(text)
         except Exception as e:
             print(f"Sentiment analysis error: {e}")
             return 0.0
@@ -74,14 +735,64 @@ class SentimentAnalyzer:
     def analyze_song(title, artist=""):
         """Analyze sentiment of a song based on title and artist"""
         combined_text = f"{title} {artist}"
-        return SentimentAnalyzer.analyze_text(combined_text)
+        key = polarity_memo.key(combined_text)
+        score = polarity_memo.get(key)
+        if score is None:
+            score = SentimentAnalyzer.analyze_text(combined_text)
+            polarity_memo.set(key, score)
+        return score
 
     @staticmethod
-    def get_sentiment_label(score):
+    def analyze_batch(songs, processes=None):
+        """
+        Analyze a batch of (title, artist) pairs, returning scores in order.
+
+        Identical texts are scored once, and scores are memoized by content
+        hash across calls. When at least SENTIMENT_POOL_THRESHOLD texts still
+        need scoring, they are spread over a process pool (`processes`
+        workers, default SENTIMENT_POOL_PROCESSES or the CPU count; pass 1 to
+        stay in-process). Scores are identical to analyze_song().
+        """
+        texts = [f"{title} {artist}" for title, artist in songs]
+
+        scores = {}
+        missing = {}
+        for text in texts:
+            if text in scores or text in missing:
+                continue
+            key = polarity_memo.key(text)
+            score = polarity_memo.get(key)
+            if score is None:
+                missing[text] = key
+            else:
+                scores[text] = score
+
+        if missing:
+            pending = list(missing)
+            threshold = getattr(settings, 'SENTIMENT_POOL_THRESHOLD', 2000)
+            if processes is None:
+                processes = getattr(settings, 'SENTIMENT_POOL_PROCESSES', None) or os.cpu_count() or 1
+
+            if processes > 1 and len(pending) >= threshold:
+                chunk_size = math.ceil(len(pending) / (processes * 4))
+                chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+                with ProcessPoolExecutor(max_workers=processes) as executor:
+                    results = [score for chunk in executor.map(_analyze_texts, chunks) for score in chunk]
+            else:
+                results = _analyze_texts(pending)
+
+            for text, score in zip(pending, results):
+                scores[text] = score
+                polarity_memo.set(missing[text], score)
+
+        return [scores[text] for text in texts]
+
+    @classmethod
+    def get_sentiment_label(cls, score):
         """Convert sentiment score to human-readable label"""
-        if score > 0.3:
+        if score > cls.POSITIVE_THRESHOLD:
             return "Positive"
-        elif score < -0.3:
+        elif score < cls.NEGATIVE_THRESHOLD:
             return "Negative"
         else:
             return "Neutral"
@@ -197,84 +908,302 @@ class StripeAPI:
 def get_song_recommendations(song, limit=10):
     """
     Get song recommendations based on a given song
-    Uses artist's top tracks as recommendations
+
+    Songs seen by `manage.py compute_song_neighbors` get their precomputed
+    most similar songs (one query). Newer songs get their artist's top
+    tracks: from the Artist table while its copy is fresh
+    (ARTIST_TOP_TRACKS_MAX_AGE), otherwise fetched from Deezer and saved
+    there. Deezer is only asked for the song's details when its artist id
+    isn't known yet.
+    """
+    recommendations = neighbor_recommendations(song, limit)
+    if recommendations is not None:
+        return recommendations
+
+    recommendations = local_song_recommendations(song, limit)
+    if recommendations is not None:
+        return recommendations
+
+    if not song.deezer_artist_id:
+        song_data = DeezerAPI.get_song_details(song.deezer_id)
+        if not (song_data and 'artist' in song_data):
+            return []
+        remember_song_artist(song, song_data)
+        # Another of the artist's songs may already have fetched the list
+        recommendations = local_song_recommendations(song, limit)
+        if recommendations is not None:
+            return recommendations
+
+    artist_tracks = DeezerAPI.get_artist_top_tracks(song.deezer_artist_id, limit=limit)
+    return store_recommended_tracks(song, artist_tracks, limit)
+
+
+async def aget_song_recommendations(song, limit=10):
+    """Async version of get_song_recommendations for the ASGI views"""
+    recommendations = await sync_to_async(neighbor_recommendations)(song, limit)
+    if recommendations is not None:
+        return recommendations
+
+    recommendations = await sync_to_async(local_song_recommendations)(song, limit)
+    if recommendations is not None:
+        return recommendations
+
+    if not song.deezer_artist_id:
+        song_data = await AsyncDeezerAPI.get_song_details(song.deezer_id)
+        if not (song_data and 'artist' in song_data):
+            return []
+        await sync_to_async(remember_song_artist)(song, song_data)
+        recommendations = await sync_to_async(local_song_recommendations)(song, limit)
+        if recommendations is not None:
+            return recommendations
+
+    artist_tracks = await AsyncDeezerAPI.get_artist_top_tracks(song.deezer_artist_id, limit=limit)
+    return await sync_to_async(store_recommended_tracks)(song, artist_tracks, limit)
+
+
+def neighbor_recommendations(song, limit=10):
+    """
+    `song`'s most similar songs from the SongNeighbor table, in one query, or
+    None if compute_song_neighbors hasn't seen it (or found no neighbors)
     """
     from .models import Song
-    
-    # Try to get recommendations from the same artist
-    recommendations = []
-    
-    # Get song details from Deezer
-    song_data = DeezerAPI.get_song_details(song.deezer_id)
-    
-    if song_data and 'artist' in song_data:
-        artist_id = song_data['artist']['id']
-        artist_tracks = DeezerAPI.get_artist_top_tracks(artist_id, limit=limit)
-        
-        for track in artist_tracks:
-            # Skip the current song
-            if str(track['id']) == song.deezer_id:
-                continue
-            
-            # Get or create song in database
-            song_obj, created = Song.objects.get_or_create(
-                deezer_id=str(track['id']),
-                defaults={
-                    'title': track.get('title', ''),
-                    'artist': track.get('artist', {}).get('name', ''),
-                    'album': track.get('album', {}).get('title', ''),
-                    'link': track.get('link', ''),
-                    'preview': track.get('preview', ''),
-                    'cover': track.get('album', {}).get('cover_medium', ''),
-                }
-            )
-            
-            # Calculate sentiment if not already done
-            if song_obj.sentiment is None:
-                song_obj.sentiment = SentimentAnalyzer.analyze_song(
-                    song_obj.title,
-                    song_obj.artist
-                )
-                song_obj.save()
-            
-            recommendations.append(song_obj)
-            
-            if len(recommendations) >= limit:
-                break
-    
-    return recommendations
+
+    if song.neighbors_computed_at is None:
+        return None
+    songs = list(Song.objects.filter(neighbor_of__song=song).order_by('neighbor_of__rank')[:limit])
+    return songs or None
+
+
+def local_song_recommendations(song, limit=10):
+    """
+    Recommendations for `song` from its artist's cached top tracks, in two
+    queries, or None when the artist is unknown or the cache is stale.
+    """
+    from .models import Artist, Song
+
+    if not song.deezer_artist_id:
+        return None
+    artist = Artist.objects.filter(deezer_id=song.deezer_artist_id).first()
+    max_age = getattr(settings, 'ARTIST_TOP_TRACKS_MAX_AGE', 86400)
+    if artist is None or not artist.has_fresh_top_tracks(limit, max_age):
+        return None
+
+    deezer_ids = [deezer_id for deezer_id in artist.top_track_ids if deezer_id != song.deezer_id][:limit]
+    songs = Song.objects.in_bulk(deezer_ids, field_name='deezer_id')
+    return [songs[deezer_id] for deezer_id in deezer_ids if deezer_id in songs]
+
+
+def remember_song_artist(song, song_data):
+    """Save the Deezer artist and album ids from a track's details on `song`"""
+    from .models import Song
+
+    song.deezer_artist_id = song_data['artist']['id']
+    song.deezer_album_id = song_data.get('album', {}).get('id') or song.deezer_album_id
+    Song.objects.filter(pk=song.pk).update(
+        deezer_artist_id=song.deezer_artist_id, deezer_album_id=song.deezer_album_id,
+    )
+
+
+def store_recommended_tracks(song, artist_tracks, limit=10):
+    """
+    Save an artist's top tracks as songs, skipping `song` itself, and keep
+    the list on the Artist for the artist's other songs. Failed lookups
+    (no tracks) aren't kept.
+    """
+    from django.utils import timezone
+    from .models import Artist
+
+    tracks = [track for track in artist_tracks if str(track['id']) != song.deezer_id]
+    songs = ingest_deezer_tracks(tracks[:limit])
+
+    if artist_tracks and song.deezer_artist_id:
+        # One upsert, whether or not the artist has been seen before
+        Artist.objects.bulk_create(
+            [Artist(
+                deezer_id=song.deezer_artist_id,
+                name=artist_tracks[0].get('artist', {}).get('name', '') or song.artist,
+                top_track_ids=[str(track['id']) for track in artist_tracks],
+                top_tracks_limit=limit,
+                top_tracks_fetched_at=timezone.now(),
+            )],
+            update_conflicts=True,
+            unique_fields=['deezer_id'],
+            update_fields=['name', 'top_track_ids', 'top_tracks_limit', 'top_tracks_fetched_at', 'updated_at'],
+        )
+    return songs
+
+
+def has_preview_and_cover(track):
+    """Whether a Deezer track has the preview and cover the song cards need"""
+    return bool(track.get('preview', '') and track.get('album', {}).get('cover_medium', ''))
+
+
+def ingest_deezer_tracks(tracks, score=True, return_created=False):
+    """
+    Store a batch of Deezer track dicts as Song rows.
+
+    Uses one lookup for the batch's deezer_ids, one bulk insert for the new
+    songs and, when some existing songs are still unscored or lack their
+    Deezer artist id, one bulk update of those: at most three queries,
+    however many tracks there are. Existing songs are otherwise left as they
+    are. Returns the songs
+    in the order of `tracks` (duplicates dropped). With `return_created`,
+    also returns the set of deezer_ids that were newly created.
+    """
+    from django.utils import timezone
+    from .models import Song
+
+    tracks_by_id = {}
+    for track in tracks:
+        tracks_by_id.setdefault(str(track['id']), track)
+
+    if not tracks_by_id:
+        return ([], set()) if return_created else []
+
+    existing = Song.objects.in_bulk(list(tracks_by_id), field_name='deezer_id')
+
+    new_songs = []
+    for deezer_id, track in tracks_by_id.items():
+        if deezer_id in existing:
+            continue
+        new_songs.append(Song(
+            deezer_id=deezer_id,
+            title=track.get('title', ''),
+            artist=track.get('artist', {}).get('name', ''),
+            album=track.get('album', {}).get('title', ''),
+            link=track.get('link', ''),
+            preview=track.get('preview', ''),
+            cover=track.get('album', {}).get('cover_medium', ''),
+            deezer_artist_id=track.get('artist', {}).get('id'),
+            deezer_album_id=track.get('album', {}).get('id'),
+        ))
+
+    # Existing songs from before artist ids were stored get them now
+    changed = {}
+    for deezer_id, song in existing.items():
+        artist_id = tracks_by_id[deezer_id].get('artist', {}).get('id')
+        if song.deezer_artist_id is None and artist_id:
+            song.deezer_artist_id = artist_id
+            song.deezer_album_id = tracks_by_id[deezer_id].get('album', {}).get('id')
+            changed[song.pk] = song
+
+    unscored = []
+    if score:
+        unscored = [song for song in existing.values() if song.sentiment is None]
+        to_score = new_songs + unscored
+        scores = SentimentAnalyzer.analyze_batch([(song.title, song.artist) for song in to_score])
+        for song, sentiment in zip(to_score, scores):
+            song.sentiment = sentiment
+        changed.update((song.pk, song) for song in unscored)
+
+    if new_songs:
+        # Updating deezer_id to itself on conflict is a no-op that makes the
+        # database return primary keys for every row, including songs another
+        # request inserted after our lookup.
+        Song.objects.bulk_create(
+            new_songs,
+            update_conflicts=True,
+            unique_fields=['deezer_id'],
+            update_fields=['deezer_id'],
+        )
+        if any(song.pk is None for song in new_songs):
+            # Backends that can't return rows from a bulk insert
+            reloaded = Song.objects.in_bulk([song.deezer_id for song in new_songs], field_name='deezer_id')
+            new_songs = [reloaded[song.deezer_id] for song in new_songs]
+
+    if changed:
+        # bulk_update skips auto_now, and the mood pools watch updated_at
+        now = timezone.now()
+        for song in changed.values():
+            song.updated_at = now
+        Song.objects.bulk_update(
+            list(changed.values()), ['sentiment', 'deezer_artist_id', 'deezer_album_id', 'updated_at'],
+        )
+
+    songs_by_id = {**existing, **{song.deezer_id: song for song in new_songs}}
+    songs = [songs_by_id[deezer_id] for deezer_id in tracks_by_id]
+
+    if return_created:
+        return songs, {song.deezer_id for song in new_songs}
+    return songs
+
+
+# Checked in order: the first mood with a matching keyword wins
+MOOD_KEYWORDS = {
+    'happy': ['happy', 'joyful', 'excited', 'great', 'wonderful', 'amazing', 'fantastic', 'cheerful', 'delighted', 'glad'],
+    'sad': ['sad', 'depressed', 'down', 'unhappy', 'miserable', 'heartbroken', 'lonely', 'blue', 'melancholy', 'upset'],
+    'energetic': ['energetic', 'pumped', 'hyped', 'active', 'energized', 'powerful', 'dynamic', 'vigorous'],
+    'calm': ['calm', 'peaceful', 'relaxed', 'chill', 'tranquil', 'serene', 'mellow', 'zen', 'quiet'],
+    'romantic': ['romantic', 'love', 'loving', 'affectionate', 'tender', 'passionate', 'in love', 'smitten'],
+    'angry': ['angry', 'mad', 'furious', 'annoyed', 'irritated', 'frustrated', 'rage', 'pissed'],
+    'nostalgic': ['nostalgic', 'reminiscing', 'memories', 'remember', 'past', 'old times', 'throwback'],
+    'motivated': ['motivated', 'determined', 'focused', 'driven', 'ambitious', 'inspired', 'ready', 'pumped up'],
+}
+
+def _compile_mood_keywords(mood_keywords):
+    """
+    Build a keyword -> (priority, mood) map (a keyword listed under two moods
+    belongs to the first), plus the first words of multi-word keywords
+    mapped to their possible lengths in words
+    """
+    priorities = {}
+    phrases = {}
+    for rank, (mood, keywords) in enumerate(mood_keywords.items()):
+        for keyword in keywords:
+            priorities.setdefault(keyword, (rank, mood))
+            words = keyword.split()
+            if len(words) > 1:
+                phrases.setdefault(words[0], set()).add(len(words))
+    return priorities, {word: sorted(lengths) for word, lengths in phrases.items()}
+
+
+_MOOD_KEYWORD_PRIORITY, _MOOD_KEYWORD_PHRASES = _compile_mood_keywords(MOOD_KEYWORDS)
+_MOOD_KEYWORD_WORDS = frozenset(_MOOD_KEYWORD_PRIORITY).union(_MOOD_KEYWORD_PHRASES)
+_MOOD_WORD_RE = re.compile(r"\w+")
 
 
 def analyze_mood_text(text):
     """
     Analyze user's mood text input and detect the mood.
-    Uses TextBlob sentiment analysis and keyword matching.
+    Uses keyword matching, falling back to sentiment analysis.
+    Results are memoized by the lowercased, whitespace-collapsed text.
+    """
+    return _detect_mood(" ".join(text.lower().split()))
+
+
+def _match_mood_keywords(text):
+    """
+    The first mood (in MOOD_KEYWORDS order) with a keyword in the lowercased
+    text, or None. The text is split into words once and intersected with
+    the keyword table, so keywords only match whole words and the cost
+    doesn't grow with the number of keywords. Multi-word keywords are checked
+    only where one of their first words occurs.
     """
-    from textblob import TextBlob
+    words = _MOOD_WORD_RE.findall(text)
+    hits = _MOOD_KEYWORD_WORDS.intersection(words)
+    if not hits:
+        return None
 
-    text_lower = text.lower()
+    priorities = _MOOD_KEYWORD_PRIORITY
+    candidates = [priorities[word] for word in hits if word in priorities]
+    if not hits.isdisjoint(_MOOD_KEYWORD_PHRASES):
+        for i, word in enumerate(words):
+            for length in _MOOD_KEYWORD_PHRASES.get(word, ()):
+                priority = priorities.get(" ".join(words[i:i + length]))
+                if priority is not None:
+                    candidates.append(priority)
+    return min(candidates)[1] if candidates else None
 
+
+@functools.lru_cache(maxsize=4096)
+def _detect_mood(text):
     # Keyword-based mood detection
-    mood_keywords = {
-        'happy': ['happy', 'joyful', 'excited', 'great', 'wonderful', 'amazing', 'fantastic', 'cheerful', 'delighted', 'glad'],
-        'sad': ['sad', 'depressed', 'down', 'unhappy', 'miserable', 'heartbroken', 'lonely', 'blue', 'melancholy', 'upset'],
-        'energetic': ['energetic', 'pumped', 'hyped', 'active', 'energized', 'powerful', 'dynamic', 'vigorous'],
-        'calm': ['calm', 'peaceful', 'relaxed', 'chill', 'tranquil', 'serene', 'mellow', 'zen', 'quiet'],
-        'romantic': ['romantic', 'love', 'loving', 'affectionate', 'tender', 'passionate', 'in love', 'smitten'],
-        'angry': ['angry', 'mad', 'furious', 'annoyed', 'irritated', 'frustrated', 'rage', 'pissed'],
-        'nostalgic': ['nostalgic', 'reminiscing', 'memories', 'remember', 'past', 'old times', 'throwback'],
-        'motivated': ['motivated', 'determined', 'focused', 'driven', 'ambitious', 'inspired', 'ready', 'pumped up'],
-    }
-
-    # Check for keyword matches
-    for mood, keywords in mood_keywords.items():
-        for keyword in keywords:
-            if keyword in text_lower:
-                return mood
+    mood = _match_mood_keywords(text)
+    if mood is not None:
+        return mood
 
     # If no keyword match, use sentiment analysis
-    blob = TextBlob(text)
-    sentiment = blob.sentiment.polarity
+    sentiment = SentimentAnalyzer.analyze_text(text)
 
     # Map sentiment to mood
     if sentiment > 0.5:
@@ -291,35 +1220,438 @@ def analyze_mood_text(text):
         return 'angry'
 
 
+# Pivots per sample, and rows read from the rank index at each one for every
+# song picked there
+SAMPLE_PIVOTS = 4
+SAMPLE_WINDOW_FACTOR = 4
+
+
+def sample_songs_by_sentiment(min_sentiment, max_sentiment, limit=20):
+    """
+    Take a random sample of scored songs with sentiment in the given range.
+
+    Every song carries a `random_rank` drawn from U(0, 1). Instead of
+    ORDER BY RANDOM() (which scores and sorts every matching row), the sample
+    is drawn from up to SAMPLE_PIVOTS windows: each takes the ids of the next
+    few matching songs at or after a random pivot on the (random_rank,
+    sentiment) index, wrapping around to 0, and picks a random share of them.
+    The windows only read the index, and the picked songs are then loaded in
+    one query, so a call is a handful of queries and never writes.
+
+    Each window row read skips about 1/selectivity index entries that fall
+    outside the sentiment range, so the cost stays flat as the catalog grows
+    with the same mix of sentiments, but a narrow range costs more per row.
+
+    A window lands on a song with probability equal to the rank span of the
+    window ending at it, which is only uniform on average over the ranks;
+    shuffle_random_ranks re-draws the ranks offline so no song keeps its
+    odds. Ranges holding fewer songs than a window come back whole.
+    """
+    from .models import Song
+
+    if limit <= 0:
+        return []
+
+    base = Song.objects.filter(
+        sentiment__gte=min_sentiment,
+        sentiment__lte=max_sentiment,
+    ).order_by('random_rank').values_list('pk', flat=True)
+
+    pivots = min(SAMPLE_PIVOTS, limit)
+    per_window = math.ceil(limit / pivots)
+    window_size = SAMPLE_WINDOW_FACTOR * per_window
+
+    picked = {}
+    seen = {}
+    for _ in range(pivots):
+        pivot = random.random()
+        window = list(base.filter(random_rank__gte=pivot)[:window_size])
+        if len(window) < window_size:
+            window += base.filter(random_rank__lt=pivot)[:window_size - len(window)]
+        if not window:
+            # Nothing in range at all
+            return []
+        seen.update(dict.fromkeys(window))
+        fresh = [pk for pk in window if pk not in picked]
+        picked.update(dict.fromkeys(random.sample(fresh, min(per_window, len(fresh), limit - len(picked)))))
+        if len(window) < window_size or len(picked) == limit:
+            # A short window wrapped around the whole range
+            break
+
+    if len(picked) < limit:
+        # Windows overlapped; top up from everything they read
+        rest = [pk for pk in seen if pk not in picked]
+        picked.update(dict.fromkeys(random.sample(rest, min(limit - len(picked), len(rest)))))
+
+    result = list(Song.objects.filter(pk__in=picked))
+    random.shuffle(result)
+    return result
+
+
+MOOD_SENTIMENT_MAP = {
+    'happy': (0.3, 1.0),        # Positive songs
+    'sad': (-1.0, -0.2),        # Negative songs
+    'energetic': (0.4, 1.0),    # Very positive songs
+    'calm': (-0.1, 0.3),        # Neutral to slightly positive
+    'romantic': (0.2, 0.7),     # Moderately positive
+    'angry': (-1.0, -0.3),      # Negative songs
+    'nostalgic': (-0.2, 0.2),   # Neutral songs
+    'motivated': (0.5, 1.0),    # Very positive songs
+}
+
+
+class MoodCandidatePools:
+    """
+    Per-process pools of song ids for each mood in MOOD_SENTIMENT_MAP.
+
+    The pools are loaded once and then kept up to date incrementally: each
+    refresh only reads songs whose `updated_at` is at or after the last
+    watermark. A mood whose pool reaches `max_size` switches to reservoir
+    sampling, so every matching song still has an equal chance of being in
+    the pool. Deleted songs are dropped lazily, when a sample turns out to
+    reference a row that no longer exists.
+    """
+
+    # Re-read a little before the watermark so rows from transactions that
+    # committed late are not missed. Rows already applied are remembered by
+    # (id, updated_at) for as long as they are inside the overlap and skipped
+    # when read again, so the reservoir doesn't count them twice.
+    WATERMARK_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, max_size=None, refresh_interval=None):
+        self._max_size = max_size
+        self._refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self.reset()
+
+    @property
+    def max_size(self):
+        if self._max_size is not None:
+            return self._max_size
+        return getattr(settings, 'MOOD_POOL_MAX_SIZE', 50000)
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, 'MOOD_POOL_REFRESH_SECONDS', 30)
+
+    def reset(self):
+        """Drop all pools; the next sample triggers a full load"""
+        with self._lock:
+            self._ids = {mood: array('q') for mood in MOOD_SENTIMENT_MAP}
+            self._positions = {mood: {} for mood in MOOD_SENTIMENT_MAP}
+            self._seen = {mood: 0 for mood in MOOD_SENTIMENT_MAP}
+            self._watermark = None
+            self._applied = {}
+            self._last_refresh = None
+            self._refresh_count = 0
+            self._rows_applied = 0
+
+    def _add(self, mood, song_id):
+        positions = self._positions[mood]
+        if song_id in positions:
+            return
+        ids = self._ids[mood]
+        self._seen[mood] += 1
+        if len(ids) < self.max_size:
+            positions[song_id] = len(ids)
+            ids.append(song_id)
+            return
+        # Reservoir sampling (Algorithm R)
+        slot = random.randrange(self._seen[mood])
+        if slot < len(ids):
+            del positions[ids[slot]]
+            ids[slot] = song_id
+            positions[song_id] = slot
+
+    def _discard(self, mood, song_id):
+        positions = self._positions[mood]
+        slot = positions.pop(song_id, None)
+        if slot is None:
+            return
+        ids = self._ids[mood]
+        last = ids.pop()
+        if last != song_id:
+            ids[slot] = last
+            positions[last] = slot
+
+    def discard(self, song_id):
+        """Remove a song from every pool"""
+        with self._lock:
+            for mood in self._ids:
+                self._discard(mood, song_id)
+
+    def refresh(self):
+        """Apply every song changed since the last watermark"""
+        from .models import Song
+
+        with self._lock:
+            songs = Song.objects.order_by('updated_at').values_list('id', 'sentiment', 'updated_at')
+            if self._watermark is None:
+                songs = songs.filter(sentiment__isnull=False)
+            else:
+                songs = songs.filter(updated_at__gte=self._watermark - self.WATERMARK_OVERLAP)
+
+            watermark = self._watermark
+            applied = self._applied
+            prune_at = max(10000, 2 * len(applied))
+            for song_id, sentiment, updated_at in songs.iterator(chunk_size=5000):
+                if applied.get(song_id) == updated_at:
+                    continue
+                for mood, (min_sentiment, max_sentiment) in MOOD_SENTIMENT_MAP.items():
+                    if sentiment is not None and min_sentiment <= sentiment <= max_sentiment:
+                        self._add(mood, song_id)
+                    else:
+                        self._discard(mood, song_id)
+                if watermark is None or updated_at > watermark:
+                    watermark = updated_at
+                applied[song_id] = updated_at
+                self._rows_applied += 1
+                if len(applied) > prune_at:
+                    # Rows come in updated_at order; keep the full load from
+                    # remembering the whole table
+                    applied = self._overlapping(applied, watermark)
+                    prune_at = max(10000, 2 * len(applied))
+
+            self._applied = self._overlapping(applied, watermark)
+            self._watermark = watermark
+            self._last_refresh = time.monotonic()
+            self._refresh_count += 1
+
+    def _overlapping(self, applied, watermark):
+        """The entries of `applied` that the next refresh will read again"""
+        if watermark is None:
+            return {}
+        cutoff = watermark - self.WATERMARK_OVERLAP
+        return {song_id: updated_at for song_id, updated_at in applied.items() if updated_at >= cutoff}
+
+    def is_stale(self):
+        return (
+            self._last_refresh is None
+            or time.monotonic() - self._last_refresh >= self.refresh_interval
+        )
+
+    def sample(self, mood, limit):
+        """Return up to `limit` random song ids for a mood"""
+        with self._lock:
+            if self.is_stale():
+                self.refresh()
+            ids = self._ids[mood]
+            return random.sample(ids, min(limit, len(ids)))
+
+    def stats(self):
+        """Pool sizes and staleness, for monitoring"""
+        with self._lock:
+            age = None
+            if self._last_refresh is not None:
+                age = round(time.monotonic() - self._last_refresh, 3)
+            return {
+                'moods': {
+                    mood: {
+                        'size': len(ids),
+                        'seen': self._seen[mood],
+                        'capped': self._seen[mood] > len(ids),
+                    }
+                    for mood, ids in self._ids.items()
+                },
+                'max_size': self.max_size,
+                'watermark': self._watermark.isoformat() if self._watermark else None,
+                'seconds_since_refresh': age,
+                'refresh_interval': self.refresh_interval,
+                'refresh_count': self._refresh_count,
+                'rows_applied': self._rows_applied,
+            }
+
+
+mood_pools = MoodCandidatePools()
+
+
+class MoodScorer:
+    """
+    Soft mood matching over every scored song at once (MOOD_MATCHING='soft').
+
+    A song's weight for a mood falls off with its distance from the middle of
+    the mood's MOOD_SENTIMENT_MAP range, as a Gaussian whose width is
+    MOOD_MATCH_SOFTNESS times half the range: songs near the middle are the
+    likeliest picks, songs just outside the range still get a chance, and
+    songs more than MAX_DISTANCE widths away get none. Picks are a weighted
+    random sample without replacement, drawn in one vectorized pass as the
+    top `limit` of log-weight plus Gumbel noise (argpartition), best first.
+
+    Sentiments come from the catalog snapshot when there is one; otherwise
+    from this process's own arrays (ids in id order), which are refreshed
+    from rows changed since the last watermark, like MoodCandidatePools.
+    Refreshes build new arrays, so a sample in progress keeps a consistent
+    view without holding the lock.
+    """
+
+    MAX_DISTANCE = 3.0
+    WATERMARK_OVERLAP = MoodCandidatePools.WATERMARK_OVERLAP
+
+    def __init__(self, refresh_interval=None):
+        self._refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng()
+        self.reset()
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, 'MOOD_POOL_REFRESH_SECONDS', 30)
+
+    @property
+    def softness(self):
+        return getattr(settings, 'MOOD_MATCH_SOFTNESS', 0.5)
+
+    def reset(self):
+        with self._lock:
+            self._ids = np.empty(0, dtype=np.int64)
+            # NaN for songs that are unscored or gone
+            self._sentiment = np.empty(0, dtype=np.float32)
+            self._watermark = None
+            self._applied = {}
+            self._last_refresh = None
+
+    def refresh(self):
+        """Apply every song changed since the last watermark"""
+        from .models import Song
+
+        with self._lock:
+            songs = Song.objects.order_by('updated_at').values_list('id', 'sentiment', 'updated_at')
+            if self._watermark is not None:
+                songs = songs.filter(updated_at__gte=self._watermark - self.WATERMARK_OVERLAP)
+            else:
+                songs = songs.filter(sentiment__isnull=False)
+
+            changed = {}
+            watermark = self._watermark
+            for song_id, sentiment, updated_at in songs.iterator(chunk_size=5000):
+                changed[song_id] = np.nan if sentiment is None else sentiment
+                if watermark is None or updated_at > watermark:
+                    watermark = updated_at
+
+            if changed:
+                ids = np.fromiter(changed.keys(), dtype=np.int64, count=len(changed))
+                sentiment = np.fromiter(changed.values(), dtype=np.float32, count=len(changed))
+                positions = np.searchsorted(self._ids, ids)
+                known = positions < len(self._ids)
+                known[known] = self._ids[positions[known]] == ids[known]
+
+                new_sentiment = self._sentiment.copy()
+                new_sentiment[positions[known]] = sentiment[known]
+                new_ids = np.concatenate([self._ids, ids[~known]])
+                new_sentiment = np.concatenate([new_sentiment, sentiment[~known]])
+                if not known.all():
+                    order = np.argsort(new_ids, kind='stable')
+                    new_ids, new_sentiment = new_ids[order], new_sentiment[order]
+                self._ids, self._sentiment = new_ids, new_sentiment
+
+            self._watermark = watermark
+            self._last_refresh = time.monotonic()
+
+    def is_stale(self):
+        return (
+            self._last_refresh is None
+            or time.monotonic() - self._last_refresh >= self.refresh_interval
+        )
+
+    def discard(self, song_ids):
+        """Stop picking songs that turned out to be deleted"""
+        with self._lock:
+            positions = np.searchsorted(self._ids, song_ids)
+            positions = positions[positions < len(self._ids)]
+            sentiment = self._sentiment.copy()
+            sentiment[positions[np.isin(self._ids[positions], song_ids)]] = np.nan
+            self._sentiment = sentiment
+
+    def pick(self, sentiment, mood, limit):
+        """Positions in `sentiment` of up to `limit` songs picked for the mood, best match first"""
+        min_sentiment, max_sentiment = MOOD_SENTIMENT_MAP[mood]
+        width = max((max_sentiment - min_sentiment) / 2, 1e-6) * self.softness
+        # A float32 copy: twice the throughput of float64, and plenty for weights
+        distance = sentiment.astype(np.float32)
+        distance -= np.float32((min_sentiment + max_sentiment) / 2)
+        distance /= np.float32(width)
+        # Log of the Gaussian weight; NaN (unscored) never passes the cutoff
+        log_weight = np.square(distance, out=distance)
+        log_weight *= -0.5
+        candidates = np.flatnonzero(log_weight >= -0.5 * self.MAX_DISTANCE ** 2)
+        keys = log_weight[candidates]
+        if len(candidates) > limit:
+            # Gumbel noise as -log(Exp(1)): float32 draws are several times
+            # cheaper than rng.gumbel()
+            noise = self._rng.standard_exponential(len(candidates), dtype=np.float32)
+            with np.errstate(divide='ignore'):
+                np.log(noise, out=noise)
+            keys -= noise
+            top = np.argpartition(keys, -limit)[-limit:]
+            candidates, keys = candidates[top], keys[top]
+        return candidates[np.argsort(-keys, kind='stable')]
+
+    def recommend(self, mood, limit=20):
+        """Songs for a mood, from the catalog snapshot if there is one, else the database"""
+        from .models import Song
+
+        if limit <= 0:
+            return []
+        snapshot = catalog_snapshot.get()
+        if snapshot is not None:
+            return snapshot.songs(self.pick(snapshot.sentiment, mood, limit))
+
+        if self.is_stale():
+            self.refresh()
+        # A song can be deleted since the last refresh; drop it and retry once
+        for _ in range(2):
+            ids = self._ids[self.pick(self._sentiment, mood, limit)].tolist()
+            songs = Song.objects.in_bulk(ids)
+            missing = [song_id for song_id in ids if song_id not in songs]
+            if not missing:
+                break
+            self.discard(missing)
+        return [songs[song_id] for song_id in ids if song_id in songs]
+
+
+mood_scorer = MoodScorer()
+
+
 def get_mood_based_recommendations(mood, limit=20):
     """
     Get song recommendations based on user's mood.
-    Maps mood to sentiment range and returns matching songs from database.
+    Maps mood to sentiment range and returns matching songs from the catalog
+    snapshot when there is one (CATALOG_SNAPSHOT), else from the database.
     """
     from .models import Song
 
-    # Map moods to sentiment ranges
-    mood_sentiment_map = {
-        'happy': (0.3, 1.0),        # Positive songs
-        'sad': (-1.0, -0.2),        # Negative songs
-        'energetic': (0.4, 1.0),    # Very positive songs
-        'calm': (-0.1, 0.3),        # Neutral to slightly positive
-        'romantic': (0.2, 0.7),     # Moderately positive
-        'angry': (-1.0, -0.3),      # Negative songs
-        'nostalgic': (-0.2, 0.2),   # Neutral songs
-        'motivated': (0.5, 1.0),    # Very positive songs
-    }
-
     # Get sentiment range for the mood
-    sentiment_range = mood_sentiment_map.get(mood, (-1.0, 1.0))
-    min_sentiment, max_sentiment = sentiment_range
+    min_sentiment, max_sentiment = MOOD_SENTIMENT_MAP.get(mood, (-1.0, 1.0))
 
-    # Query songs within the sentiment range
-    songs = Song.objects.filter(
-        sentiment__gte=min_sentiment,
-        sentiment__lte=max_sentiment,
-        sentiment__isnull=False
-    ).order_by('?')[:limit]  # Random order
+    if mood in MOOD_SENTIMENT_MAP and getattr(settings, 'MOOD_MATCHING', 'range') == 'soft':
+        return mood_scorer.recommend(mood, limit)
+
+    snapshot = catalog_snapshot.get()
+    if snapshot is not None:
+        # No database round-trips; reflects the catalog as of the last export
+        return snapshot.songs(snapshot.sample(min_sentiment, max_sentiment, limit))
 
-    return list(songs)
+    if mood not in MOOD_SENTIMENT_MAP or not getattr(settings, 'MOOD_POOL_ENABLED', True):
+        # Random sample of songs within the sentiment range
+        return sample_songs_by_sentiment(min_sentiment, max_sentiment, limit=limit)
 
+    # Answer from the in-memory pool with a single id__in fetch. A pool can
+    # briefly reference deleted or re-scored songs; drop those and retry once.
+    for _ in range(2):
+        ids = mood_pools.sample(mood, limit)
+        songs = Song.objects.in_bulk(ids)
+        recommendations = []
+        for song_id in ids:
+            song = songs.get(song_id)
+            if song is None or song.sentiment is None or not (min_sentiment <= song.sentiment <= max_sentiment):
+                mood_pools.discard(song_id)
+                continue
+            recommendations.append(song)
+        if len(recommendations) == len(ids):
+            break
+
+    return recommendations
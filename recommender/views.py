@@ -1,29 +1,45 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.db.models import Q
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from rest_framework import viewsets, status
+from rest_framework import viewsets, status, exceptions
 from rest_framework.decorators import api_view, action
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.renderers import JSONRenderer
+from asgiref.sync import sync_to_async
+import hashlib
 import json
 import uuid
 import stripe
 from django.core.mail import send_mail
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
 
 from .models import Song, UserProfile, Subscription, Purchase
+from .entitlements import get_entitlement
+from .metering import usage_meter
+from .pagination import SongCursorPagination
+from .renderers import StreamingJSONRenderer
 from .serializers import (
     SongSerializer, UserProfileSerializer,
     SubscriptionSerializer, PurchaseSerializer, CheckoutSerializer
 )
-from .utils import DeezerAPI, SentimentAnalyzer, StripeAPI, get_song_recommendations, get_mood_based_recommendations
+from .utils import (
+    DeezerAPI, AsyncDeezerAPI, SentimentAnalyzer, StripeAPI, get_song_recommendations,
+    aget_song_recommendations, get_mood_based_recommendations, mood_pools,
+    has_preview_and_cover, ingest_deezer_tracks,
+)
 
 
 # Web Views
@@ -33,14 +49,15 @@ def home(request):
     if not request.user.is_authenticated:
         return render(request, 'recommender/home.html', {'show_auth': True})
 
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    entitlement = get_entitlement(request)
+    profile = entitlement.profile
 
     # Handle mood text input
     if request.method == 'POST':
         mood_text = request.POST.get('mood_text', '').strip()
         if mood_text:
             # Check if user can use the service
-            if not profile.can_use_service():
+            if not entitlement.can_use:
                 messages.error(
                     request,
                     f'You have reached your daily limit of {settings.FREE_USAGE_LIMIT} recommendations. '
@@ -61,8 +78,8 @@ def home(request):
 
     context = {
         'profile': profile,
-        'can_use': profile.can_use_service(),
-        'usage_count': profile.daily_usage_count,
+        'can_use': entitlement.can_use,
+        'usage_count': entitlement.usage_count,
         'free_limit': settings.FREE_USAGE_LIMIT,
     }
     return render(request, 'recommender/home.html', context)
@@ -176,7 +193,8 @@ def verify_email(request, token):
 @login_required
 def mood_recommendations(request):
     """Show song recommendations based on user's mood"""
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    entitlement = get_entitlement(request)
+    profile = entitlement.profile
 
     # Check if user has selected a mood
     if not profile.current_mood:
@@ -184,7 +202,7 @@ def mood_recommendations(request):
         return redirect('home')
 
     # Increment usage count
-    profile.increment_usage()
+    usage_meter.record(profile)
 
     # Get mood-based recommendations
     recommendations = get_mood_based_recommendations(profile.current_mood, limit=20)
@@ -205,13 +223,110 @@ def mood_recommendations(request):
         'mood_text': mood_text,
         'mood_display': dict(UserProfile.MOOD_CHOICES).get(profile.current_mood, profile.current_mood.title()),
         'recommendations': recommendations,
-        'usage_count': profile.daily_usage_count,
+        'usage_count': entitlement.usage_count,
         'free_limit': settings.FREE_USAGE_LIMIT,
-        'can_use': profile.can_use_service(),
+        'can_use': entitlement.can_use,
     }
     return render(request, 'recommender/mood_recommendations.html', context)
 
 
+def _use_search_quota(request, user=None):
+    """
+    Count one search against the user's daily quota.
+    Returns (entitlement, allowed); nothing is counted when the quota is used up.
+    """
+    entitlement = get_entitlement(request, user)
+    return entitlement, entitlement.use()
+
+
+def _store_search_results(results):
+    """
+    Store Deezer search results in the database. Unless SENTIMENT_SCORING is
+    'inline', new songs are saved unscored and picked up by the score_songs
+    worker, keeping sentiment analysis off the request path.
+    """
+    # Skip songs without preview or cover
+    tracks = [track for track in results if has_preview_and_cover(track)]
+    inline = getattr(settings, 'SENTIMENT_SCORING', 'queue') == 'inline'
+    return ingest_deezer_tracks(tracks, score=inline)
+
+
+def _search_stored_songs(query):
+    """Stored songs whose title, artist or album contains `query`"""
+    return Song.objects.filter(Q(title__icontains=query) | Q(artist__icontains=query) | Q(album__icontains=query))
+
+
+def _api_response(data, status=200):
+    """JSON response rendered exactly like DRF's Response, for the async API views"""
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _authenticate_api_request(request):
+    """
+    Run DRF's configured authenticators on a plain Django request, as an
+    APIView would, for the async API views; call through sync_to_async.
+    Returns (user, None), or (None, response) with the error DRF would
+    send when the credentials are rejected.
+    """
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    drf_request = Request(request, authenticators=authenticators)
+    try:
+        # Also sets request.user
+        return drf_request.user, None
+    except exceptions.AuthenticationFailed as exc:
+        auth_header = authenticators[0].authenticate_header(drf_request) if authenticators else None
+        response = _api_response({'detail': exc.detail}, status=401 if auth_header else 403)
+        if auth_header:
+            response['WWW-Authenticate'] = auth_header
+        return None, response
+
+
+# Part of every song ETag; bump it when SongSerializer's output changes so
+# clients don't keep copies in the old format
+SONG_ETAG_VERSION = 1
+
+
+def _conditional_songs_response(request, songs, max_age, render, media_type='json', with_last_modified=True):
+    """
+    Serve an API response made only of `songs`, with an ETag and
+    Last-Modified derived from their ids and updated_at. A client (or
+    cache) whose If-None-Match or If-Modified-Since shows it already has
+    them gets a 304 and `render` isn't called, so nothing is serialized.
+    `media_type` is the negotiated format, as the same songs give different
+    bodies in each.
+
+    Pass `with_last_modified=False` when which songs make up the response
+    can change without any of them being updated (recommendations): a new
+    set of older songs would look unmodified, so only the ETag is used.
+    """
+    versions = ';'.join(f'{song.pk}:{song.updated_at and song.updated_at.isoformat()}' for song in songs)
+    digest = hashlib.md5(f'{SONG_ETAG_VERSION}:{media_type}:{versions}'.encode(), usedforsecurity=False)
+    etag = quote_etag(digest.hexdigest())
+    updated = [song.updated_at for song in songs if song.updated_at]
+    last_modified = int(max(updated).timestamp()) if updated and with_last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+    if response.status_code in (200, 304):
+        response.headers['ETag'] = etag
+        if last_modified:
+            response.headers['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True, max_age=max_age)
+        patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def _streaming_api_response(data, status=200, is_async=False):
+    """
+    JSON response written as it's rendered, see StreamingJSONRenderer. With
+    `is_async` the iterators in `data` are async ones.
+    """
+    renderer = StreamingJSONRenderer()
+    content = renderer.astream(data) if is_async else renderer.stream(data)
+    return StreamingHttpResponse(content, content_type='application/json', status=status)
+
+
 @login_required
 def search_songs(request):
     """Search songs and display results"""
@@ -221,13 +336,11 @@ def search_songs(request):
         messages.warning(request, 'Please enter a search query.')
         return redirect('home')
 
-    # Get or create user profile
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
-
-    # Check if user can use the service
-    free_limit = getattr(settings, 'FREE_USAGE_LIMIT', 10)
+    # Check if user can use the service and count this search
+    entitlement, allowed = _use_search_quota(request)
+    free_limit = entitlement.free_limit
 
-    if not profile.can_use_service(free_limit):
+    if not allowed:
         messages.error(
             request,
             f'You have reached your daily limit of {free_limit} searches. '
@@ -235,51 +348,59 @@ def search_songs(request):
         )
         return redirect('subscribe')
 
-    # Increment usage
-    profile.increment_usage()
-
     # Search songs via Deezer API
     results = DeezerAPI.search_songs(query)
 
     # Store songs in database and calculate sentiment
-    songs = []
-    for track in results:
-        preview = track.get('preview', '')
-        cover = track.get('album', {}).get('cover_medium', '')
-        # Skip songs without preview or cover
-        if not preview or not cover:
-            continue
-
-        song, created = Song.objects.get_or_create(
-            deezer_id=str(track['id']),
-            defaults={
-                'title': track.get('title', ''),
-                'artist': track.get('artist', {}).get('name', ''),
-                'album': track.get('album', {}).get('title', ''),
-                'link': track.get('link', ''),
-                'preview': preview,
-                'cover': cover,
-            }
-        )
-
-        # Calculate sentiment if not already done
-        if song.sentiment is None:
-            song.sentiment = SentimentAnalyzer.analyze_song(song.title, song.artist)
-            song.save()
-
-        songs.append(song)
+    songs = _store_search_results(results)
 
     context = {
         'query': query, 
         'songs': songs,
-        'usage_count': profile.daily_usage_count,
+        'usage_count': entitlement.usage_count,
         'usage_limit': free_limit,
-        'has_subscription': profile.has_active_subscription(),
+        'has_subscription': entitlement.has_subscription,
     }
 
     return render(request, 'recommender/search_results.html', context)
 
 
+@login_required
+async def search_songs_async(request):
+    """Async version of search_songs, served on the ASGI entry point"""
+    query = request.GET.get('q', '')
+
+    if not query:
+        messages.warning(request, 'Please enter a search query.')
+        return redirect('home')
+
+    user = await request.auser()
+    entitlement, allowed = await sync_to_async(_use_search_quota)(request, user)
+    free_limit = entitlement.free_limit
+
+    if not allowed:
+        messages.error(
+            request,
+            f'You have reached your daily limit of {free_limit} searches. '
+            'Please subscribe for unlimited access.'
+        )
+        return redirect('subscribe')
+
+    results = await AsyncDeezerAPI.search_songs(query)
+    songs = await sync_to_async(_store_search_results)(results)
+
+    context = {
+        'query': query,
+        'songs': songs,
+        'usage_count': entitlement.usage_count,
+        'usage_limit': free_limit,
+        'has_subscription': entitlement.has_subscription,
+    }
+
+    # Template context processors touch request.user, which is sync-only
+    return await sync_to_async(render)(request, 'recommender/search_results.html', context)
+
+
 @login_required
 def song_detail(request, deezer_id):
     """Display song details and recommendations"""
@@ -300,6 +421,22 @@ def song_detail(request, deezer_id):
     return render(request, 'recommender/song_detail.html', context)
 
 
+@login_required
+async def song_detail_async(request, deezer_id):
+    """Async version of song_detail, served on the ASGI entry point"""
+    song = await aget_object_or_404(Song, deezer_id=deezer_id)
+
+    recommendations = await aget_song_recommendations(song, limit=10)
+
+    context = {
+        'song': song,
+        'recommendations': recommendations,
+        'sentiment_label': SentimentAnalyzer.get_sentiment_label(song.sentiment or 0),
+    }
+
+    return await sync_to_async(render)(request, 'recommender/song_detail.html', context)
+
+
 @login_required
 def subscribe(request, plan_type=None):
     """Display subscription plans"""
@@ -307,7 +444,7 @@ def subscribe(request, plan_type=None):
     yearly_price = getattr(settings, 'YEARLY_PLAN_PRICE', 100)
 
     # Get user's active subscription if any
-    profile = UserProfile.objects.get_or_create(user=request.user)[0]
+    entitlement = get_entitlement(request)
     active_subscription = request.user.subscriptions.filter(active=True).first()
 
     # If plan_type is provided, redirect to checkout
@@ -318,7 +455,7 @@ def subscribe(request, plan_type=None):
         'monthly_price': monthly_price,
         'yearly_price': yearly_price,
         'active_subscription': active_subscription,
-        'has_subscription': profile.has_active_subscription(),
+        'has_subscription': entitlement.has_subscription,
     }
 
     return render(request, 'recommender/subscribe.html', context)
@@ -608,64 +745,123 @@ def api_search_songs(request):
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    # Get or create user profile
-    profile, created = UserProfile.objects.get_or_create(user=request.user)
+    try:
+        paginator = SongCursorPagination(request)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Check if user can use the service
-    free_limit = getattr(settings, 'FREE_USAGE_LIMIT', 10)
+    # Check if user can use the service and count this search
+    entitlement, allowed = _use_search_quota(request)
+    free_limit = entitlement.free_limit
 
-    if not profile.can_use_service(free_limit):
+    if not allowed:
         return Response(
             {
                 'error': f'Daily limit of {free_limit} searches reached. Please subscribe.',
-                'usage_count': profile.daily_usage_count,
+                'usage_count': entitlement.usage_count,
                 'limit': free_limit,
             },
             status=status.HTTP_429_TOO_MANY_REQUESTS
         )
 
-    # Increment usage
-    profile.increment_usage()
+    # With a cursor, page through the stored songs matching the query,
+    # streaming the rows out as they're read
+    if paginator.cursor_query_param in request.GET:
+        songs = SongSerializer(many=True)
+        return _streaming_api_response({
+            'query': query,
+            'usage_count': entitlement.usage_count,
+            'usage_limit': free_limit,
+            'has_subscription': entitlement.has_subscription,
+            'results': map(songs.represent, paginator.rows(_search_stored_songs(query))),
+            'next': paginator.get_next_link,
+        })
 
     # Search songs via Deezer API
     results = DeezerAPI.search_songs(query)
 
     # Store songs in database and calculate sentiment
-    songs = []
-    for track in results:
-        preview = track.get('preview', '')
-        cover = track.get('album', {}).get('cover_medium', '')
-        # Skip songs without preview or cover
-        if not preview or not cover:
-            continue
-
-        song, created = Song.objects.get_or_create(
-            deezer_id=str(track['id']),
-            defaults={
-                'title': track.get('title', ''),
-                'artist': track.get('artist', {}).get('name', ''),
-                'album': track.get('album', {}).get('title', ''),
-                'link': track.get('link', ''),
-                'preview': preview,
-                'cover': cover,
-            }
-        )
-
-        # Calculate sentiment if not already done
-        if song.sentiment is None:
-            song.sentiment = SentimentAnalyzer.analyze_song(song.title, song.artist)
-            song.save()
-
-        songs.append(song)
+    songs = _store_search_results(results)
 
     serializer = SongSerializer(songs, many=True)
 
     return Response({
         'query': query,
         'results': serializer.data,
-        'usage_count': profile.daily_usage_count,
+        'usage_count': entitlement.usage_count,
+        'usage_limit': free_limit,
+        'has_subscription': entitlement.has_subscription,
+        'next': paginator.get_first_link(),
+    })
+
+
+async def api_search_songs_async(request):
+    """
+    Async version of api_search_songs, served on the ASGI entry point.
+    DRF views are sync-only, so this is a plain Django view that runs
+    DRF's authenticators itself.
+    """
+    if request.method != 'GET':
+        return _api_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    user, error = await sync_to_async(_authenticate_api_request)(request)
+    if error is not None:
+        return error
+    if not user.is_authenticated:
+        return _api_response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    query = request.GET.get('q', '')
+
+    if not query:
+        return _api_response(
+            {'error': 'Query parameter "q" is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        paginator = SongCursorPagination(request)
+    except ValueError as e:
+        return _api_response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    entitlement, allowed = await sync_to_async(_use_search_quota)(request, user)
+    free_limit = entitlement.free_limit
+
+    if not allowed:
+        return _api_response(
+            {
+                'error': f'Daily limit of {free_limit} searches reached. Please subscribe.',
+                'usage_count': entitlement.usage_count,
+                'limit': free_limit,
+            },
+            status=status.HTTP_429_TOO_MANY_REQUESTS
+        )
+
+    if paginator.cursor_query_param in request.GET:
+        songs = SongSerializer(many=True)
+
+        async def rows():
+            async for song in paginator.arows(_search_stored_songs(query)):
+                yield songs.represent(song)
+
+        return _streaming_api_response({
+            'query': query,
+            'usage_count': entitlement.usage_count,
+            'usage_limit': free_limit,
+            'has_subscription': entitlement.has_subscription,
+            'results': rows(),
+            'next': paginator.get_next_link,
+        }, is_async=True)
+
+    results = await AsyncDeezerAPI.search_songs(query)
+    songs = await sync_to_async(_store_search_results)(results)
+
+    return _api_response({
+        'query': query,
+        'results': SongSerializer(songs, many=True).data,
+        'usage_count': entitlement.usage_count,
         'usage_limit': free_limit,
-        'has_subscription': profile.has_active_subscription(),
+        'has_subscription': entitlement.has_subscription,
+        'next': paginator.get_first_link(),
     })
 
 
@@ -680,8 +876,11 @@ def api_song_detail(request, deezer_id):
             status=status.HTTP_404_NOT_FOUND
         )
 
-    serializer = SongSerializer(song)
-    return Response(serializer.data)
+    return _conditional_songs_response(
+        request, [song], settings.SONG_API_MAX_AGE,
+        lambda: Response(SongSerializer(song).data),
+        media_type=request.accepted_renderer.format,
+    )
 
 
 @api_view(['GET'])
@@ -696,12 +895,58 @@ def api_recommend(request, deezer_id):
         )
 
     recommendations = get_song_recommendations(song, limit=10)
-    serializer = SongSerializer(recommendations, many=True)
 
-    return Response({
-        'song': SongSerializer(song).data,
-        'recommendations': serializer.data,
-    })
+    # The ETag covers the song and the recommended set, in order
+    return _conditional_songs_response(
+        request, [song, *recommendations], settings.RECOMMEND_API_MAX_AGE,
+        lambda: Response({
+            'song': SongSerializer(song).data,
+            'recommendations': SongSerializer(recommendations, many=True).data,
+        }),
+        media_type=request.accepted_renderer.format, with_last_modified=False,
+    )
+
+
+async def api_recommend_async(request, deezer_id):
+    """Async version of api_recommend, served on the ASGI entry point"""
+    if request.method != 'GET':
+        return _api_response({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+
+    # Bad credentials are rejected even though the endpoint is public
+    _user, error = await sync_to_async(_authenticate_api_request)(request)
+    if error is not None:
+        return error
+
+    try:
+        song = await Song.objects.aget(deezer_id=deezer_id)
+    except Song.DoesNotExist:
+        return _api_response(
+            {'error': 'Song not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    recommendations = await aget_song_recommendations(song, limit=10)
+
+    return _conditional_songs_response(
+        request, [song, *recommendations], settings.RECOMMEND_API_MAX_AGE,
+        lambda: _api_response({
+            'song': SongSerializer(song).data,
+            'recommendations': SongSerializer(recommendations, many=True).data,
+        }),
+        with_last_modified=False,
+    )
+
+
+@api_view(['GET'])
+def api_mood_pool_stats(request):
+    """API endpoint exposing this worker's mood pool sizes and staleness"""
+    if not request.user.is_staff:
+        return Response(
+            {'error': 'Staff access required'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    return Response(mood_pools.stats())
 
 
 @api_view(['POST'])
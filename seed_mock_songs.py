@@ -104,16 +104,18 @@ for song_data in mock_songs:
         print(f"  ❌ Error fetching from Deezer: {e}")
         song_data['cover'] = f"https://placehold.co/400x400/333333/FFFFFF?text={song_data['title']}"
 
-    # Calculate sentiment
-    sentiment = analyzer.analyze_song(song_data['title'], song_data['artist'])
+# Calculate sentiment for the whole catalog in one batch
+sentiments = analyzer.analyze_batch([(song_data['title'], song_data['artist']) for song_data in mock_songs])
+
+for song_data, sentiment in zip(mock_songs, sentiments):
     song_data['sentiment'] = sentiment
-    
+
     # Create or update song
     song, created = Song.objects.update_or_create(
         deezer_id=song_data['deezer_id'],
         defaults=song_data
     )
-    
+
     if created:
         created_count += 1
     else:
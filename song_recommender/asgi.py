@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'song_recommender.settings')
+# Under ASGI, search, song detail and recommendation views run natively async
+# so one process can overlap many in-flight Deezer calls.
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
@@ -81,7 +81,7 @@ WSGI_APPLICATION = 'song_recommender.wsgi.application'
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
     }
 }
 
@@ -140,6 +140,91 @@ FREE_USAGE_LIMIT = int(os.getenv('FREE_USAGE_LIMIT', '10'))
 MONTHLY_PLAN_PRICE = int(os.getenv('MONTHLY_PLAN_PRICE', '20'))
 YEARLY_PLAN_PRICE = int(os.getenv('YEARLY_PLAN_PRICE', '100'))
 
+# Recommendation Engine
+# Each worker keeps per-mood pools of song ids in memory (see recommender.utils.MoodCandidatePools)
+MOOD_POOL_ENABLED = os.getenv('MOOD_POOL_ENABLED', 'True') == 'True'
+MOOD_POOL_MAX_SIZE = int(os.getenv('MOOD_POOL_MAX_SIZE', '50000'))
+MOOD_POOL_REFRESH_SECONDS = int(os.getenv('MOOD_POOL_REFRESH_SECONDS', '30'))
+# 'range': a uniform sample of the songs inside the mood's sentiment range
+# 'soft': every song weighted by its distance from the middle of the range, best
+#         matches first (see recommender.utils.MoodScorer); MOOD_MATCH_SOFTNESS
+#         scales how far outside the range picks can reach
+MOOD_MATCHING = os.getenv('MOOD_MATCHING', 'range')
+MOOD_MATCH_SOFTNESS = float(os.getenv('MOOD_MATCH_SOFTNESS', '0.5'))
+
+# Serve mood recommendations from a memory-mapped snapshot of the scored catalog
+# (see recommender.catalog_snapshot), written by `manage.py export_catalog_snapshot`;
+# the pools and the database are used while it's disabled or missing
+CATALOG_SNAPSHOT = {
+    'ENABLED': os.getenv('CATALOG_SNAPSHOT_ENABLED', 'False') == 'True',
+    'PATH': os.getenv('CATALOG_SNAPSHOT_PATH', str(BASE_DIR / 'catalog.snapshot')),
+    'CHECK_SECONDS': float(os.getenv('CATALOG_SNAPSHOT_CHECK_SECONDS', '30')),
+}
+
+# Serve the Deezer-backed views with their async versions (set by asgi.py)
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
+
+# Deezer API client
+DEEZER_API_URL = os.getenv('DEEZER_API_URL', 'https://api.deezer.com')
+DEEZER_HTTP = {
+    'POOL_SIZE': int(os.getenv('DEEZER_HTTP_POOL_SIZE', '20')),
+    'CONNECT_TIMEOUT': float(os.getenv('DEEZER_CONNECT_TIMEOUT', '3.05')),
+    'READ_TIMEOUT': float(os.getenv('DEEZER_READ_TIMEOUT', '10')),
+    'MAX_RETRIES': int(os.getenv('DEEZER_MAX_RETRIES', '3')),
+    'BACKOFF_FACTOR': 0.3,  # sleeps 0.3s, 0.6s, 1.2s, ... between retries
+    'BACKOFF_MAX': 5,       # upper bound for any single sleep, including Retry-After
+}
+
+# Sentiment scoring (see recommender.utils.SentimentAnalyzer.analyze_batch)
+# 'lexicon': precompiled TextBlob lexicon (recommender/data/sentiment_lexicon.json), same scores, much faster
+# 'textblob': TextBlob itself
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'lexicon')
+# 'queue': songs found by search are saved unscored and scored by `manage.py score_songs`
+# 'inline': score them during the request
+SENTIMENT_SCORING = os.getenv('SENTIMENT_SCORING', 'queue')
+SENTIMENT_MEMO_SIZE = int(os.getenv('SENTIMENT_MEMO_SIZE', '100000'))
+SENTIMENT_POOL_THRESHOLD = int(os.getenv('SENTIMENT_POOL_THRESHOLD', '2000'))
+SENTIMENT_POOL_PROCESSES = int(os.getenv('SENTIMENT_POOL_PROCESSES', '0')) or None  # None: one per CPU
+
+# Usage metering for the free tier (see recommender.metering.UsageMeter)
+# 'db': write every use to the database
+# 'local': count in memory and write in batches; may overshoot FREE_USAGE_LIMIT by
+#          up to (worker processes - 1) * (MAX_PENDING - 1) uses per user per day
+USAGE_METERING = {
+    'BACKEND': os.getenv('USAGE_METERING_BACKEND', 'db'),
+    'FLUSH_INTERVAL': float(os.getenv('USAGE_METERING_FLUSH_INTERVAL', '5')),
+    'MAX_PENDING': int(os.getenv('USAGE_METERING_MAX_PENDING', '5')),
+}
+
+# Deezer API response cache (see recommender.utils.DeezerCache)
+DEEZER_CACHE = {
+    'BACKEND': os.getenv('DEEZER_CACHE_BACKEND', 'locmem'),  # 'locmem', 'django' or 'none'
+    'MAX_ENTRIES': int(os.getenv('DEEZER_CACHE_MAX_ENTRIES', '2048')),
+    'CACHE_ALIAS': 'default',
+    'TIMEOUTS': {
+        'search': 300,
+        'track': 3600,
+        'artist_top': 1800,
+    },
+}
+
+# How long an artist's saved top tracks serve song recommendations before
+# they are fetched from Deezer again (seconds)
+ARTIST_TOP_TRACKS_MAX_AGE = int(os.getenv('ARTIST_TOP_TRACKS_MAX_AGE', '86400'))
+
+# Record Deezer responses to a tape file, or replay them from one with no
+# network (see recommender.deezer_tape): 'off', 'record' or 'replay'
+DEEZER_TAPE = {
+    'MODE': os.getenv('DEEZER_TAPE_MODE', 'off'),
+    'PATH': os.getenv('DEEZER_TAPE_PATH', str(BASE_DIR / 'deezer.tape')),
+}
+
+# How long clients and shared caches (a reverse proxy, a CDN) may reuse
+# /api/song/ and /api/recommend/ responses before revalidating them with
+# their ETag or Last-Modified (seconds)
+SONG_API_MAX_AGE = int(os.getenv('SONG_API_MAX_AGE', '300'))
+RECOMMEND_API_MAX_AGE = int(os.getenv('RECOMMEND_API_MAX_AGE', '60'))
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'song_recommender.settings')
 
 application = get_wsgi_application()
+
+# Map the catalog snapshot (if enabled) before gunicorn forks its workers
+# with --preload, so they start with it instead of each mapping it on first use
+from recommender.catalog_snapshot import catalog_snapshot  # noqa: E402
+
+catalog_snapshot.get()